@@ -0,0 +1,151 @@
+"""
+    Backfill historical seasons of the season-aware tables. Every
+    season is written under its own prefix in the bucket, game log
+    tables are split into date chunks, and the chunks run through
+    the same job runner as main.py so the per-host and per-source
+    limits hold. Finished chunks are recorded in a checkpoint, so a
+    rerun after an interruption only does what is left
+
+    usage: python backfill.py 2015 2017 [--tables fg_batters_daily dfs]
+"""
+import os
+import json
+import logging
+import argparse
+import threading
+
+from main import fangraphs_jobs, rotoguru_jobs, statcast_jobs
+from util.config import get_config
+from util.jobs import Job, run_jobs
+from util.metrics import shared_metrics, record_jobs, write_metrics
+from util.partitions import split_dates, to_date, DATE_FORMAT
+
+# Sources with historical data, the rest only describe today
+BUILDERS = [fangraphs_jobs, rotoguru_jobs, statcast_jobs]
+
+
+class Checkpoint(object):
+    """ Set of finished chunk ids kept in a JSON file, rewritten
+        atomically as each chunk finishes
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self.done = set(json.load(f)['done'])
+
+    def finished(self, chunk):
+        """ Record a chunk as done and save """
+        with self._lock:
+            self.done.add(chunk)
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                json.dump({'done': sorted(self.done)}, f, indent=1)
+            os.replace(tmp, self.path)
+
+
+def season_cfg(cfg, season, prefix):
+    """ Config for scraping one past season into its own prefix,
+        always fetching the whole requested date range
+    """
+    return dict(
+        cfg,
+        season=season,
+        incremental=False,
+        s3=dict(cfg['s3'], data_dir='%s/season=%d' % (prefix, season))
+    )
+
+
+def chunk_jobs(job, season, chunk_days):
+    """ Split a job into (chunk id, job) pairs, one per date range
+        for game log tables and a single one otherwise
+    """
+    partition = job.kwargs.get('partition')
+    if not partition or not partition.get('start') or not partition.get('end'):
+        return [('%d/%s' % (season, job.table), job)]
+
+    chunks = list()
+    for start, end in split_dates(to_date(partition['start']), to_date(partition['end']), chunk_days):
+        chunk = '%d/%s/%s' % (season, job.table, start.strftime(DATE_FORMAT))
+        kwargs = dict(job.kwargs, partition=dict(partition, start=start, end=end))
+        chunks.append((chunk, Job(job.source, job.table, job.func, **kwargs)))
+    return chunks
+
+
+def checkpointed(job, chunk, checkpoint):
+    """ Job that records its chunk in the checkpoint on success """
+    def run(**kwargs):
+        job.func(**kwargs)
+        checkpoint.finished(chunk)
+    return Job(job.source, chunk, run, **job.kwargs)
+
+
+def backfill_jobs(table_cfg, cfg, seasons, checkpoint, tables=None):
+    """ Build the chunk jobs of every season not yet in the checkpoint """
+    settings = cfg.get('backfill') or dict()
+    prefix = settings.get('prefix', 'backfill')
+    chunk_days = int(settings.get('chunk_days', 30))
+
+    jobs = list()
+    for season in seasons:
+        for builder in BUILDERS:
+            for job in builder(table_cfg, season_cfg(cfg, season, prefix)):
+                if tables and job.table not in tables:
+                    continue
+                for chunk, chunk_job in chunk_jobs(job, season, chunk_days):
+                    if chunk in checkpoint.done:
+                        continue
+                    jobs.append(checkpointed(chunk_job, chunk, checkpoint))
+    return jobs
+
+
+if __name__ == '__main__':
+    os.chdir(os.path.dirname(os.path.realpath(__file__)))
+
+    # Add path to environ
+    os.environ['PATH'] += os.pathsep + '/usr/local/bin'
+
+    # Configure logging
+    FORMAT = '[%(levelname)s %(asctime)s] %(message)s'
+    logging.basicConfig(format=FORMAT, level=logging.INFO)
+
+    PARSER = argparse.ArgumentParser(description="Backfill past seasons")
+    PARSER.add_argument('first', type=int, help="first season")
+    PARSER.add_argument('last', type=int, nargs='?', help="last season, default first")
+    PARSER.add_argument('--tables', nargs='*', help="only these tables")
+    PARSER.add_argument('--restart', action='store_true', help="ignore the checkpoint")
+    ARGS = PARSER.parse_args()
+
+    TABLE_CFG = get_config('tables.yml')
+    CFG = get_config()
+    CONCURRENCY = CFG['concurrency']
+    SEASONS = range(ARGS.first, (ARGS.last or ARGS.first) + 1)
+
+    # One checkpoint per backfill prefix
+    CHECKPOINT_DIR = os.path.join(CFG['tmp_dir'], 'backfill')
+    if not os.path.exists(CHECKPOINT_DIR):
+        os.makedirs(CHECKPOINT_DIR)
+    CHECKPOINT_PATH = os.path.join(
+        CHECKPOINT_DIR, '%s.json' % (CFG.get('backfill') or {}).get('prefix', 'backfill'))
+    if ARGS.restart and os.path.exists(CHECKPOINT_PATH):
+        os.remove(CHECKPOINT_PATH)
+    CHECKPOINT = Checkpoint(CHECKPOINT_PATH)
+
+    jobs = backfill_jobs(TABLE_CFG, CFG, SEASONS, CHECKPOINT, ARGS.tables)
+    logging.info("Backfilling %d chunks, %d already done", len(jobs), len(CHECKPOINT.done))
+
+    jobs = run_jobs(
+        jobs,
+        max_workers=CONCURRENCY['max_workers'],
+        source_limits=CONCURRENCY['sources']
+    )
+
+    failed = [job.name for job in jobs if job.error]
+    record_jobs(shared_metrics(), jobs)
+    write_metrics(CFG, 'backfill', failed_jobs=len(failed))
+
+    if failed:
+        raise Exception("Failed chunks, rerun to retry: %s" % ', '.join(failed))
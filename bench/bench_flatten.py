@@ -0,0 +1,43 @@
+"""
+    Benchmark flatten_batters on a synthetic full season, reporting
+    runtime and peak traced memory
+
+    usage: python -m bench.bench_flatten [--days 180] [--repeat 3]
+"""
+import logging
+import argparse
+
+from flatten import flatten_batters
+from bench.synthetic import season_tables
+from bench.timing import measure as timed
+
+
+def run(data):
+    """ Flatten a copy of the tables so every run starts the same """
+    return flatten_batters(dict((name, df.copy()) for name, df in data.items()))
+
+
+def measure(data, repeat=3):
+    """ Best wall time over repeat runs, then peak memory of one
+        more run under tracemalloc, which slows it down
+    """
+    result, (train, valid) = timed(lambda: run(data), repeat)
+    result['train_rows'] = train.shape[0]
+    result['valid_rows'] = valid.shape[0]
+    return result
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Benchmark flatten_batters")
+    PARSER.add_argument('--days', type=int, default=180, help="days of games")
+    PARSER.add_argument('--repeat', type=int, default=3, help="timed runs")
+    ARGS = PARSER.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    DATA = season_tables(days=ARGS.days)
+    print("Tables: %s" % ', '.join('%s %d' % (name, len(df)) for name, df in sorted(DATA.items())))
+
+    RESULT = measure(DATA, ARGS.repeat)
+    print("flatten_batters: %.2fs, peak %.1f MB, %d train rows, %d valid rows" % (
+        RESULT['seconds'], RESULT['peak_mb'], RESULT['train_rows'], RESULT['valid_rows']))
@@ -0,0 +1,234 @@
+"""
+    Response fixtures for the parser benchmarks. A fixture recorded
+    with --record is read back from bench/fixtures/<table>, and a table
+    without one gets a deterministic page with the same structure as
+    the real one, so the benchmarks always run offline. Recording
+    needs the network, and accounts.yml for the rotoguru datafile
+
+    usage: python -m bench.fixtures --record [weather_today dfs ...]
+"""
+import os
+import json
+import random
+import logging
+import argparse
+
+from util.config import get_config, season_table
+from util.schema import TEXT_COLUMNS
+from util.partitions import template_dates, to_date
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures')
+
+TEAMS = [
+    'Boston Red Sox', 'San Francisco Giants', 'Houston Astros', 'Chicago Cubs',
+    'Seattle Mariners', 'Texas Rangers', 'New York Yankees', 'Colorado Rockies'
+]
+WIND_GIFS = ['s', 'se', 'sw', 'n', 'ne', 'nw', 'w', 'e', 'xsw']
+
+
+def weather_game(rng, i):
+    """ One game block of the weather page, some games in domes or
+        under retractable roofs
+    """
+    team = TEAMS[i % len(TEAMS)]
+    hour = rng.choice([1, 4, 7, 12])
+    page = '<div><a href="/w/%d" target="_blank" class="weather">Visitors at %s\x96 %d:%02d %s - details</a>' % (
+        i, team, hour, rng.choice([5, 10, 35]), rng.choice(['EDT', 'CDT', 'MDT', 'PDT']))
+    if i % 5 == 3:
+        return page + '<p>The weather details are not relevant for this dome game.</p>'
+    if i % 5 == 4:
+        page += '<p>A retractable roof may neutralize some weather effects.</p>'
+
+    def row(label, values, end=''):
+        return '<tr><td>%s</td>' % label + ''.join(
+            '<td class="c">%s%s</td>' % (v, end) for v in values) + '</tr>'
+
+    page += '<table><tr><td>Wind: <br>SSW %d mph<br></td>' % rng.randint(0, 20)
+    page += '<td><img src="/images/weather/wind/big/%s.gif"></td></tr>' % rng.choice(WIND_GIFS)
+    page += row('Time:', ['%d PM' % ((hour + k - 3) % 12 + 1) for k in range(9)])
+    page += row('Temp:', [rng.randint(50, 95) for _ in range(9)], '&deg;')
+    page += row('Humidity:', [rng.randint(10, 95) for _ in range(9)], '%')
+    page += row('Feels like:', [rng.randint(50, 95) for _ in range(9)], '&deg;')
+    page += row('Condition:', [rng.choice(['Sunny', 'Cloudy', 'Rain']) for _ in range(9)])
+    page += row('Precip%:', [rng.randint(0, 100) for _ in range(9)], '%')
+    page += row('Wind:', ['%d mph' % rng.randint(0, 20) for _ in range(9)])
+    return page + '</table></div>' + 'filler ' * rng.randint(0, 400)
+
+
+def weather_page(info, games=15):
+    """ Weather page with a block per game """
+    rng = random.Random(0)
+    return '<html><body>%s</body></html>' % ''.join(weather_game(rng, i) for i in range(games))
+
+
+def vegas_page(info, games=15):
+    """ Schedule page with the lines in a javascript array """
+    rng = random.Random(1)
+    games = [
+        '{"time":"7:05 PM","team":"TM%d","x":"y","opponent":"@ OP%d","line:":"-1.5",'
+        '"moneyline":"%+d","overunder":%.1f,"projected":%.2f,"foo":1,'
+        '"projectedchange":{"value":%.2f}}' % (
+            i, i, rng.randint(-200, 200), rng.uniform(7, 11), rng.uniform(3, 6), rng.uniform(-1, 1))
+        for i in range(games)
+    ]
+    return '<html><script>var data = [%s];</script></html>' % ','.join(games)
+
+
+def statcast_page(info, players=600):
+    """ Leaderboard page with the records in a javascript variable,
+        keyed like the savant page and in its order
+    """
+    rng = random.Random(2)
+    rows = list()
+    for i in range(players):
+        rows.append({
+            'name': 'Player%d, First' % i, 'attempts': rng.randint(1, 500),
+            'max_hit_speed': round(rng.uniform(90, 120), 1), 'min_hit_speed': round(rng.uniform(20, 60), 1),
+            'avg_hit_speed': '%.1f' % rng.uniform(80, 95), 'fbld': round(rng.uniform(85, 98), 1),
+            'gb': round(rng.uniform(75, 90), 1), 'max_distance': rng.randint(300, 480),
+            'avg_distance': rng.randint(150, 250),
+            'avg_hr_distance': None if i % 7 == 0 else rng.randint(370, 420),
+            'player_id': str(400000 + i), 'player_type': 'resp_batter_id', 'season': 2018,
+            'resp_batter_id': 400000 + i, 'barrels': rng.randint(0, 40),
+            'brl_percent': '%.1f%%' % rng.uniform(0, 20), 'brl_pa': '%.1f' % rng.uniform(0, 12),
+            'ev95plus': rng.randint(0, 200), 'ev95percent': '%.1f' % rng.uniform(20, 60), 'rowId': str(i)
+        })
+    return '<html><script>\nvar leaderboard_data = %s;\nvar other = [1,2];</script>%s</html>' % (
+        json.dumps(rows, separators=(',', ':')), 'x' * 100000)
+
+
+def table_rows(rng, column_list, rows, fmt):
+    """ Rows of values for a column list: text for text columns,
+        dates for date columns and numbers for everything else
+    """
+    def value(col, i):
+        if col in TEXT_COLUMNS:
+            return fmt['text'] % rng.choice(['Smith, John', 'bos', 'h', 'R', 'OF', 'Sunny'])
+        if col.endswith('date'):
+            return '2018%02d%02d' % (4 + i % 6, 1 + i % 28)
+        if col.endswith('id'):
+            return str(1000 + i)
+        if col.endswith('perc'):
+            return fmt['percent'] % rng.uniform(0, 40)
+        return '%.2f' % rng.uniform(0, 100)
+    return [[value(col, i) for col in column_list] for i in range(rows)]
+
+
+def rotoguru_dump(info, rows=50000):
+    """ Colon separated season datafile followed by the ADI notes """
+    rng = random.Random(3)
+    lines = [':'.join(info['columns'])]
+    lines += [':'.join(row) for row in table_rows(rng, info['columns'], rows, {'text': '%s', 'percent': '%.1f'})]
+    return '\n'.join(lines) + '\n*-ADI notes\nnot part of the table\n'
+
+
+def daily_fantasy_page(info, rows=1000):
+    """ Page with the semicolon separated salary table, position 1
+        for pitchers
+    """
+    rng = random.Random(4)
+    body = table_rows(rng, info['columns'], rows, {'text': '%s', 'percent': '%.1f'})
+    p_h = info['columns'].index('p_h')
+    for i, row in enumerate(body):
+        row[p_h] = '1' if i % 5 == 0 else str(rng.choice([2, 3, 4, 5]))
+    lines = [';'.join(info['columns'])] + [';'.join(row) for row in body]
+    return '<html><P>Fields separated by semicolons(;)</P><hr><P>%s\n<hr><center>Statistical notes</center></html>' % (
+        '\n'.join(lines))
+
+
+def fangraphs_csv(info, rows=1500):
+    """ Leaderboard export with every field quoted and percentages
+        like "12.5 %"
+    """
+    rng = random.Random(5)
+    body = table_rows(rng, info['columns'], rows, {'text': '%s', 'percent': '%.1f %%'})
+    lines = [','.join('"%s"' % col for col in info['columns'])]
+    lines += [','.join('"%s"' % value for value in row) for row in body]
+    return '\n'.join(lines) + '\n'
+
+
+# Source of each benchmarked table and the page its fixture is built as
+FIXTURES = {
+    'weather_today': ('weather', weather_page),
+    'vegas_lines': ('vegas', vegas_page),
+    'statcast_batters': ('statcast', statcast_page),
+    'dfs': ('rotoguru', rotoguru_dump),
+    'draftkings': ('daily_fantasy', daily_fantasy_page),
+    'fanduels': ('daily_fantasy', daily_fantasy_page),
+    'fg_batters': ('fangraphs', fangraphs_csv),
+    'fg_batters_daily': ('fangraphs', lambda info: fangraphs_csv(info, rows=50000))
+}
+
+
+def table_info(table, table_cfg=None, cfg=None):
+    """ (source, tables.yml entry with the season filled in) """
+    table_cfg = table_cfg or get_config('tables.yml')
+    source = FIXTURES[table][0]
+    season = (cfg or get_config())['season']
+    return source, season_table(table_cfg[source][table], season)
+
+
+def fixture_path(table):
+    """ Where a table's recorded fixture is saved """
+    return os.path.join(FIXTURE_DIR, table)
+
+
+def load_fixture(table, table_cfg=None):
+    """ Response body bytes for a table, recorded if there is a
+        recording and synthesized otherwise, and whether it was recorded
+    """
+    path = fixture_path(table)
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            return f.read(), True
+    _, info = table_info(table, table_cfg)
+    body = FIXTURES[table][1](info)
+    return body.encode('utf-8' if FIXTURES[table][0] == 'fangraphs' else 'latin1'), False
+
+
+def record(table, table_cfg, cfg):
+    """ Download a table's response the way its scraper does and save
+        it as the table's fixture
+    """
+    from scrapers.fangraphs import FanGraphsScraper
+    from scrapers.weather import WeatherScraper
+
+    source, info = table_info(table, table_cfg, cfg)
+    url = info['url']
+    if info.get('partition'):
+        partition = info['partition']
+        url = template_dates(url, to_date(partition['start']), to_date(partition['end']))
+
+    if source == 'fangraphs':
+        body = FanGraphsScraper(cfg).fetch_http(url, info['js_cmd'], table)
+    else:
+        if source == 'rotoguru':
+            login = get_config('accounts.yml')['rotoguru']
+            url = url % (login['username'], login['password'])
+        # Every other scraper is a plain GET, any of them will do
+        body = WeatherScraper(cfg).get(url, table)
+
+    if not os.path.exists(FIXTURE_DIR):
+        os.makedirs(FIXTURE_DIR)
+    with open(fixture_path(table), 'wb') as f:
+        f.write(body)
+    logging.info("Recorded %s, %d bytes", table, len(body))
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Record benchmark fixtures")
+    PARSER.add_argument('tables', nargs='*', help="tables to record, default all")
+    PARSER.add_argument('--record', action='store_true', help="download and save the responses")
+    ARGS = PARSER.parse_args()
+
+    FORMAT = '[%(levelname)s %(asctime)s] %(message)s'
+    logging.basicConfig(format=FORMAT, level=logging.INFO)
+
+    TABLE_CFG = get_config('tables.yml')
+    CFG = get_config()
+    for TABLE in ARGS.tables or sorted(FIXTURES):
+        if ARGS.record:
+            record(TABLE, TABLE_CFG, CFG)
+        else:
+            BODY, RECORDED = load_fixture(TABLE, TABLE_CFG)
+            print("%s: %s, %d bytes" % (TABLE, 'recorded' if RECORDED else 'synthetic', len(BODY)))
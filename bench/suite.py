@@ -0,0 +1,177 @@
+"""
+    Offline benchmark suite: every scraper parser on its response
+    fixture, and flatten_batters on a synthetic full season. Reports
+    time, peak memory and rows/sec per stage, and fails when a stage
+    got slower or bigger than the stored baseline by more than the
+    tolerance
+
+    usage: python -m bench.suite [--stages dfs flatten_batters] [--save-baseline]
+                                 [--require-baseline]
+
+    Baselines depend on the machine, so none is committed. In CI, store
+    one on the CI runner from the target branch with --save-baseline,
+    for example as a cached build artifact, then run the change with
+    --require-baseline. That fails when the baseline is missing, so a
+    fresh checkout can't pass without comparing anything. Stages use
+    the recorded fixtures of bench.fixtures --record where there are
+    any, synthetic pages otherwise, and a baseline only compares to a
+    run on the same kind of fixture
+"""
+import os
+import json
+import logging
+import argparse
+
+from util.config import get_config
+from bench.fixtures import FIXTURES, load_fixture, table_info
+from bench.timing import measure
+
+BASELINE = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'baseline.json')
+
+# Allowed growth over the baseline, and absolute slack so stages of a
+# few milliseconds don't fail on timer noise
+TOLERANCE = 0.25
+SLACK = {'seconds': 0.005, 'peak_mb': 0.5}
+
+
+def parser_stage(table, table_cfg, cfg):
+    """ (callable parsing the table's fixture like its scraper does,
+        whether the fixture was recorded)
+    """
+    from scrapers.weather import WeatherScraper
+    from scrapers.vegas import VegasScraper
+    from scrapers.statcast import StatcastScraper
+    from scrapers.rotoguru import RotoGuruScraper
+    from scrapers.daily_fantasy import DailyFantasyScraper
+    from scrapers.fangraphs import FanGraphsScraper
+
+    body, recorded = load_fixture(table, table_cfg)
+    source, info = table_info(table, table_cfg, cfg)
+
+    if source == 'weather':
+        scraper = WeatherScraper(cfg)
+        return lambda: scraper.parse_weather(body.decode('latin1')), recorded
+    if source == 'vegas':
+        scraper = VegasScraper(cfg)
+        return lambda: scraper.parse_js(body.decode('latin1')), recorded
+    if source == 'statcast':
+        return lambda: StatcastScraper.to_frame(
+            StatcastScraper.extract_records(body.decode('latin1')),
+            info['columns'], info.get('keys')), recorded
+    if source == 'rotoguru':
+        return lambda: RotoGuruScraper.parse_dump(body.decode('latin1'), info['columns']), recorded
+    if source == 'daily_fantasy':
+        scraper = DailyFantasyScraper(cfg)
+        return lambda: scraper.parse_page(body.decode('latin1'), info['columns']), recorded
+    return lambda: FanGraphsScraper.parse_csv(body, info['columns']), recorded
+
+
+def flatten_stage(days=180):
+    """ Callable flattening a synthetic season of days """
+    from bench.bench_flatten import run
+    from bench.synthetic import season_tables
+
+    data = season_tables(days=days)
+    return lambda: sum(len(df) for df in run(data))
+
+
+def run_suite(stages=None, repeat=3, days=180):
+    """ Stage name -> time, peak memory, rows and rows/sec """
+    table_cfg = get_config('tables.yml')
+
+    # No response cache, nothing here touches the network
+    cfg = dict(get_config(), http_cache={'enabled': False})
+
+    results = dict()
+    for stage in stages or sorted(FIXTURES) + ['flatten_batters']:
+        if stage == 'flatten_batters':
+            func, fixture = flatten_stage(days), 'synthetic'
+        else:
+            func, recorded = parser_stage(stage, table_cfg, cfg)
+            fixture = 'recorded' if recorded else 'synthetic'
+
+        result, out = measure(func, repeat)
+        result['rows'] = out if isinstance(out, int) else len(out)
+        result['rows_per_sec'] = result['rows'] / result['seconds'] if result['seconds'] else 0.
+        result['fixture'] = fixture
+        results[stage] = result
+        logging.info("%s: %.4fs, %.1f MB", stage, result['seconds'], result['peak_mb'])
+    return results
+
+
+def compare(results, baseline, tolerance=TOLERANCE):
+    """ Regressions of results against a baseline, as messages. A
+        stage whose row count changed ran on different input, so its
+        numbers can't be compared
+    """
+    regressions = list()
+    for stage, result in sorted(results.items()):
+        base = baseline.get(stage)
+        if base is None:
+            continue
+        if result['rows'] != base['rows'] or result['fixture'] != base['fixture']:
+            regressions.append("%s: input changed, %s fixture with %d rows, baseline %s with %d" % (
+                stage, result['fixture'], result['rows'], base['fixture'], base['rows']))
+            continue
+        for metric in ['seconds', 'peak_mb']:
+            limit = base[metric] * (1 + tolerance) + SLACK[metric]
+            if result[metric] > limit:
+                regressions.append("%s: %s %.4f over %.4f, baseline %.4f" % (
+                    stage, metric, result[metric], limit, base[metric]))
+    return regressions
+
+
+def report(results, baseline):
+    """ Table of the results with the change from the baseline """
+    lines = ["%-18s %-9s %9s %10s %12s %9s %8s %8s" % (
+        'stage', 'fixture', 'rows', 'seconds', 'rows/sec', 'peak MB', 'time', 'memory')]
+    for stage, result in sorted(results.items()):
+        base = baseline.get(stage)
+        change = ['', '']
+        if base:
+            change = ['%+.0f%%' % (100. * (result[m] / base[m] - 1) if base[m] else 0.)
+                      for m in ['seconds', 'peak_mb']]
+        lines.append("%-18s %-9s %9d %10.4f %12.0f %9.1f %8s %8s" % (
+            stage, result['fixture'], result['rows'], result['seconds'],
+            result['rows_per_sec'], result['peak_mb'], change[0], change[1]))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Benchmark the parsers and flatten offline")
+    PARSER.add_argument('--stages', nargs='*', help="stages to run, default all")
+    PARSER.add_argument('--repeat', type=int, default=3, help="timed runs per stage")
+    PARSER.add_argument('--days', type=int, default=180, help="days of games to flatten")
+    PARSER.add_argument('--baseline', default=BASELINE, help="baseline json file")
+    PARSER.add_argument('--tolerance', type=float, default=TOLERANCE,
+                        help="allowed growth over the baseline, 0.25 is 25%%")
+    PARSER.add_argument('--save-baseline', action='store_true',
+                        help="store these results as the baseline")
+    PARSER.add_argument('--require-baseline', action='store_true',
+                        help="fail when there is no baseline, or a stage is missing from it")
+    ARGS = PARSER.parse_args()
+
+    FORMAT = '[%(levelname)s %(asctime)s] %(message)s'
+    logging.basicConfig(format=FORMAT, level=logging.WARNING)
+
+    BASE = dict()
+    if os.path.exists(ARGS.baseline):
+        with open(ARGS.baseline, 'r') as f:
+            BASE = json.load(f)
+
+    RESULTS = run_suite(ARGS.stages, ARGS.repeat, ARGS.days)
+    print(report(RESULTS, BASE))
+
+    if ARGS.save_baseline:
+        BASE.update(RESULTS)
+        with open(ARGS.baseline, 'w') as f:
+            json.dump(BASE, f, indent=1, sort_keys=True)
+        print("Saved baseline to %s" % ARGS.baseline)
+    else:
+        if not BASE:
+            print("No baseline at %s, run with --save-baseline to store one" % ARGS.baseline)
+        REGRESSIONS = compare(RESULTS, BASE, ARGS.tolerance)
+        if ARGS.require_baseline:
+            REGRESSIONS += ["%s: not in the baseline" % stage for stage in sorted(RESULTS) if stage not in BASE]
+        if REGRESSIONS:
+            raise Exception("Benchmark regressions:\n  %s" % '\n  '.join(REGRESSIONS))
@@ -0,0 +1,147 @@
+"""
+    This module generates a synthetic season of the tables that
+    flatten_batters reads, with the same columns and value formats
+    as the scraped ones, so the flatten stages can be measured at
+    full-season scale without a bucket
+"""
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+from flatten import table_columns
+
+W_DIRS = [
+    'Out to RF', 'Out to CF', 'Out to LF', 'In from LF', 'In from RF',
+    'In from CF', 'L to R', 'R to L', 'Varies', 'None', 'Dome'
+]
+
+
+def stat_frame(rng, ids, id_col, columns):
+    """ Random stats for every id, a few values missing """
+    df = pd.DataFrame(
+        rng.normal(10., 5., size=(len(ids), len(columns))).round(3),
+        columns=columns
+    )
+    df = df.mask(rng.random(df.shape) < 0.01)
+    df.insert(0, id_col, ids)
+    return df
+
+
+def season_tables(days=180, teams=30, batters=13, pitchers=5, lineup=9, seed=0, today=None):
+    """ Dict of table name -> dataframe for days of games ending
+        today, every team playing once a day
+    """
+    rng = np.random.default_rng(seed)
+    today = today or date.today()
+    columns = table_columns()
+
+    def stats(table, ids, id_col):
+        return stat_frame(rng, ids, id_col, [c for c in columns[table] if c != id_col])
+
+    # Teams and the names each source uses for them
+    guru = ['t%02d' % i for i in range(teams)]
+    team_link = pd.DataFrame({
+        'team_guru': guru,
+        'team_park': ['Park %02d' % i for i in range(teams)],
+        'team_weather': ['Weather %02d' % i for i in range(teams)]
+    })
+
+    # Players, a few batters are missing from the link table
+    n_bat, n_pit = teams * batters, teams * pitchers
+    mlb_ids = 400000 + np.arange(n_bat + n_pit)
+    fg_ids = 10000 + np.arange(n_bat + n_pit)
+    linked = rng.random(n_bat + n_pit) > 0.02
+    player_link = pd.DataFrame({'mlb_id': mlb_ids[linked], 'fg_id': fg_ids[linked]})
+    bat_hand = rng.choice(['L', 'R', 'B'], size=n_bat, p=[.35, .55, .1])
+    pit_hand = rng.choice(['L', 'R'], size=n_pit, p=[.3, .7])
+
+    # Season long fangraphs and statcast tables
+    bat_fg, pit_fg = fg_ids[:n_bat], fg_ids[n_bat:]
+    data = {
+        'player_link': player_link,
+        'team_link': team_link,
+        'fg_batters': stats('fg_batters', bat_fg, 'fg_id'),
+        'fg_batters_lhp': stats('fg_batters_lhp', bat_fg, 'fg_id'),
+        'fg_batters_rhp': stats('fg_batters_rhp', bat_fg, 'fg_id'),
+        'fg_batters_home': stats('fg_batters_home', bat_fg, 'fg_id'),
+        'fg_batters_away': stats('fg_batters_away', bat_fg, 'fg_id'),
+        'fg_pitchers_lhb': stats('fg_pitchers_lhb', pit_fg, 'fg_id'),
+        'fg_pitchers_rhb': stats('fg_pitchers_rhb', pit_fg, 'fg_id'),
+        'statcast_batters': stats('statcast_batters', mlb_ids[:n_bat][rng.random(n_bat) > .2], 'mlb_id')
+    }
+    park_factor = stats('park_factor', np.repeat(team_link['team_park'], 2).values, 'team')
+    park_factor['side'] = ['Left', 'Right'] * teams
+    data['park_factor'] = park_factor
+
+    # One game per team per day, lineups drawn from the team's batters
+    games = list()
+    for d in range(days):
+        order = rng.permutation(teams)
+        home, away = order[::2], order[1::2]
+        starters = n_bat + np.arange(teams) * pitchers + rng.integers(pitchers, size=teams)
+        team = np.concatenate([home, away])
+        oppt = np.concatenate([away, home])
+        lineups = np.argsort(rng.random((teams, batters)), axis=1)[:, :lineup]
+        games.append(pd.DataFrame({
+            'day': d,
+            'team': np.repeat(team, lineup),
+            'oppt': np.repeat(oppt, lineup),
+            'h_a': np.repeat(np.where(np.arange(teams) < len(home), 'h', 'a'), lineup),
+            'player': (team[:, None] * batters + lineups).ravel(),
+            'starter': np.repeat(starters[oppt], lineup)
+        }))
+    games = pd.concat(games, ignore_index=True)
+
+    day = pd.Timestamp(today) - pd.to_timedelta(days - 1 - games['day'], unit='D')
+    players, starter = games['player'].to_numpy(), games['starter'].to_numpy()
+    dfs = pd.DataFrame({
+        'game_date': day.dt.strftime('%Y%m%d').astype(int),
+        'team': np.array(guru)[games['team']],
+        'oppt': np.array(guru)[games['oppt']],
+        'h_a': games['h_a'],
+        'p_h': 'H',
+        'mlb_id': mlb_ids[players],
+        'name_first_last': ['Player %d' % p for p in players],
+        'hand': bat_hand[players],
+        'oppt_pitch_mlb_id': mlb_ids[starter],
+        'oppt_pitch_hand': pit_hand[starter - n_bat]
+    })
+
+    # Game logs for every game before today
+    played = (day < pd.Timestamp(today)).to_numpy()
+    daily = pd.DataFrame({
+        'fg_id': fg_ids[players[played]],
+        'game_date': day[played].dt.strftime('%Y-%m-%d').to_numpy()
+    })
+
+    n = len(dfs)
+    dfs['dk_pos'] = rng.choice(['C', '1B', '2B', '3B', 'SS', 'OF'], size=n)
+    dfs['fd_pos'] = dfs['dk_pos']
+    dfs['dk_salary'] = rng.integers(20, 60, size=n) * 100
+    dfs['fd_salary'] = rng.integers(20, 45, size=n) * 100
+    dfs['w_speed'] = rng.integers(0, 20, size=n)
+    dfs['w_dir'] = rng.choice(W_DIRS, size=n)
+    dfs['temp'] = rng.integers(45, 100, size=n)
+    dfs['prior_adi'] = rng.normal(75., 10., size=n).round(1)
+    dfs['dk_points'] = rng.gamma(2., 4., size=n).round(1)
+    dfs['fd_points'] = rng.gamma(2., 5., size=n).round(1)
+
+    # Starting pitchers are in the dfs table too
+    pitchers_dfs = dfs.drop_duplicates(['game_date', 'oppt_pitch_mlb_id']).assign(
+        p_h='P', mlb_id=lambda x: x['oppt_pitch_mlb_id'])
+    data['dfs'] = pd.concat([dfs, pitchers_dfs], ignore_index=True)[columns['dfs']]
+
+    targets = [c for c in columns['fg_batters_daily'] if c not in ('fg_id', 'game_date')]
+    for col in targets:
+        daily[col] = rng.poisson(.3, size=len(daily))
+    data['fg_batters_daily'] = daily
+
+    # Today's weather at every park
+    data['weather_today'] = pd.DataFrame({
+        'team': team_link['team_weather'],
+        'w_speed': rng.integers(0, 20, size=teams),
+        'w_dir': rng.choice(W_DIRS, size=teams),
+        'temp': rng.integers(45, 100, size=teams)
+    })
+    return data
@@ -0,0 +1,24 @@
+"""
+    Timing and peak memory of a benchmarked callable
+"""
+import time
+import tracemalloc
+
+
+def measure(func, repeat=3):
+    """ Best wall time of func over repeat runs, then peak traced
+        memory of one more run under tracemalloc, which slows it
+        down. Returns the timings and the last result
+    """
+    times = list()
+    for _ in range(repeat):
+        tick = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - tick)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {'seconds': min(times), 'peak_mb': peak / 1024. / 1024.}, result
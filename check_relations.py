@@ -1,93 +1,98 @@
-import os
 import logging
-from io import StringIO
-import boto3
+import argparse
 import pandas as pd
 import numpy as np
 
-from util.config import get_config
+from util import fetch
+from util.identity import resolve, flip_names, MIN_CONFIDENCE
+
+# Tables needed to find unlinked players
+TABLES = ['dfs', 'player_link', 'team_link', 'fg_batters', 'fg_pitchers', 'statcast_batters']
 
 def load_data():
-    """ Load all data files from s3 bucket into dict """
-    cfg = get_config('config.yml')
+    """ Load the data files used here from s3 bucket into dict """
+    return fetch.fetch_all_csv(tables=TABLES)
+
+def unlinked(data):
+    """ Players missing from player_link, as the mlb_id records of
+        dfs and statcast and the fg_id records of fangraphs, each with
+        a name and a team in fangraphs' naming where it is known
+    """
+    link = data['player_link'].loc[lambda x: x['dk_name'].notnull()]
+    linked_mlb = set(link['mlb_id'].dropna())
+    linked_fg = set(link['fg_id'].dropna().astype(str))
+
+    # Park factors come from fangraphs, so its team names are theirs
+    teams = data['team_link'].set_index('team_guru')['team_park']
+    fg_teams = set(teams)
+
+    dfs = (
+        data['dfs']
+        .loc[lambda x: ~x['mlb_id'].isin(linked_mlb)]
+        .assign(name=lambda x: x['name_first_last'],
+                team=lambda x: x['team'].astype(object).map(teams))
+    )[['name', 'mlb_id', 'team']]
 
-    # Get s3 bucket
-    bucket = boto3.resource('s3').Bucket(cfg['s3']['bucket'])
+    sc_b = (
+        data['statcast_batters']
+        .loc[lambda x: ~x['mlb_id'].isin(linked_mlb)]
+        .assign(name=lambda x: flip_names(x['name'].astype(object)), team=np.nan)
+    )[['name', 'mlb_id', 'team']]
 
-    # Load *.csv into dataframes
-    data = dict()
-    for obj in bucket.objects.all():
-        if '.csv' in obj.key:
-            table = os.path.basename(obj.key)[:-4]
-            logging.info("Loading %s", table)
-            mem_buffer = StringIO(obj.get()['Body'].read().decode('latin1'))
-            data[table] = pd.read_csv(mem_buffer)
+    fg = pd.concat([data['fg_batters'], data['fg_pitchers']], ignore_index=True)
+    fg = (
+        fg
+        .assign(fg_id=lambda x: x['fg_id'].astype(str))
+        .loc[lambda x: ~x['fg_id'].isin(linked_fg)]
+        .assign(team=lambda x: x['team'].astype(object).where(x['team'].isin(fg_teams)))
+    )[['name', 'fg_id', 'team']]
 
-    return data
+    # One record per id, dfs names first as those are the ones linked
+    mlb = pd.concat([dfs, sc_b], ignore_index=True).drop_duplicates('mlb_id').reset_index(drop=True)
+    fg = fg.drop_duplicates('fg_id').reset_index(drop=True)
+    return mlb, fg
 
-def invert_name(x):
-    """ Convert "Last, First" -> "First Last" """
-    a = x.find(',')
-    return x[a + 2:] + ' ' + x[:a]
+def propose_links(mlb, fg, min_confidence=MIN_CONFIDENCE):
+    """ Proposed player_link rows for unlinked records, with the
+        fangraphs name, match confidence and ambiguity for review
+    """
+    matches = resolve(mlb, fg, 'team', 'team', min_confidence)
+    left = mlb.iloc[matches['left']].reset_index(drop=True)
+    right = fg.iloc[matches['right']].reset_index(drop=True)
+    return pd.DataFrame({
+        'dk_name': left['name'],
+        'mlb_id': left['mlb_id'],
+        'fg_id': right['fg_id'],
+        'fg_name': right['name'],
+        'confidence': matches['confidence'].round(3),
+        'ambiguous': matches['ambiguous']
+    }).sort_values('dk_name').reset_index(drop=True)
 
 if __name__ == '__main__':
     # Configure logging
     FORMAT = '[%(levelname)s %(asctime)s] %(message)s'
     logging.basicConfig(format=FORMAT, level=logging.INFO)
 
+    PARSER = argparse.ArgumentParser(description="Propose player_link rows for unlinked players")
+    PARSER.add_argument('--min-confidence', type=float, default=MIN_CONFIDENCE,
+                        help="lowest match confidence to propose")
+    PARSER.add_argument('--out', help="also write the proposals to this csv")
+    ARGS = PARSER.parse_args()
+
     # Get data
     data = load_data()
 
-    # Join tables to player_link
-    dfs = (
-        data['dfs']
-        .rename(columns={'name_first_last': 'name'})
-        .merge(data['player_link'], on='mlb_id', how='left')
-        .loc[lambda x: x['dk_name'].isnull()]
-    )[['name', 'mlb_id']]
-
-    fg_b = (
-        data['fg_batters']
-        .astype({'fg_id': str})
-        .merge(data['player_link'], on='fg_id', how='left')
-        .loc[lambda x: x['dk_name'].isnull()]
-    )[['name', 'fg_id']]
-
-    fg_p = (
-        data['fg_pitchers']
-        .astype({'fg_id': str})
-        .merge(data['player_link'], on='fg_id', how='left')
-        .loc[lambda x: x['dk_name'].isnull()]
-    )[['name', 'fg_id']]
-
-    sc_b = (
-        data['statcast_batters']
-        .merge(data['player_link'], on='mlb_id', how='left')
-        .loc[lambda x: x['dk_name'].isnull()]
-        .assign(name=lambda x: x['name'].apply(invert_name))
-    )[['name', 'mlb_id']]
-
-    # Combine all missing relations
-    df = (
-        dfs
-        .merge(fg_b, on='name', how='outer')
-        .merge(fg_p, on='name', how='outer')
-        .merge(sc_b, on='name', how='outer')
-        .drop_duplicates()
-        .assign(mlb_id=lambda x: np.where(
-            x['mlb_id_x'].isnull(),
-            x['mlb_id_y'],
-            x['mlb_id_x']
-        ))
-        .assign(fg_id=lambda x: np.where(
-            x['fg_id_x'].isnull(),
-            x['fg_id_y'],
-            x['fg_id_x']
-        ))
-        .sort_values('name')
-        .reset_index(drop=True)
-        .rename(columns={'name': 'dk_name'})
-    )[['dk_name', 'mlb_id', 'fg_id']]
+    # Match unlinked records across sources
+    mlb, fg = unlinked(data)
+    df = propose_links(mlb, fg, ARGS.min_confidence)
+    logging.info("Unlinked: %d mlb ids, %d fg ids, %d proposed links",
+                 len(mlb), len(fg), len(df))
 
     # Print results
+    pd.set_option('display.max_rows', None)
     print(df)
+    print(mlb[~mlb['mlb_id'].isin(df['mlb_id'])].sort_values('name').to_string(index=False))
+    print(fg[~fg['fg_id'].isin(df['fg_id'])].sort_values('name').to_string(index=False))
+
+    if ARGS.out:
+        df.to_csv(ARGS.out, index=False)
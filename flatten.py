@@ -5,284 +5,581 @@
 """
 from __future__ import division
 import os
+import time
 import logging
+import argparse
 from datetime import datetime
 import pandas as pd
 import numpy as np
 
 from util import fetch
+from util.config import get_config
+from util.schema import memory_report
+from util.partitions import partition_name, partition_date, to_date, DATE_FORMAT
+from util.manifest import fingerprint, date_versions, plan_dates
+from util.metrics import shared_metrics, write_metrics
+from util.profiling import Phases, profiled, start_profiling, stop_profiling
 
 # Constant
 TODAY = datetime.now().strftime('%Y-%m-%d')
 
-
-def to_numeric(arr):
-    """ Convert values in column to numeric values, and impute
-        any missing values with the mean of the column
+# List of feature columns we are interested in keeping
+ALL_FEATURES = [
+    'age_b', 'bb_perc_b', 'k_perc_b', 'bb_k_b', 'obp_b', 'ld_perc_b', 'gb_perc_b', 'fb_perc_b',
+    'iffb_perc_b', 'ifh_perc_b', 'buh_perc_b', 'woba_b', 'wraa_b', 'wrc_b', 'spd_b',
+    'wrc_plus_b', 'wpa_b', 'o_swing_perc_b', 'z_swing_perc_b', 'swing_perc_b',
+    'o_contact_perc_b', 'z_contact_perc_b', 'contact_perc_b', 'zone_perc_b', 'f_strike_perc_b',
+    'swstr_perc_b', 'bsr_b', 'pull_perc_b', 'cent_perc_b', 'oppo_perc_b', 'soft_perc_b', 
+    'med_perc_b', 'hard_perc_b', 'bb_perc_bh', 'k_perc_bh', 'bb_k_bh', 'obp_bh', 'w_rc_bh',
+    'w_raa_bh', 'w_oba_bh', 'wrc_plus_bh', 'ld_perc_bh', 'gb_perc_bh', 'fb_perc_bh',
+    'iffb_perc_bh', 'ifh_perc_bh', 'buh_perc_bh', 'pull_perc_bh', 'cent_perc_bh',
+    'oppo_perc_bh', 'soft_perc_bh', 'med_perc_bh', 'hard_perc_bh', 'bb_perc_ha', 'k_perc_ha',
+    'bb_k_ha', 'obp_ha', 'w_rc_ha', 'w_raa_ha', 'w_oba_ha', 'wrc_plus_ha', 'ld_perc_ha',
+    'gb_perc_ha', 'fb_perc_ha', 'iffb_perc_ha', 'ifh_perc_ha', 'buh_perc_ha', 'pull_perc_ha',
+    'cent_perc_ha', 'oppo_perc_ha', 'soft_perc_ha', 'med_perc_ha', 'hard_perc_ha',
+    'max_hit_speed_sc', 'avg_hit_speed_sc', 'fbld_sc', 'gb_sc', 'max_distance_sc',
+    'avg_distance_sc', 'avg_hr_distance_sc', 'barrels_sc', 'brl_percent_sc', 'brl_pa_sc',
+    'ev95plus_sc', 'ev95percent_sc', 'fb_factor_pf', 'gb_factor_pf', 'ld_factor_pf',
+    'pu_factor_pf', 'factor_1b_pf', 'factor_2b_pf', 'factor_3b_pf', 'hr_factor_pf',
+    'runs_factor_pf', 'obp_ph', 'w_oba_ph', 'k_9_ph', 'bb_9_ph', 'k_bb_ph', 'hr_9_ph',
+    'k_perc_ph', 'bb_perc_ph', 'k_bb_perc_ph', 'whip_ph', 'x_fip_ph', 'fip_ph', 'ld_perc_ph',
+    'gb_perc_ph', 'fb_perc_ph', 'iffb_perc_ph', 'ifh_perc_ph', 'buh_perc_ph', 'pull_perc_ph',
+    'cent_perc_ph', 'oppo_perc_ph', 'soft_perc_ph', 'med_perc_ph', 'hard_perc_ph', 'temp',
+    'w_speed', 'w_dir', 'prior_adi'
+]
+
+TARGET_COLS = [
+    'one_b_bd', 'two_b_bd', 'three_b_bd', 'hr_bd', 'rbi_bd', 'r_bd', 'bb_bd', 'hbp_bd',
+    'sb_bd', 'dk_points', 'fd_points'
+]
+
+ID_COLS = [
+    'name_first_last', 'team', 'game_date', 'dk_pos', 'fd_pos', 'dk_salary', 'fd_salary'
+]
+
+# Suffix each table's columns get in the merged frame
+TABLE_SUFFIXES = {
+    'fg_batters': '_b', 'fg_batters_lhp': '_bh', 'fg_batters_rhp': '_bh',
+    'fg_batters_home': '_ha', 'fg_batters_away': '_ha', 'statcast_batters': '_sc',
+    'park_factor': '_pf', 'fg_pitchers_lhb': '_ph', 'fg_pitchers_rhb': '_ph',
+    'fg_batters_daily': '_bd', 'weather_today': '_wt'
+}
+
+# Tables stored one partition per game date, the others hold season
+# level stats and mappings
+DATE_TABLES = ['dfs', 'fg_batters_daily']
+
+# Type of the cleaned feature and target matrices
+FEATURE_DTYPE = np.float64
+
+# Characters that can't be part of a number, like "%" and padding
+NON_NUMERIC = r'[^\d.eE+-]+'
+
+# Tables joined in flatten_batters and the suffix their columns are
+# known by, the hand and home/away splits are stacked into one each
+JOINED_SUFFIXES = {
+    'fg_batters': '_b', 'fg_batters_hand': '_bh', 'fg_batters_ha': '_ha',
+    'statcast_batters': '_sc', 'park_factor': '_pf', 'fg_pitchers_hand': '_ph',
+    'fg_batters_daily': '_bd', 'weather_today': '_wt'
+}
+
+# Join keys and other columns used outside of the feature lists
+JOIN_COLUMNS = {
+    'dfs': ID_COLS + [
+        'p_h', 'mlb_id', 'oppt_pitch_mlb_id', 'h_a', 'oppt', 'hand', 'oppt_pitch_hand',
+        'w_speed', 'w_dir', 'temp', 'prior_adi', 'dk_points', 'fd_points'
+    ],
+    'player_link': ['mlb_id', 'fg_id'],
+    'team_link': ['team_guru', 'team_park', 'team_weather'],
+    'fg_batters': ['fg_id'],
+    'fg_batters_lhp': ['fg_id'],
+    'fg_batters_rhp': ['fg_id'],
+    'fg_batters_home': ['fg_id'],
+    'fg_batters_away': ['fg_id'],
+    'statcast_batters': ['mlb_id'],
+    'park_factor': ['team', 'side'],
+    'fg_pitchers_lhb': ['fg_id'],
+    'fg_pitchers_rhb': ['fg_id'],
+    'fg_batters_daily': ['fg_id', 'game_date'],
+    'weather_today': ['team', 'w_speed', 'w_dir', 'temp']
+}
+
+
+def table_columns():
+    """ Columns flatten_batters reads from each table, so loaders
+        can skip everything else
     """
-    arr = pd.to_numeric(
-        arr
-        .astype(str)
-        .str.replace(r'[^\d.]+', '')
-    )
-    avg = arr.mean()
-    return arr.fillna(avg)
+    columns = dict((table, list(cols)) for table, cols in JOIN_COLUMNS.items())
+    for table, suffix in TABLE_SUFFIXES.items():
+        columns[table] += [
+            col[:-len(suffix)] for col in ALL_FEATURES + TARGET_COLS
+            if col.endswith(suffix)
+        ]
+    return columns
+
+
+def clean_numeric(columns, names, dtype=FEATURE_DTYPE):
+    """ Convert columns to one contiguous float matrix, and impute
+        any missing values with the mean of each column. Numeric
+        columns are copied straight in, text columns are stacked and
+        parsed together in one vectorized pass. columns can be a
+        dataframe or a dict of series
+    """
+    n = len(columns[names[0]]) if names else 0
+    block = np.empty((n, len(names)), dtype=dtype, order='F')
+
+    text = list()
+    for i, name in enumerate(names):
+        arr = columns[name]
+        if pd.api.types.is_numeric_dtype(arr):
+            block[:, i] = arr.to_numpy(dtype=dtype, na_value=np.nan)
+        else:
+            text.append(i)
+
+    if text:
+        stacked = pd.concat([columns[names[i]].astype(str) for i in text], ignore_index=True)
+        parsed = pd.to_numeric(stacked.str.replace(NON_NUMERIC, '', regex=True), errors='coerce')
+        block[:, text] = parsed.to_numpy(dtype=dtype, na_value=np.nan).reshape(len(text), n).T
+
+    # Column means over present values, all-missing columns stay missing
+    missing = np.isnan(block)
+    counts = n - missing.sum(axis=0)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        means = np.nansum(block, axis=0) / counts
+    np.copyto(block, np.broadcast_to(means, block.shape).astype(dtype), where=missing)
+
+    return pd.DataFrame(block, columns=names, copy=False)
 
 
 def parse_wdir(arr):
     """ Parse the wind direction column to -1, 0, 1 """
-    pd.set_option('chained_assignment', None)
     pos = ['Out to RF','Out to CF','Out to LF']
     neg = ['In from LF','In from RF','In from CF']
-    arr[~arr.isin(pos + neg)] = 0
-    arr[arr.isin(pos)] = 1
-    arr[arr.isin(neg)] = -1
-    return arr.astype(float)
+    return pd.Series(
+        np.select([arr.isin(pos), arr.isin(neg)], [1., -1.], 0.),
+        index=arr.index
+    )
+
+
+def key_codes(left, right):
+    """ Integer codes for one join key on both sides. Equal values
+        get equal codes and missing values get -1, so missing matches
+        missing the way merge does. Categoricals sharing a dtype use
+        their codes as is. Returns both code arrays and the number
+        of distinct values
+    """
+    if isinstance(left.dtype, pd.CategoricalDtype) and left.dtype == right.dtype:
+        return left.cat.codes.to_numpy(), right.cat.codes.to_numpy(), len(left.cat.categories)
+    codes, uniques = pd.factorize(pd.concat([left, right], ignore_index=True))
+    return codes[:len(left)], codes[len(left):], len(uniques)
+
+
+class JoinPlan(object):
+    """ Left-deep join of tables onto a base table, kept as row
+        positions into each table instead of a wide frame. A join
+        only works on integer key codes, columns are gathered once
+        at the end, and the result is the same as chaining merges
+    """
+
+    def __init__(self, name, base):
+        self.frames = {name: base}
+        self.rows = {name: np.arange(len(base))}
+        self.missing = {name: False}
+
+    def column(self, name, col):
+        """ Column of a joined table for the current rows, missing
+            where the table had no match and with the dtype a left
+            merge would have given it
+        """
+        values = self.frames[name][col].array
+        out = values.take(self.rows[name], allow_fill=True)
+        if self.missing[name]:
+            out = out.astype(values.take(np.array([-1]), allow_fill=True).dtype)
+        return pd.Series(out, name=col)
+
+    def join(self, name, frame, left_on, right_on, how='left', missing=None):
+        """ Join frame as name where the left_on series, aligned with
+            the current rows, equal the right_on columns. Unique keys
+            are looked up through an index, repeated ones go through a
+            merge of the key codes alone. missing overrides whether the
+            join had unmatched rows, for joins standing in for a left
+            merge followed by a filter
+        """
+        left = np.zeros(len(left_on[0]), dtype=np.int64)
+        right = np.zeros(len(frame), dtype=np.int64)
+        for left_key, right_col in zip(left_on, right_on):
+            left_codes, right_codes, size = key_codes(left_key, frame[right_col])
+            left = left * (size + 1) + left_codes + 1
+            right = right * (size + 1) + right_codes + 1
+
+        index = pd.Index(right)
+        if index.is_unique:
+            rows = np.arange(len(left))
+            pos = index.get_indexer(left)
+        else:
+            merged = pd.DataFrame({'key': left, 'row': np.arange(len(left))}).merge(
+                pd.DataFrame({'key': right, 'pos': np.arange(len(right))}),
+                on='key', how='left'
+            )
+            rows = merged['row'].to_numpy()
+            pos = merged['pos'].fillna(-1).to_numpy().astype(np.int64)
+
+        if missing is None:
+            missing = bool((pos == -1).any())
+        if how == 'inner':
+            keep = pos != -1
+            rows, pos = rows[keep], pos[keep]
+
+        for table in self.rows:
+            self.rows[table] = self.rows[table][rows]
+        self.frames[name] = frame
+        self.rows[name] = pos
+        self.missing[name] = missing
+
+    def gather(self, columns):
+        """ Dict of output name -> series for a dict of output name ->
+            (table, column) pairs
+        """
+        return dict((out, self.column(name, col)) for out, (name, col) in columns.items())
+
+    def take(self, name):
+        """ Current rows of a table that matched every join, taken
+            block-wise instead of column by column
+        """
+        return self.frames[name].take(self.rows[name]).reset_index(drop=True)
+
+
+def unmatched(left, right):
+    """ Whether any left key value is missing from right """
+    left_codes, right_codes, _ = key_codes(left, right)
+    return bool((~np.isin(left_codes, right_codes)).any())
+
+
+def output_sources(columns):
+    """ Map output columns to the (table, column) they are gathered
+        from: a dfs column, or a joined table's column plus suffix
+    """
+    suffixes = sorted(JOINED_SUFFIXES.items(), key=lambda kv: -len(kv[1]))
+    sources = dict()
+    for col in columns:
+        if col in JOIN_COLUMNS['dfs']:
+            sources[col] = ('dfs', col)
+            continue
+        for table, suffix in suffixes:
+            if col.endswith(suffix):
+                sources[col] = (table, col[:-len(suffix)])
+                break
+        else:
+            raise Exception("No source table for column %s" % col)
+    return sources
 
 
 def flatten_batters(data):
-    """ Main execution of this script, the code
-        isn't very clean or structured but this just needs
-        to work for now.
+    """ Main execution of this script. The tables are joined as a
+        plan of row positions on integer keys with filters applied
+        inside the joins, then only the columns kept are gathered.
+        Time and rows of the merge, clean and target join are recorded
+        in the run metrics, and each phase is profiled with --profile
     """
+    metrics = shared_metrics()
+    phases = Phases('flatten_batters')
+    phases.start('extract')
+
     #######################################################
     # Extract and format data from dictionay
 
-    # Daily fantasy where row type is Hitter
+    # Daily fantasy where row type is Hitter, with the columns the
+    # joins key on computed once per row before any join
     dfs = data['dfs'].query('p_h == "H"')
+    dfs = dfs.assign(
+        # We only use team for park factors/weather, so find the "team" for where the game is being played
+        team_guru=np.where(dfs['h_a'] == 'h', dfs['team'], dfs['oppt']),
 
-    # Player link for batters
-    player_link = data['player_link'].astype({'fg_id': str})
-
-    # Player link for pitchers
-    player_link_pl = (
-        data['player_link']
-        .astype({'fg_id': str})
-        .add_suffix('_pl')
-    )
+        # Batter stats for home vs away are keyed H/A
+        h_a=dfs['h_a'].str.upper(),
 
-    # Team link
-    team_link = data['team_link']
+        # Adjust "hand" column to account for switch hitters
+        hand=np.where(
+            (dfs['hand'] == 'B') & (dfs['oppt_pitch_hand'] == 'L'),
+            'R',
+            np.where(
+                (dfs['hand'] == 'B') & (dfs['oppt_pitch_hand'] == 'R'),
+                'L',
+                dfs['hand']
+            )
+        ),
 
-    # Fangraphs batters - current stats
-    fg_batters = (
-        data['fg_batters']
-        .astype({'fg_id': str})
-        .add_suffix('_b')
+        # Parse date column
+        game_date=pd.to_datetime(dfs['game_date'].astype(str), format="%Y%m%d").dt.strftime('%Y-%m-%d')
     )
 
+    # Fangraphs ids as text, one categorical dtype shared by every
+    # table so joins on fg_id compare integer codes
+    fg_tables = [
+        'player_link', 'fg_batters', 'fg_batters_lhp', 'fg_batters_rhp', 'fg_batters_home',
+        'fg_batters_away', 'fg_pitchers_lhb', 'fg_pitchers_rhb', 'fg_batters_daily'
+    ]
+    fg_ids = dict((table, data[table]['fg_id'].astype(str)) for table in fg_tables)
+    fg_id_type = pd.CategoricalDtype(pd.unique(pd.concat(list(fg_ids.values())).dropna()))
+    fg = dict((table, data[table].assign(fg_id=fg_ids[table].astype(fg_id_type))) for table in fg_tables)
+
     # Fangraphs batters vs oppt pitching hand
-    fg_batters_hand = data['fg_batters_lhp'].assign(oppt_pitch_hand='L')
-    tmp = data['fg_batters_rhp'].assign(oppt_pitch_hand='R')
-    fg_batters_hand = (
-        fg_batters_hand
-        .append(tmp)
-        .astype({'fg_id': str})
-        .add_suffix('_bh')
-    )
+    fg_batters_hand = pd.concat([
+        fg['fg_batters_lhp'].assign(oppt_pitch_hand='L'),
+        fg['fg_batters_rhp'].assign(oppt_pitch_hand='R')
+    ])
 
     # Fangraphs batters home vs away
-    fg_batters_ha = data['fg_batters_home'].assign(h_a='H')
-    tmp = data['fg_batters_away'].assign(h_a='A')
-    fg_batters_ha = (
-        fg_batters_ha
-        .append(tmp)
-        .astype({'fg_id': str})
-        .add_suffix('_ha')
-    )
-
-    # Statcast batters
-    statcast_batters = data['statcast_batters'].add_suffix('_sc')
-
-    # Park factors
-    park_factor = data['park_factor'].add_suffix('_pf')
+    fg_batters_ha = pd.concat([
+        fg['fg_batters_home'].assign(h_a='H'),
+        fg['fg_batters_away'].assign(h_a='A')
+    ])
 
     # Fangraphs Pitchers vs oppt batting hand
-    fg_pitchers_hand = data['fg_pitchers_lhb'].assign(oppt_bat_hand='L')
-    tmp = data['fg_pitchers_rhb'].assign(oppt_bat_hand='R')
-    fg_pitchers_hand = (
-        fg_pitchers_hand
-        .append(tmp)
-        .astype({'fg_id': str})
-        .add_suffix('_ph')
+    fg_pitchers_hand = pd.concat([
+        fg['fg_pitchers_lhb'].assign(oppt_bat_hand='L'),
+        fg['fg_pitchers_rhb'].assign(oppt_bat_hand='R')
+    ])
+
+    # Park factors by side, only rows with a side can match a batter
+    park_factor = data['park_factor'].assign(side=lambda x: x['side'].str[:1])
+    park_factor = park_factor[park_factor['side'].notnull()]
+
+    # Fangraphs batters daily stats, with dates that can match a game
+    fg_batters_daily = fg['fg_batters_daily'].assign(game_date=lambda x:
+        pd.to_datetime(x['game_date'], format='%Y-%m-%d').dt.strftime('%Y-%m-%d')
     )
-
-    # Fangraphs batters daily stats
-    fg_batters_daily = (
-        data['fg_batters_daily']
-        .astype({'fg_id': str})
-        .add_suffix('_bd')
-    )
-
-    # Today's weather
-    weather_today = data['weather_today'].add_suffix('_wt')
+    fg_batters_daily = fg_batters_daily[fg_batters_daily['game_date'].notnull()]
 
 
     #######################################################
     # Merge tables together
     logging.info("Merging tables")
+    phases.start('merge')
+    tick = time.time()
 
-    df = (
-        # Use dfs as base table
-        dfs
+    # Use dfs as base table
+    plan = JoinPlan('dfs', dfs)
 
-        # Link to player ids for batter
-        .merge(player_link, on='mlb_id', how='left')
+    # Link to player ids for batter and for oppt pitcher
+    plan.join('player_link', fg['player_link'], [plan.column('dfs', 'mlb_id')], ['mlb_id'])
+    plan.join('player_link_pl', fg['player_link'], [plan.column('dfs', 'oppt_pitch_mlb_id')], ['mlb_id'])
 
-        # Link to player ids for oppt pitcher
-        .merge(player_link_pl, left_on='oppt_pitch_mlb_id', right_on='mlb_id_pl', how='left')
+    # Link to team mapping for park factors
+    plan.join('team_link', data['team_link'], [plan.column('dfs', 'team_guru')], ['team_guru'])
 
-        # We only use team for park factors/weather, so find the "team" for where the game is being played
-        .assign(team_guru=lambda x: np.where(
-            x['h_a'] == 'h',
-            x['team'],
-            x['oppt']
-        ))
+    # Base batter stats
+    fg_id = plan.column('player_link', 'fg_id')
+    plan.join('fg_batters', fg['fg_batters'], [fg_id], ['fg_id'])
 
-        # Link to team mapping for park factors
-        .merge(team_link, on='team_guru', how='left')
+    # Batter stats vs oppt pitch hand
+    plan.join('fg_batters_hand', fg_batters_hand,
+              [fg_id, plan.column('dfs', 'oppt_pitch_hand')], ['fg_id', 'oppt_pitch_hand'])
 
-        # Base batter stats
-        .merge(fg_batters, left_on='fg_id', right_on='fg_id_b', how='left')
+    # Batter stats for home vs away
+    plan.join('fg_batters_ha', fg_batters_ha,
+              [fg_id, plan.column('dfs', 'h_a')], ['fg_id', 'h_a'])
 
-        # Batter stats vs oppt pitch hand
-        .merge(fg_batters_hand, left_on=['fg_id', 'oppt_pitch_hand'],
-               right_on=['fg_id_bh', 'oppt_pitch_hand_bh'], how='left')
+    # Statcast batter stats
+    plan.join('statcast_batters', data['statcast_batters'], [plan.column('dfs', 'mlb_id')], ['mlb_id'])
 
-        # Batter stats for home vs away
-        .assign(h_a=lambda x: x['h_a'].str.upper())
-        .merge(fg_batters_ha, left_on=['fg_id', 'h_a'],
-               right_on=['fg_id_ha', 'h_a_ha'], how='left')
+    # Park factors for the batter's side only. Column types follow
+    # whether any park had no factors at all, as in a merge on team
+    team_park = plan.column('team_link', 'team_park')
+    plan.join('park_factor', park_factor,
+              [team_park, plan.column('dfs', 'hand')], ['team', 'side'], how='inner',
+              missing=unmatched(team_park, data['park_factor']['team']))
 
-        # Statcast batter stats
-        .merge(statcast_batters, left_on='mlb_id', right_on='mlb_id_sc', how='left')
+    # Get pitcher stats vs batters of the same hand
+    plan.join('fg_pitchers_hand', fg_pitchers_hand,
+              [plan.column('player_link_pl', 'fg_id'), plan.column('dfs', 'hand')],
+              ['fg_id', 'oppt_bat_hand'])
 
-        # Adjust "hand" column to account for switch hitters
-        .assign(hand=lambda x: np.where(
-            (x['hand'] == 'B') & (x['oppt_pitch_hand'] == 'L'),
-            'R',
-            np.where(
-                (x['hand'] == 'B') & (x['oppt_pitch_hand'] == 'R'),
-                'L',
-                x['hand']
-            )
-        ))
+    # Merge on today's weather
+    plan.join('weather_today', data['weather_today'], [plan.column('team_link', 'team_weather')], ['team'])
 
-        # Park factors by batter hand
-        .merge(park_factor, left_on='team_park', right_on='team_pf', how='left')
-        .assign(side_pf=lambda x: x['side_pf'].str[:1])
-        .query('side_pf == hand')
-
-        # Get pitcher stats vs batters of the same hand
-        .merge(fg_pitchers_hand, left_on=['fg_id_pl', 'hand'],
-               right_on=['fg_id_ph', 'oppt_bat_hand_ph'], how='left')
-        
-        # Parse date column
-        .assign(game_date=lambda x:
-            pd.to_datetime(x['game_date'].astype(str), format="%Y%m%d").dt.strftime('%Y-%m-%d')
-        )
+    # Gather only the columns used from here on
+    sources = output_sources(ID_COLS + ALL_FEATURES + ['dk_points', 'fd_points'])
+    for col in ['w_speed', 'w_dir', 'temp']:
+        sources[col + '_wt'] = ('weather_today', col)
+    sources['fg_id'] = ('player_link', 'fg_id')
+    columns = plan.gather(sources)
+    del plan
+    logging.info("Datasets merged, rows: %d", len(columns['game_date']))
+    merged = len(columns['game_date'])
+    metrics.record('merge', 'batters', rows_in=len(dfs), rows=merged, seconds=time.time() - tick)
 
-        # Merge on today's weather
-        .merge(weather_today, left_on='team_weather', right_on='team_wt', how='left')
-    )
-    logging.info("Datasets merged, rows: %d", df.shape[0])
 
-    
     #######################################################
     # Feature filtering, cleaning, and imputing
     logging.info("Cleaning feature columns")
+    phases.start('clean')
+    tick = time.time()
 
     # Assign weather columns for date < today and date == today
+    is_today = (columns['game_date'] == TODAY).to_numpy()
     for col in ['w_speed', 'w_dir', 'temp']:
-        df[col] = np.where(
-            df['game_date'] == TODAY,
-            df[col + '_wt'],
-            df[col]
-        )
+        columns[col] = pd.Series(np.where(
+            is_today,
+            columns[col + '_wt'],
+            columns[col]
+        ))
 
     # Parse w_dir column
-    df['w_dir'] = parse_wdir(df['w_dir'])
-
-    # List of feature columns we are interested in keeping
-    all_features = [
-        'age_b', 'bb_perc_b', 'k_perc_b', 'bb_k_b', 'obp_b', 'ld_perc_b', 'gb_perc_b', 'fb_perc_b',
-        'iffb_perc_b', 'ifh_perc_b', 'buh_perc_b', 'woba_b', 'wraa_b', 'wrc_b', 'spd_b',
-        'wrc_plus_b', 'wpa_b', 'o_swing_perc_b', 'z_swing_perc_b', 'swing_perc_b',
-        'o_contact_perc_b', 'z_contact_perc_b', 'contact_perc_b', 'zone_perc_b', 'f_strike_perc_b',
-        'swstr_perc_b', 'bsr_b', 'pull_perc_b', 'cent_perc_b', 'oppo_perc_b', 'soft_perc_b', 
-        'med_perc_b', 'hard_perc_b', 'bb_perc_bh', 'k_perc_bh', 'bb_k_bh', 'obp_bh', 'w_rc_bh',
-        'w_raa_bh', 'w_oba_bh', 'wrc_plus_bh', 'ld_perc_bh', 'gb_perc_bh', 'fb_perc_bh',
-        'iffb_perc_bh', 'ifh_perc_bh', 'buh_perc_bh', 'pull_perc_bh', 'cent_perc_bh',
-        'oppo_perc_bh', 'soft_perc_bh', 'med_perc_bh', 'hard_perc_bh', 'bb_perc_ha', 'k_perc_ha',
-        'bb_k_ha', 'obp_ha', 'w_rc_ha', 'w_raa_ha', 'w_oba_ha', 'wrc_plus_ha', 'ld_perc_ha',
-        'gb_perc_ha', 'fb_perc_ha', 'iffb_perc_ha', 'ifh_perc_ha', 'buh_perc_ha', 'pull_perc_ha',
-        'cent_perc_ha', 'oppo_perc_ha', 'soft_perc_ha', 'med_perc_ha', 'hard_perc_ha',
-        'max_hit_speed_sc', 'avg_hit_speed_sc', 'fbld_sc', 'gb_sc', 'max_distance_sc',
-        'avg_distance_sc', 'avg_hr_distance_sc', 'barrels_sc', 'brl_percent_sc', 'brl_pa_sc',
-        'ev95plus_sc', 'ev95percent_sc', 'fb_factor_pf', 'gb_factor_pf', 'ld_factor_pf',
-        'pu_factor_pf', 'factor_1b_pf', 'factor_2b_pf', 'factor_3b_pf', 'hr_factor_pf',
-        'runs_factor_pf', 'obp_ph', 'w_oba_ph', 'k_9_ph', 'bb_9_ph', 'k_bb_ph', 'hr_9_ph',
-        'k_perc_ph', 'bb_perc_ph', 'k_bb_perc_ph', 'whip_ph', 'x_fip_ph', 'fip_ph', 'ld_perc_ph',
-        'gb_perc_ph', 'fb_perc_ph', 'iffb_perc_ph', 'ifh_perc_ph', 'buh_perc_ph', 'pull_perc_ph',
-        'cent_perc_ph', 'oppo_perc_ph', 'soft_perc_ph', 'med_perc_ph', 'hard_perc_ph', 'temp',
-        'w_speed', 'w_dir', 'prior_adi'
-    ]
-
-    target_cols = [
-        'one_b_bd', 'two_b_bd', 'three_b_bd', 'hr_bd', 'rbi_bd', 'r_bd', 'bb_bd', 'hbp_bd',
-        'sb_bd', 'dk_points', 'fd_points'
-    ]
-
-    id_cols = [
-        'name_first_last', 'team', 'game_date', 'dk_pos', 'fd_pos', 'dk_salary', 'fd_salary'
-    ]
+    columns['w_dir'] = parse_wdir(columns['w_dir'])
 
-    # Clean all feature columns
-    for col in all_features:
-        df[col] = to_numeric(df[col])
+    # Clean all feature columns into one matrix
+    features = clean_numeric(columns, ALL_FEATURES)
+    ids = pd.DataFrame(dict((col, columns[col]) for col in ID_COLS + ['dk_points', 'fd_points', 'fg_id']))
+    del columns
 
     # Split into training and validation data
-    train = df[df['game_date'] != TODAY]
-    valid = df[df['game_date'] == TODAY]
-    del df
-
-    # Append on batters daily target columns
-    train = (
-        train
-        .merge(fg_batters_daily, left_on='fg_id', right_on='fg_id_bd', how='left')
-        .assign(game_date_bd=lambda x:
-            pd.to_datetime(x['game_date_bd'], format='%Y-%m-%d').dt.strftime('%Y-%m-%d')
-        )
-        .query('game_date == game_date_bd')
-    )
-
-    # Clean regression targets for training data, remove from valid
-    for col in target_cols:
-        train[col] = to_numeric(train[col])
-        valid[col] = np.nan
-
-    # Only keep interesting columns
-    train = train[id_cols + all_features + target_cols].reset_index(drop=True)
-    valid = valid[id_cols + all_features + target_cols].reset_index(drop=True)
-
-    logging.info("Features: %d", len(all_features))
+    phases.start('split')
+    train_ids = ids[~is_today].reset_index(drop=True)
+    train_features = features[~is_today].reset_index(drop=True)
+    valid = pd.concat([
+        ids.loc[is_today, ID_COLS].reset_index(drop=True),
+        features[is_today].reset_index(drop=True),
+        pd.DataFrame(np.nan, index=range(is_today.sum()), columns=TARGET_COLS)
+    ], axis=1)
+    del ids, features
+    metrics.record('clean', 'batters', rows=merged, features=len(ALL_FEATURES), seconds=time.time() - tick)
+
+    # Append on batters daily target columns, an exact join on
+    # (fg_id, game_date) keeping only games with a daily line.
+    # Column types follow whether any batter had no daily lines
+    phases.start('target_join')
+    tick = time.time()
+    plan = JoinPlan('train', train_ids)
+    plan.join('fg_batters_daily', fg_batters_daily,
+              [train_ids['fg_id'], train_ids['game_date']], ['fg_id', 'game_date'], how='inner',
+              missing=unmatched(train_ids['fg_id'], fg['fg_batters_daily']['fg_id']))
+    sources = dict((col, ('train', col)) for col in ['dk_points', 'fd_points'])
+    sources.update(output_sources([col for col in TARGET_COLS if col not in sources]))
+    targets = plan.gather(sources)
+    rows = plan.rows['train']
+    train_ids = plan.take('train')
+    del plan
+
+    # Clean regression targets for training data, valid has none
+    train = pd.concat([
+        train_ids[ID_COLS],
+        train_features.take(rows).reset_index(drop=True),
+        clean_numeric(targets, TARGET_COLS)
+    ], axis=1)
+    metrics.record('targets', 'batters_train', rows_in=len(train_features), rows=train.shape[0],
+                   seconds=time.time() - tick)
+    phases.stop()
+
+    logging.info("Features: %d", len(ALL_FEATURES))
     logging.info("Training examples: %d", train.shape[0])
+    memory_report('train', train)
+    memory_report('valid', valid)
 
     return train, valid
 
 
+def flatten_incremental(cfg, full=False):
+    """ Build the training rows of new and changed game dates only and
+        store each date as a partition of the batters_train output. A
+        date is rebuilt when its dfs or daily partitions change, and
+        every date when a rebuild_on table, the output columns or the
+        table layout changed. Features of a date are kept as they were
+        when it was built, and missing values are imputed with means
+        over the dates built in the same run
+    """
+    settings = cfg.get('flatten') or dict()
+    columns = table_columns()
+
+    # Season level tables, and what the stored rows were built from
+    season_tables = [table for table in columns if table not in DATE_TABLES]
+    with profiled('load'):
+        data = fetch.fetch_all(tables=season_tables, columns=columns)
+    inputs = {
+        'columns': ID_COLS + ALL_FEATURES + TARGET_COLS,
+        'tables': dict((table, fingerprint(data[table]))
+                       for table in settings.get('rebuild_on', []) if table in data)
+    }
+    manifest = None if full else fetch.get_manifest('batters_train')
+
+    # Game dates before today and the ETags of their partitions
+    dates = date_versions(fetch.list_versions(DATE_TABLES), TODAY)
+    if dates is None:
+        logging.warning("Game tables are not stored by date, rebuilding every date")
+        dates = dict()
+        manifest = None
+    rebuild, build, stale = plan_dates(manifest, inputs, dates)
+    logging.info("%s %d game dates, %d removed", "Rebuilding" if rebuild else "Building",
+                 len(build), len(stale))
+
+    # Only the partitions of the dates built, and today's for valid
+    days = set(to_date(day) for day in build + [TODAY])
+    with profiled('load'):
+        data.update(fetch.fetch_all(tables=DATE_TABLES, columns=columns, dates=days))
+    train, valid = flatten_batters(data)
+    if dates:
+        train = train[train['game_date'].isin(build)]
+
+    written = set()
+    with profiled('write'):
+        for day, part in train.groupby('game_date', sort=True):
+            fetch.write_output(part, 'batters_train', partition_name('game_date', to_date(day)))
+            written.add(day)
+
+    # Drop stored dates that now have no rows, or are not in the inputs
+    replaced = set(build) | set(stale)
+    stored = fetch.list_versions(['batters_train'], ('csv',), cfg['s3']['output_dir'])
+    fetch.delete_output([
+        key for key, _ in stored.get('batters_train', ('csv', []))[1]
+        if partition_date(key) is not None
+        and partition_date(key).strftime(DATE_FORMAT) not in written
+        and (rebuild or partition_date(key).strftime(DATE_FORMAT) in replaced)
+    ])
+
+    with profiled('write'):
+        fetch.write_output(valid, 'batters_valid')
+
+    # Record the inputs last, so a failed run is redone next time
+    built = dict() if rebuild else dict(
+        (day, versions) for day, versions in manifest['dates'].items() if day not in stale)
+    built.update((day, dates[day]) for day in build)
+    fetch.put_manifest('batters_train', {'inputs': inputs, 'dates': built})
+
+
 if __name__ == '__main__':
     os.chdir(os.path.dirname(os.path.realpath(__file__)))
     
     FORMAT = '[%(levelname)s %(asctime)s] %(message)s'
     logging.basicConfig(format=FORMAT, level=logging.INFO)
 
-    # Fetch data
-    data = fetch.fetch_all_csv()
-
-    # Flatten batter data
-    train, valid = flatten_batters(data)
-
-    # Write to S3
-    fetch.write_output(train, 'batters_train')
-    fetch.write_output(valid, 'batters_valid')
+    PARSER = argparse.ArgumentParser(description="Flatten batter tables for training")
+    PARSER.add_argument('--full', action='store_true',
+                        help="in incremental mode, rebuild every game date")
+    PARSER.add_argument('--profile', action='store_true',
+                        help="write cProfile and tracemalloc profiles of each phase to tmp_dir/profile")
+    ARGS = PARSER.parse_args()
+
+    CFG = get_config()
+    if ARGS.profile:
+        start_profiling(CFG, 'flatten')
+    try:
+        if (CFG.get('flatten') or dict()).get('incremental'):
+            flatten_incremental(CFG, ARGS.full)
+        else:
+            # Fetch data
+            columns = table_columns()
+            with profiled('load'):
+                data = fetch.fetch_all(tables=list(columns), columns=columns)
+
+            # Flatten batter data
+            train, valid = flatten_batters(data)
+
+            # Write to S3
+            with profiled('write'):
+                fetch.write_output(train, 'batters_train')
+                fetch.write_output(valid, 'batters_valid')
+    finally:
+        stop_profiling()
+
+    # Per-stage metrics of the run
+    write_metrics(CFG, 'flatten')
@@ -1,7 +1,6 @@
 import os
-import time
-import random
 import logging
+import argparse
 
 from scrapers.fangraphs import FanGraphsScraper
 from scrapers.rotoguru import RotoGuruScraper
@@ -9,82 +8,98 @@ from scrapers.statcast import StatcastScraper
 from scrapers.weather import WeatherScraper
 from scrapers.vegas import VegasScraper
 from scrapers.daily_fantasy import DailyFantasyScraper
-from util.config import get_config
-
-def scrape_fangraphs(table_cfg):
-    """ Run the fangraphs scraper against the table set """
+from util.config import get_config, season_table
+from util.jobs import Job, run_jobs
+from util.http import shared_client
+from util.metrics import shared_metrics, record_jobs, write_metrics
+from util.profiling import profile_jobs, start_profiling, stop_profiling
+
+def seasons(tables, season):
+    """ (table, info) pairs with the season filled in to each entry """
+    return [(table, season_table(info, season)) for table, info in tables.items()]
+
+def fangraphs_jobs(table_cfg, cfg):
+    """ Build fangraphs scraper jobs for the table set """
     FANGRAPHS_TABLES = table_cfg['fangraphs']
-    scraper = FanGraphsScraper()
+    scraper = FanGraphsScraper(cfg)
 
-    for table, info in FANGRAPHS_TABLES.items():
-        scraper.fetch(
+    return [
+        Job('fangraphs', table, scraper.fetch,
             url=info['url'],
             js_cmd=info['js_cmd'],
             filename=info['filename'],
             column_list=info['columns'],
-            table_name=table
-        )
-        time.sleep(random.randint(2, 8))
+            table_name=table,
+            partition=info.get('partition'))
+        for table, info in seasons(FANGRAPHS_TABLES, cfg['season'])
+    ]
 
-def scrape_rotoguru(table_cfg):
-    """ Run rotoguru scraper using account login """
+def rotoguru_jobs(table_cfg, cfg):
+    """ Build rotoguru scraper jobs using account login """
     ROTO_TABLES = table_cfg['rotoguru']
-    scraper = RotoGuruScraper()
+    scraper = RotoGuruScraper(cfg)
 
     LOGIN = get_config('accounts.yml')['rotoguru']
 
-    for table, info in ROTO_TABLES.items():
-        scraper.fetch(
+    return [
+        Job('rotoguru', table, scraper.fetch,
             url=info['url'] % (LOGIN['username'], LOGIN['password']),
             column_list=info['columns'],
-            table_name=table
-        )
+            table_name=table,
+            partition=info.get('partition'))
+        for table, info in seasons(ROTO_TABLES, cfg['season'])
+    ]
 
-def scrape_statcast(table_cfg):
-    """ Run statcast batters scraper """
+def statcast_jobs(table_cfg, cfg):
+    """ Build statcast batters scraper jobs """
     STAT_TABLES = table_cfg['statcast']
-    scraper = StatcastScraper()
+    scraper = StatcastScraper(cfg)
 
-    for table, info in STAT_TABLES.items():
-        scraper.fetch(
+    return [
+        Job('statcast', table, scraper.fetch,
             url=info['url'],
             column_list=info['columns'],
-            table_name=table
-        )
+            table_name=table,
+            source_keys=info.get('keys'))
+        for table, info in seasons(STAT_TABLES, cfg['season'])
+    ]
 
-def scrape_weather(table_cfg):
-    """ Run weather scrapers """
+def weather_jobs(table_cfg, cfg):
+    """ Build weather scraper jobs """
     WEATHER_TABLES = table_cfg['weather']
-    scraper = WeatherScraper()
+    scraper = WeatherScraper(cfg)
 
-    for table, info in WEATHER_TABLES.items():
-        scraper.fetch(
+    return [
+        Job('weather', table, scraper.fetch,
             url=info['url'],
-            table_name=table
-        )
+            table_name=table)
+        for table, info in seasons(WEATHER_TABLES, cfg['season'])
+    ]
 
-def scrape_vegas(table_cfg):
-    """ Run vegas line scrapers """
+def vegas_jobs(table_cfg, cfg):
+    """ Build vegas line scraper jobs """
     VEGAS_TABLES = table_cfg['vegas']
-    scraper = VegasScraper()
+    scraper = VegasScraper(cfg)
 
-    for table, info in VEGAS_TABLES.items():
-        scraper.fetch(
+    return [
+        Job('vegas', table, scraper.fetch,
             url=info['url'],
-            table_name=table
-        )
+            table_name=table)
+        for table, info in seasons(VEGAS_TABLES, cfg['season'])
+    ]
 
-def scrape_daily_fantasy(table_cfg):
-    """ Run daily fantasy services scraper """
+def daily_fantasy_jobs(table_cfg, cfg):
+    """ Build daily fantasy services scraper jobs """
     FANTASY_TABLES = table_cfg['daily_fantasy']
-    scraper = DailyFantasyScraper()
+    scraper = DailyFantasyScraper(cfg)
 
-    for table, info in FANTASY_TABLES.items():
-        scraper.fetch(
+    return [
+        Job('daily_fantasy', table, scraper.fetch,
             url=info['url'],
             column_list=info['columns'],
-            table_name=table
-        )
+            table_name=table)
+        for table, info in seasons(FANTASY_TABLES, cfg['season'])
+    ]
 
 if __name__ == '__main__':
     os.chdir(os.path.dirname(os.path.realpath(__file__)))
@@ -96,23 +111,55 @@ if __name__ == '__main__':
     FORMAT = '[%(levelname)s %(asctime)s] %(message)s'
     logging.basicConfig(format=FORMAT, level=logging.INFO)
 
-    # Load in table config
-    TABLE_CFG = get_config('tables.yml')
-
-    # Fangraphs
-    scrape_fangraphs(TABLE_CFG)
+    PARSER = argparse.ArgumentParser(description="Scrape every table to storage")
+    PARSER.add_argument('--profile', action='store_true',
+                        help="write cProfile and tracemalloc profiles of each table to tmp_dir/profile, "
+                             "jobs run one at a time")
+    ARGS = PARSER.parse_args()
 
-    # Rotoguru
-    scrape_rotoguru(TABLE_CFG)
+    # Load in table and concurrency config
+    TABLE_CFG = get_config('tables.yml')
+    CFG = get_config()
+    CONCURRENCY = CFG['concurrency']
+
+    # Every (source, table) pair is an independent job
+    jobs = (
+        fangraphs_jobs(TABLE_CFG, CFG)
+        + rotoguru_jobs(TABLE_CFG, CFG)
+        + statcast_jobs(TABLE_CFG, CFG)
+        + weather_jobs(TABLE_CFG, CFG)
+        + vegas_jobs(TABLE_CFG, CFG)
+        + daily_fantasy_jobs(TABLE_CFG, CFG)
+    )
+
+    # Profiles are per table, so profiled jobs run one at a time
+    max_workers = CONCURRENCY['max_workers']
+    if ARGS.profile:
+        start_profiling(CFG, 'scrape')
+        profile_jobs(jobs)
+        max_workers = 1
+
+    # Run concurrently, slow fangraphs downloads overlap the rest
+    try:
+        jobs = run_jobs(
+            jobs,
+            max_workers=max_workers,
+            source_limits=CONCURRENCY['sources']
+        )
+    finally:
+        stop_profiling()
 
-    # Statcast
-    scrape_statcast(TABLE_CFG)
+    # Cache hits/misses and skipped uploads, then trim the cache
+    cache = shared_client(CFG).cache
+    if cache is not None:
+        cache.summary()
+        cache.evict()
 
-    # Weather
-    scrape_weather(TABLE_CFG)
+    failed = [job.name for job in jobs if job.error]
 
-    # Vegas
-    scrape_vegas(TABLE_CFG)
+    # Per-stage metrics of the run, written before failing
+    record_jobs(shared_metrics(), jobs)
+    write_metrics(CFG, 'scrape', failed_jobs=len(failed))
 
-    # Draftkings/Fanduels
-    scrape_daily_fantasy(TABLE_CFG)
+    if failed:
+        raise Exception("Failed jobs: %s" % ', '.join(failed))
@@ -1,21 +1,33 @@
 import abc
 import os
+import time
 import logging
-from io import StringIO
-import boto3
+import pandas as pd
 
 from util.config import get_config
+from util.throttle import shared_throttle
+from util.http import shared_client
+from util.metrics import shared_metrics
+from util.formats import storage_formats, encoded, EXTENSIONS
+from util.storage import get_storage
+from util.partitions import partition_name, partition_date, fetch_window, template_dates
 
 class BaseScraper(object):
     """ Abstract class for scraper object used to fetching
-        data from website and dumping into an s3 bucket
+        data from website and dumping into the configured storage,
+        an s3 bucket or a local directory
     """
     __metaclass__ = abc.ABCMeta
 
-    def __init__(self):
-        """ Default just initialize with the config file
+    def __init__(self, cfg=None):
+        """ Default just initialize with the config file, or the
+            given config, and the per-host throttle, HTTP client and
+            metrics collector shared by all scrapers
         """
-        self.cfg = get_config()
+        self.cfg = cfg or get_config()
+        self.throttle = shared_throttle(self.cfg)
+        self.http = shared_client(self.cfg)
+        self.metrics = shared_metrics()
 
     @abc.abstractmethod
     def fetch(self, **kwargs):
@@ -25,6 +37,37 @@ class BaseScraper(object):
         """
         pass
 
+    def wait_for_host(self, url):
+        """ Space out requests to the url's host as configured
+            in the politeness section of the config file
+        """
+        return self.throttle.wait(url)
+
+    def request(self, method, url, table_name, throttle=True, **kwargs):
+        """ Make a request through the shared HTTP client, throttled
+            unless it follows up one that was, like a form's POST after
+            its GET. Transfer stats are recorded under the table name
+        """
+        if throttle:
+            self.wait_for_host(url)
+        resp = self.http.request(method, url, label=table_name, **kwargs)
+        self.metrics.record('fetch', table_name, bytes=len(resp.body), wire_bytes=resp.wire_bytes,
+                            ttfb=resp.ttfb, seconds=resp.elapsed, cached=int(resp.from_cache))
+        return resp
+
+    def get(self, url, table_name):
+        """ GET url and return the response body bytes """
+        return self.request('GET', url, table_name).body
+
+    def timed_parse(self, table_name, parser, *args):
+        """ Run a parser returning a dataframe, its time and row
+            count are recorded under the table name
+        """
+        with self.metrics.timed('parse', table_name) as stage:
+            df = parser(*args)
+            stage['rows'] = len(df)
+        return df
+
     @staticmethod
     def validate_target(file_path):
         """ Shared static method for verifying a target's
@@ -37,24 +80,86 @@ class BaseScraper(object):
         if os.path.exists(FULL_PATH):
             os.remove(FULL_PATH)
 
-    def load_to_s3(self, df, table_name):
-        """ Write a dataframe to s3 bucket as a csv file
+    def stored_partitions(self, table_name):
+        """ Dates of the table's partitions in storage, oldest first """
+        PREFIX = '%s/%s/' % (self.cfg['s3']['data_dir'], table_name)
+
+        dates = set()
+        for prefix in get_storage(self.cfg).list_dirs(PREFIX):
+            day = partition_date(prefix)
+            if day is not None:
+                dates.add(day)
+        return sorted(dates)
+
+    def partition_window(self, url, table_name, partition):
+        """ Dates a partitioned table should be fetched for and the url
+            templated with them. In incremental mode the window starts
+            at the newest stored partition, otherwise it covers the
+            whole range in tables.yml
         """
-        # Write to csv in memory buffer
-        csv_buffer = StringIO()
-        df.to_csv(csv_buffer, index=False)
+        last = None
+        if self.cfg.get('incremental', True):
+            stored = self.stored_partitions(table_name)
+            last = stored[-1] if stored else None
 
-        # Create s3 interface from config
-        BUCKET = self.cfg['s3']['bucket']
+        start, end = fetch_window(partition, last)
+        logging.info("Fetching %s from %s to %s", table_name, start or 'first game', end)
+        return start, end, template_dates(url, start, end, table_name)
+
+    def load_partitions(self, df, table_name, partition, start=None, end=None):
+        """ Split a dataframe by the partition date column and load
+            each date between start and end as its own object
+        """
+        column = partition['column']
+        days = pd.to_datetime(df[column].astype(str), format=partition.get('format')).dt.date
+
+        keep = days.notnull()
+        if start is not None:
+            keep &= days >= start
+        if end is not None:
+            keep &= days <= end
+
+        groups = df[keep].groupby(days[keep], sort=True)
+        logging.info("Loading %d partitions of %s", groups.ngroups, table_name)
+        for day, part in groups:
+            self.load_to_s3(part, table_name, partition_name(column, day))
+
+    def load_to_s3(self, df, table_name, partition=None):
+        """ Stream a dataframe to storage in each configured storage
+            format, compressed as configured, skipping any upload that
+            matches the last one made from here. A partition name puts
+            the object in that subdirectory of the table
+        """
+        # Storage location from config
         DIR = self.cfg['s3']['data_dir']
+        COMPRESSION = self.cfg['s3'].get('compression')
+
+        # Each call gets its own client, scrapers run on worker threads
+        storage = get_storage(self.cfg)
+        cache = self.http.cache
+
+        for fmt in storage_formats(self.cfg):
+            # Partitioned tables use a hive structure, one
+            # directory per date, others overwrite one file
+            TARGET_FILE = os.path.join(DIR, table_name, partition or '', table_name + EXTENSIONS[fmt])
+
+            with encoded(df, fmt, COMPRESSION) as (body, content_hash, extra_args):
+                # Skip tables whose content has not changed since last upload
+                target = '%s/%s' % (storage.name, TARGET_FILE)
+                if cache is not None and not cache.should_upload(target, content_hash):
+                    logging.info("Unchanged, skipping upload to %s", target)
+                    self.metrics.record('upload', table_name, format=fmt, skipped=1)
+                    continue
 
-        # This line can be changed to include timestamps
-        # in the file name if you wish to store file versions
-        # using a hive structure. For now overwriting one file is fine
-        TARGET_FILE = os.path.join(DIR, table_name, table_name + '.csv')
+                # Size of the encoded body, then back to its start
+                size = body.seek(0, os.SEEK_END)
+                body.seek(0)
 
-        # Load
-        logging.info("Loading to S3 bucket %s/%s", BUCKET, TARGET_FILE)
+                logging.info("Loading to %s", storage.url(TARGET_FILE))
+                tick = time.time()
+                storage.upload(body, TARGET_FILE, extra_args)
+                self.metrics.record('upload', table_name, format=fmt, bytes=size,
+                                    rows=len(df), seconds=time.time() - tick)
 
-        s3 = boto3.resource('s3')
-        s3.Object(BUCKET, TARGET_FILE).put(Body=csv_buffer.getvalue())
+            if cache is not None:
+                cache.uploaded(target, content_hash)
@@ -1,7 +1,7 @@
 import logging
 from io import StringIO
-from urllib.request import urlopen
 
+import numpy as np
 import pandas as pd
 
 from scrapers.base import BaseScraper
@@ -20,8 +20,17 @@ class DailyFantasyScraper(BaseScraper):
         """
         logging.info("Downloading %s from url", table_name)
 
-        # GET -> memory buffer
-        text = urlopen(url).read().decode('latin1')
+        # GET -> string
+        text = self.get(url, table_name).decode('latin1')
+
+        # string -> dataframe
+        df = self.timed_parse(table_name, self.parse_page, text, column_list)
+
+        # dataframe -> s3
+        self.load_to_s3(df, table_name)
+
+    def parse_page(self, text, column_list):
+        """ Parse the semicolon separated table out of the page """
         a = text.find('semicolons(;)</P><hr><P>') + 24
         text = text[a:]
         a = text.find('<hr><center>Statistical')
@@ -33,13 +42,9 @@ class DailyFantasyScraper(BaseScraper):
         df = pd.read_csv(text, sep=";", index_col=False)
         df.columns = column_list
         df['p_h'] = self.parse_pos(df['p_h'])
-
-        # dataframe -> s3
-        self.load_to_s3(df, table_name)
+        return df
 
     @staticmethod
     def parse_pos(x):
         """ Parse the position column to hitter or pitcher """
-        x[x!=1] = 'h'
-        x[x==1] = 'p'
-        return x
+        return pd.Series(np.where(x == 1, 'p', 'h'), index=x.index)
@@ -1,27 +1,192 @@
 import os
+import re
 import sys
-import time
+import queue
+import atexit
 import logging
+import threading
+from io import BytesIO
+from contextlib import contextmanager
+from html.parser import HTMLParser
+from urllib.parse import urljoin, urlencode
 
 import pandas as pd
 from pyvirtualdisplay import Display
 from selenium import webdriver
 
 from scrapers.base import BaseScraper
+from util.download import wait_for_download
 
 # Download timeout limit
 TIMEOUT = 600
 
+# Matches the postback target and argument in a tables.yml js_cmd
+POSTBACK = re.compile(r"__doPostBack\('([^']*)',\s*'([^']*)'\)")
+
+class FormParser(HTMLParser):
+    """ Collect the fields an ASP.NET form would submit: every named
+        input (hidden ones carry __VIEWSTATE/__EVENTVALIDATION) and
+        the selected option of every select, plus the form action.
+        Pages can have other forms, like a search box, so the form
+        holding __VIEWSTATE is the one used
+    """
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.forms = list()
+        self._form = None
+        self._select = None
+        self._first_option = None
+
+    @property
+    def form(self):
+        """ The ASP.NET form, else the first form on the page """
+        for form in self.forms:
+            if '__VIEWSTATE' in dict(form['fields']):
+                return form
+        return self.forms[0] if self.forms else {'action': None, 'fields': []}
+
+    @property
+    def action(self):
+        return self.form['action']
+
+    @property
+    def fields(self):
+        return self.form['fields']
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag == 'form':
+            self._form = {'action': attrs.get('action'), 'fields': list()}
+            self.forms.append(self._form)
+        elif self._form is None:
+            return
+        elif tag == 'input' and attrs.get('name'):
+            kind = (attrs.get('type') or 'text').lower()
+            if kind in ('submit', 'button', 'image', 'reset', 'file'):
+                return
+            if kind in ('checkbox', 'radio'):
+                if 'checked' not in attrs:
+                    return
+                # Browsers send "on" for a checked box without a value
+                self._form['fields'].append((attrs['name'], attrs.get('value') or 'on'))
+                return
+            self._form['fields'].append((attrs['name'], attrs.get('value') or ''))
+        elif tag == 'select':
+            self._select = attrs.get('name')
+            self._first_option = None
+        elif tag == 'option' and self._select:
+            value = attrs.get('value') or ''
+            if self._first_option is None:
+                self._first_option = value
+            if 'selected' in attrs:
+                self._form['fields'].append((self._select, value))
+                self._select = None
+
+    def handle_endtag(self, tag):
+        if tag == 'select' and self._select:
+            # Browsers submit the first option when none is selected
+            if self._first_option is not None:
+                self._form['fields'].append((self._select, self._first_option))
+            self._select = None
+        elif tag == 'form':
+            self._form = None
+
+class DriverPool(object):
+    """ Pool of long-lived chrome webdrivers. Each driver has its own
+        download directory so several downloads can run at once, and
+        is only restarted when a table fails on it
+    """
+
+    def __init__(self, size, download_root, log_path, adblock_path=None):
+        self.log_path = log_path
+        self.adblock_path = adblock_path
+        self.slots = queue.Queue()
+        self.drivers = dict()
+
+        for i in range(size):
+            download_dir = os.path.join(download_root, 'driver%d' % i)
+            if not os.path.exists(download_dir):
+                os.makedirs(download_dir)
+            self.drivers[download_dir] = None
+            self.slots.put(download_dir)
+
+        atexit.register(self.close)
+
+    def start(self, download_dir):
+        """ Start a chrome instance for the slot """
+        logging.info("Starting chrome driver for %s", download_dir)
+        self.drivers[download_dir] = FanGraphsScraper.create_driver(
+            download_dir, self.log_path, self.adblock_path)
+        return self.drivers[download_dir]
+
+    def stop(self, download_dir):
+        """ Quit the slot's chrome instance, ignoring a dead browser """
+        driver = self.drivers[download_dir]
+        self.drivers[download_dir] = None
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                logging.warning("Chrome driver for %s did not quit cleanly", download_dir)
+
+    @contextmanager
+    def driver(self):
+        """ Borrow a warm driver and its download directory, blocking
+            until one is free. The driver is restarted if the caller
+            raises while using it
+        """
+        download_dir = self.slots.get()
+        try:
+            driver = self.drivers[download_dir] or self.start(download_dir)
+            try:
+                yield driver, download_dir
+            except Exception:
+                logging.warning("Restarting chrome driver for %s", download_dir)
+                self.stop(download_dir)
+                raise
+        finally:
+            self.slots.put(download_dir)
+
+    def close(self):
+        """ Quit every running driver """
+        for download_dir in list(self.drivers):
+            self.stop(download_dir)
+
+
+# Driver pool shared by every FanGraphsScraper in the process
+_SHARED_POOL = None
+_SHARED_POOL_LOCK = threading.Lock()
+
+
 class FanGraphsScraper(BaseScraper):
     """ This class utilizes the selenium webdriver
         along with chromium webdriver to directly
         download data from javascript calls
     """
 
-    def __init__(self):
+    def __init__(self, cfg=None):
         # Default filename upon downloading a file
-        super(FanGraphsScraper, self).__init__()
-        self.create_display()
+        super(FanGraphsScraper, self).__init__(cfg)
+        self.mode = self.cfg['fangraphs'].get('mode', 'selenium')
+
+    @property
+    def pool(self):
+        """ Warm drivers shared by every table and every scraper
+            instance, the display and browsers are only started
+            once selenium is needed
+        """
+        global _SHARED_POOL
+        with _SHARED_POOL_LOCK:
+            if _SHARED_POOL is None:
+                self.create_display()
+                _SHARED_POOL = DriverPool(
+                    size=self.cfg['fangraphs']['drivers'],
+                    download_root=os.path.join(self.cfg['tmp_dir'], 'fangraphs'),
+                    log_path=self.cfg['chrome_log_path'],
+                    adblock_path=self.cfg['adblock_path']
+                )
+            return _SHARED_POOL
 
     @staticmethod
     def create_display():
@@ -31,14 +196,14 @@ class FanGraphsScraper(BaseScraper):
         display.start()
 
     @staticmethod
-    def create_driver(download_path, log_path, adblock_path=None):
+    def create_driver(download_dir, log_path, adblock_path=None):
         """ Create chrome webdriver specifying target directory
             for file downloads, logging directory, and optionally
             specifying path to an Adblock extension
         """
         options = webdriver.ChromeOptions()
         options.add_experimental_option("prefs", {
-            "download.default_directory": os.path.dirname(download_path),
+            "download.default_directory": download_dir,
             "download.prompt_for_download": False,
             "download.directory_upgrade": True,
             "safebrowsing.enabled": True
@@ -49,40 +214,104 @@ class FanGraphsScraper(BaseScraper):
             chrome_options=options,
             service_args=['--log-path=%s' % log_path])
 
-    def fetch(self, url, js_cmd, filename, column_list, table_name):
-        """ Download data from url by executing a javascript command
-            by saving to local file via selenium. Load that file into
-            memory, clean, then dump in s3 bucket
+    @staticmethod
+    def postback_form(html, url, js_cmd):
+        """ Build the form action and fields a browser would POST
+            when running the __doPostBack js_cmd on the page html
         """
-        tmp_file = os.path.join(self.cfg['tmp_dir'], filename)
-        self.validate_target(tmp_file)
+        match = POSTBACK.search(js_cmd)
+        if not match:
+            raise Exception("Not a postback command: %s" % js_cmd)
 
-        logging.info("Downloading %s to %s", table_name, tmp_file)
+        parser = FormParser()
+        parser.feed(html)
+        parser.close()
 
-        # Create driver
-        chrome_path = self.cfg['chrome_log_path']
-        adblock_path = self.cfg['adblock_path']
-        driver = self.create_driver(tmp_file, chrome_path, adblock_path)
+        fields = [(k, v) for k, v in parser.fields
+                  if k not in ('__EVENTTARGET', '__EVENTARGUMENT')]
+        if '__VIEWSTATE' not in dict(fields):
+            raise Exception("No __VIEWSTATE found on %s" % url)
+        fields += [('__EVENTTARGET', match.group(1)),
+                   ('__EVENTARGUMENT', match.group(2))]
 
-        # Download and wait for file
-        driver.get(url)
-        driver.execute_script(js_cmd)
+        action = urljoin(url, parser.action or url)
+        return action, fields
 
-        tick = time.time()
-        try:
-            while True:
-                time.sleep(1)
-                if os.path.exists(tmp_file):
-                    break
-                elif (time.time() - tick) > TIMEOUT:
-                    raise Exception("Download timed out")
-        finally:
-            driver.quit()
+    def fetch_http(self, url, js_cmd, table_name):
+        """ Replay the CSV export postback over plain HTTP and return
+            the raw CSV bytes
+        """
+        # GET the page for its form state and session cookie, the
+        # POST is part of the same export and shares its throttle slot
+        page = self.request('GET', url, table_name)
+        html = page.body.decode('utf-8', 'replace')
+        action, fields = self.postback_form(html, page.url, js_cmd)
 
-        # Read in downloaded data file
-        df = pd.read_csv(tmp_file)
+        # POST the export
+        body = self.request('POST', action, table_name, throttle=False,
+                            data=urlencode(fields).encode(),
+                            cookies=page.session_cookies).body
+        if body.lstrip()[:1] == b'<':
+            raise Exception("Export returned HTML instead of CSV")
+        return body
+
+    def fetch_selenium(self, url, js_cmd, filename, table_name):
+        """ Download the CSV by executing the javascript command in
+            a pooled browser and return the raw CSV bytes
+        """
+        with self.pool.driver() as (driver, download_dir):
+            tmp_file = os.path.join(download_dir, filename)
+            self.validate_target(tmp_file)
+
+            logging.info("Downloading %s to %s", table_name, tmp_file)
+
+            # Download and wait for file
+            self.wait_for_host(url)
+            driver.get(url)
+            driver.execute_script(js_cmd)
+            elapsed = wait_for_download(tmp_file, TIMEOUT)
+            logging.info("Downloaded %s in %.1fs", table_name, elapsed)
+
+            # Read in downloaded data file
+            with open(tmp_file, 'rb') as f:
+                body = f.read()
+            os.remove(tmp_file)
+        self.metrics.record('fetch', table_name, method='selenium', bytes=len(body), seconds=elapsed)
+        return body
+
+    @staticmethod
+    def parse_csv(body, column_list):
+        """ Read the exported CSV bytes with the table's columns """
+        df = pd.read_csv(BytesIO(body))
         df.columns = column_list
-        os.remove(tmp_file)
+        return df
+
+    def fetch(self, url, js_cmd, filename, column_list, table_name, partition=None):
+        """ Download data from url by replaying the export postback
+            over HTTP, or executing the javascript command in selenium
+            if HTTP mode is off or fails. Load that file into
+            memory, clean, then dump in s3 bucket. Game log tables
+            with a partition spec only fetch the dates not yet stored
+        """
+        if partition is not None:
+            start, end, url = self.partition_window(url, table_name, partition)
+
+        body = None
+        if self.mode == 'http':
+            logging.info("Downloading %s over HTTP", table_name)
+            try:
+                body = self.fetch_http(url, js_cmd, table_name)
+            except Exception:
+                logging.exception("HTTP export of %s failed, using selenium", table_name)
+
+        if body is None:
+            body = self.fetch_selenium(url, js_cmd, filename, table_name)
+
+        # Read in downloaded data file
+        df = self.timed_parse(table_name, self.parse_csv, body, column_list)
 
         # Transfer to S3
-        self.load_to_s3(df, table_name)
+        if partition is not None:
+            self.load_partitions(df, table_name, partition, start, end)
+        else:
+            self.load_to_s3(df, table_name)
@@ -1,6 +1,5 @@
 import logging
 from io import StringIO
-from urllib.request import urlopen
 
 import pandas as pd
 
@@ -13,19 +12,35 @@ class RotoGuruScraper(BaseScraper):
         fantasy stats
     """
     
-    def fetch(self, url, column_list, table_name):
+    def fetch(self, url, column_list, table_name, partition=None):
         """ Download flat datafile directly from URL, parse
-            into dataframe and dump in s3 bucket
+            into dataframe and dump in s3 bucket. The datafile
+            always holds the whole season, with a partition spec
+            only the dates not yet stored are loaded
         """
+        if partition is not None:
+            start, end, url = self.partition_window(url, table_name, partition)
+
         logging.info("Downloading %s from url", table_name)
 
-        # GET -> memory buffer
-        response = urlopen(url).read().decode('latin1')
-        data = StringIO(response[:response.find('\n*-ADI')])
+        # GET -> string
+        response = self.get(url, table_name).decode('latin1')
 
-        # memory buffer -> dataframe
-        df = pd.read_csv(data, sep=":", index_col=False)
-        df.columns = column_list
+        # string -> dataframe
+        df = self.timed_parse(table_name, self.parse_dump, response, column_list)
 
         # To s3
-        self.load_to_s3(df, table_name)
+        if partition is not None:
+            self.load_partitions(df, table_name, partition, start, end)
+        else:
+            self.load_to_s3(df, table_name)
+
+    @staticmethod
+    def parse_dump(text, column_list):
+        """ Parse the colon separated datafile, which ends where the
+            ADI notes start
+        """
+        data = StringIO(text[:text.find('\n*-ADI')])
+        df = pd.read_csv(data, sep=":", index_col=False)
+        df.columns = column_list
+        return df
@@ -1,39 +1,80 @@
+import json
 import logging
-from urllib.request import urlopen
 
 import pandas as pd
 
 from scrapers.base import BaseScraper
 
+# Javascript variable holding the leaderboard array
+DATA_MARKER = 'var leaderboard_data = '
+
 class StatcastScraper(BaseScraper):
 	""" This class uses urllib request to parse
 		data directly from a json-like variable
 		in javascript page to pandas and finally s3
 	"""
 
-	def fetch(self, url, column_list, table_name):
+	def fetch(self, url, column_list, table_name, source_keys=None):
 		""" Download data from webpage source json page
 			variable and dump in s3 as csv
 		"""
 		logging.info("Downloading %s from Statcast", table_name)
 
 		# GET -> string
-		text = urlopen(url).read().decode('latin1')
-		a = text.find("var leaderboard_data = [") + 25
-		text = text[a:]
-		a = text.find("}];")
-		text = text[:a]
-		text = text.replace('%','')
-		text = text.replace('null', '"null"')
-
-		# String -> list[list[str]]
-		data = text.split("},{")
-		data = [row.split(':')[1:] for row in data]
-		data = [list(map(lambda value: value.split('","')[0].replace('"', ''), row)) for row in data]
-
-		# list[list[str]] -> dataframe
-		df = pd.DataFrame(data)
-		df.columns = column_list
+		text = self.get(url, table_name).decode('latin1')
+
+		# string -> list[dict] -> dataframe
+		df = self.timed_parse(table_name, lambda: self.to_frame(
+			self.extract_records(text), column_list, source_keys))
 
 		# -> s3
-		self.load_to_s3(df, table_name)
\ No newline at end of file
+		self.load_to_s3(df, table_name)
+
+	@staticmethod
+	def extract_records(text):
+		""" Decode the leaderboard array embedded in the page. The
+			decoder stops at the end of the array, so nothing after
+			it is scanned or copied
+		"""
+		a = text.find(DATA_MARKER)
+		if a == -1:
+			raise Exception("No leaderboard data found on page")
+		records, _ = json.JSONDecoder().raw_decode(text, a + len(DATA_MARKER))
+		return records
+
+	@staticmethod
+	def to_frame(records, column_list, source_keys=None):
+		""" Build a dataframe selecting each column by its JSON key,
+			source_keys[i] being the key of column_list[i]. A key missing
+			from the page is an error. Without source_keys the keys of the
+			first record are matched to column_list by position, which
+			mislabels columns if the page reorders its keys
+		"""
+		if not records:
+			return pd.DataFrame(columns=column_list)
+
+		page_keys = list(records[0].keys())
+		if source_keys is None:
+			logging.warning("No keys configured, matching %d page keys to columns by position", len(page_keys))
+			source_keys = page_keys
+			if len(source_keys) != len(column_list):
+				raise Exception("Expected %d keys, page has %d: %s" % (
+					len(column_list), len(source_keys), ', '.join(source_keys)))
+		else:
+			missing = [key for key in source_keys if key not in records[0]]
+			if missing:
+				raise Exception("Keys missing from page: %s, page has %s" % (
+					', '.join(missing), ', '.join(page_keys)))
+
+		df = pd.DataFrame.from_records(records, columns=source_keys)
+		df.columns = column_list
+
+		# Percent strings -> numbers, other text columns are left alone
+		for col in df.columns:
+			if not pd.api.types.is_string_dtype(df[col]):
+				continue
+			values = df[col].str.rstrip('%')
+			numeric = pd.to_numeric(values, errors='coerce')
+			if numeric.notnull().sum() == values.notnull().sum():
+				df[col] = numeric
+		return df
@@ -1,10 +1,14 @@
 import logging
-from urllib.request import urlopen
 from datetime import datetime as dt
 
 import pandas as pd
 
 from scrapers.base import BaseScraper
+from util.cursor import TextCursor
+
+# Output columns in page order, today is added after parsing
+COLUMNS = ['team', 'oppo', 'line', 'moneyline', 'over_under',
+           'projected_runs', 'projected_runs_change']
 
 class VegasScraper(BaseScraper):
     """ This class downloads current Vegas lines from
@@ -18,56 +22,48 @@ class VegasScraper(BaseScraper):
         logging.info("Downloading %s from %s", table_name, url)
 
         # url -> string
-        body = urlopen(url).read().decode('latin1')
+        body = self.get(url, table_name).decode('latin1')
 
         # string -> dataframe
-        df = self.parse_js(body)
+        df = self.timed_parse(table_name, self.parse_js, body)
 
         # -> s3
         self.load_to_s3(df, table_name)
 
-    #######################################################
-    # All of the below methods were written a long time ago
-    # many code iterations ago. They are very tedious but they
-    # work so I have no motivation to clean them up and rewrite
-    #######################################################
+    def parse_js(self, body):
+        """ Parse rows of JSON-like data to proper pandas dataframe
+            format in a single forward pass over the page
+        """
+        cursor = TextCursor(body)
+        rows = list()
+
+        marker = cursor.index('time')
+        while marker != -1:
+            start = cursor.pos
+            cursor.skip('"team":"')
+            team = cursor.split('","')
+            cursor.skip('opponent":')
+            cursor.skip(' ')
+            oppo = cursor.split('","')
+            cursor.skip('line:":"')
+            line = cursor.split('","')
+            cursor.skip('moneyline":"')
+            moneyline = cursor.split('","')
+            cursor.skip('overunder":')
+            overunder = cursor.split(',"')
+            cursor.skip('projected":')
+            projected = cursor.split(',"')
+            cursor.skip('projectedchange')
+            cursor.skip('value":')
+            projected_change = cursor.split('}')
+            rows.append((team, oppo, line, moneyline, overunder, projected, projected_change))
 
-    @staticmethod
-    def split(txt, sub):
-        """ Split text into two strings based on substring """
-        a = txt.find(sub)
-        return txt[:a].strip(), txt[a+len(sub):]
+            # Guard against a page where the markers stop advancing
+            if cursor.pos == start:
+                break
+            if marker < cursor.pos:
+                marker = cursor.index('time')
 
-    def parse_js(self, body, df=pd.DataFrame()):
-        """ Recursively parse rows of JSON data to proper
-            pandas dataframe format
-        """
-        if body.find('time') == -1:
-            return df
-        _, body = self.split(body, '"team":"')
-        team, body = self.split(body, '","')
-        _, body = self.split(body, 'opponent":')
-        _, body = self.split(body, ' ')
-        oppo, body = self.split(body, '","')
-        _, body = self.split(body, 'line:":"')
-        line, body = self.split(body, '","')
-        _, body = self.split(body, 'moneyline":"')
-        moneyline, body = self.split(body, '","')
-        _, body = self.split(body, 'overunder":')
-        overunder, body = self.split(body, ',"')
-        _, body = self.split(body, 'projected":')
-        projected, body = self.split(body, ',"')
-        _, body = self.split(body, 'projectedchange')
-        _, body = self.split(body, 'value":')
-        projected_change, body = self.split(body, '}')
-        tmp = pd.DataFrame({
-            'team': team,
-            'oppo': oppo,
-            'line': line,
-            'moneyline': moneyline,
-            'over_under': overunder,
-            'projected_runs': projected,
-            'projected_runs_change': projected_change
-        }, index=[0])
-        tmp['today'] = dt.now().date()
-        return self.parse_js(body, df.append(tmp).reset_index(drop=True))
+        df = pd.DataFrame.from_records(rows, columns=COLUMNS)
+        df['today'] = dt.now().date()
+        return df
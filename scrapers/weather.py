@@ -1,11 +1,25 @@
 import logging
-from urllib.request import urlopen
 from datetime import datetime as dt
 
 import pandas as pd
 import numpy as np
 
 from scrapers.base import BaseScraper
+from util.cursor import TextCursor
+
+# Start of each game's block on the page
+GAME_MARKER = 'target="_blank" class="weather">'
+
+COL_NAMES = ['team','today','game_time','adi','temp','humidity','feels_like',
+             'w_condition','precip_perc','w_speed','w_dir']
+
+# Hours to add to a game time to get eastern time
+ZONE_OFFSETS = {'CDT': 1, 'MDT': 2, 'PDT': 3}
+
+# Wind gif name -> direction relative to the field
+W_DIR = {'s':'Out to CF', 'se':'Out to LF', 'sw':'Out to RF',
+         'n':'In from CF', 'ne':'In from RF', 'nw':'In from LF',
+         'w':'L to R', 'e':'R to L'}
 
 class WeatherScraper(BaseScraper):
     """ This class ingests a fairly complicated HTML page
@@ -20,37 +34,30 @@ class WeatherScraper(BaseScraper):
         logging.info("Downloading %s from %s", table_name, url)
 
         # url -> string
-        body = urlopen(url).read().decode('latin1')
+        body = self.get(url, table_name).decode('latin1')
 
         # string -> dataframe
-        df = self.parse_weather(body)
+        df = self.timed_parse(table_name, self.parse_weather, body)
 
         # -> s3
         self.load_to_s3(df, table_name)
 
-
-    #######################################################
-    # All of the below methods were written a long time ago
-    # many code iterations ago. They are very tedious but they
-    # work so I have no motivation to clean them up and rewrite
-    #######################################################
-
     @staticmethod
     def split(txt, sub):
         """ Split text into two strings based on substring """
         a = txt.find(sub)
         return txt[:a].strip(), txt[a+len(sub):]
 
-    def make_list(self, txt, start, end=''):
+    @staticmethod
+    def make_list(cursor, start, end=''):
         """ Make a list from HTML table row """
-        _, txt = self.split(txt, start)
-        _, txt = self.split(txt, '</td>')
+        cursor.skip(start)
+        cursor.skip('</td>')
         tmp_list = []
         for i in range(9):
-            _, txt = self.split(txt, '>')
-            t, txt = self.split(txt, '%s</td>' % end)
-            tmp_list.append(t)
-        return tmp_list, txt
+            cursor.skip('>')
+            tmp_list.append(cursor.split('%s</td>' % end))
+        return tmp_list
 
     @staticmethod
     def str2int(x):
@@ -59,105 +66,92 @@ class WeatherScraper(BaseScraper):
         return int(x[:a])
 
     @staticmethod
-    def parse_dome(tmp):
+    def parse_dome(row):
         """ Parse row stats if field has a dome """
-        tmp['precip_perc'] = 0
-        tmp['w_speed'] = 0
-        tmp['w_dir'] = 'N/A'
-        tmp['w_condition'] = 'Roof'
-        return tmp
-
-    def parse_weather(self, text, df=pd.DataFrame()):
-        """ Recursivley parse HTML table into dataframe """
-        if text.find('target="_blank" class="weather">') == -1:
-            return df
-        col_names = ['team','today','game_time','adi','temp','humidity','feels_like',
-                     'w_condition','precip_perc','w_speed','w_dir']  
-        _, text = self.split(text, 'target="_blank" class="weather">')
-        _, text = self.split(text, ' at ')
-        team, text = self.split(text, '\x96')
-        time, text = self.split(text, '-')
-
-        has_roof = False
-        is_dome = False
-        a = text.find('may neutralize some weather')
-        if (a < 500) & (a > -1):
-            has_roof = True
-        a = text.find('weather details are not relevant')
-        if (a < 500) & (a > -1):
-            is_dome = True
+        row['precip_perc'] = 0
+        row['w_speed'] = 0
+        row['w_dir'] = 'N/A'
+        row['w_condition'] = 'Roof'
+        return row
+
+    def parse_weather(self, text):
+        """ Parse HTML table into dataframe, walking the page once
+            and collecting one record per game
+        """
+        cursor = TextCursor(text)
+        today = dt.strftime(dt.now(), '%Y-%m-%d')
+
+        rows = []
+        while cursor.find(GAME_MARKER) != -1:
+            row = self.parse_game(cursor)
+            row['today'] = today
+            rows.append(row)
+
+        return pd.DataFrame.from_records(rows, columns=COL_NAMES)
+
+    def parse_game(self, cursor):
+        """ Parse the next game's weather block into a record """
+        cursor.skip(GAME_MARKER)
+        cursor.skip(' at ')
+        team = cursor.split('\x96')
+        time = cursor.split('-')
+
+        has_roof = cursor.find_within('may neutralize some weather', 500) != -1
+        is_dome = cursor.find_within('weather details are not relevant', 500) != -1
 
         if not is_dome:
-            _, text = self.split(text, 'Wind: <br>')
-            w_speed, text = self.split(text, '<br></td>')
+            cursor.skip('Wind: <br>')
+            w_speed = cursor.split('<br></td>')
 
-            _, text = self.split(text, '/weather/wind/')
-            _, text = self.split(text, '/')
-            w_dir, text = self.split(text, '.gif')
+            cursor.skip('/weather/wind/')
+            cursor.skip('/')
+            w_dir = cursor.split('.gif')
 
-            times, text = self.make_list(text, 'Time:')
-            temps, text = self.make_list(text, 'Temp:', '&deg;')
-            humid, text = self.make_list(text, 'Humidity:', '%')
-            feels, text = self.make_list(text, 'Feels like:', '&deg;')
-            conds, text = self.make_list(text, 'Condition:')
-            precp, text = self.make_list(text, 'Precip%:', '%')
-            winds, text = self.make_list(text, 'Wind:')
+            times = self.make_list(cursor, 'Time:')
+            temps = self.make_list(cursor, 'Temp:', '&deg;')
+            humid = self.make_list(cursor, 'Humidity:', '%')
+            feels = self.make_list(cursor, 'Feels like:', '&deg;')
+            conds = self.make_list(cursor, 'Condition:')
+            precp = self.make_list(cursor, 'Precip%:', '%')
+            winds = self.make_list(cursor, 'Wind:')
 
             a = time.find(':')
             game_time = int(time[:a])
             times = list(map(self.str2int, times))
-            time_match = np.where([x == game_time for x in times])[0]
-            if len(time_match) != 0:
-                idx = time_match[0]
-            else:
-                idx = 0
-
-            tmp = pd.DataFrame({'temp':temps[idx], 'humidity':humid[idx], 'feels_like':feels[idx],
-                                   'w_condition':conds[idx], 'precip_perc':precp[idx]}, index=[0])
+            idx = times.index(game_time) if game_time in times else 0
+
+            row = {'temp': temps[idx], 'humidity': humid[idx], 'feels_like': feels[idx],
+                   'w_condition': conds[idx], 'precip_perc': precp[idx]}
         else:
-            tmp = pd.DataFrame({'temp':80, 'humidity':50, 'feels_like':80, 
-                                    'w_condition':'Dome', 'precip_perc':0}, index=[0])
+            row = {'temp': 80, 'humidity': 50, 'feels_like': 80,
+                   'w_condition': 'Dome', 'precip_perc': 0}
 
         game_time, zone = self.split(time, ' ')
         game_time = float(game_time.replace(':','.'))
         if int(game_time) != 12:
             game_time += 12
-        if zone == 'CDT':
-            game_time += 1
-        elif zone == 'MDT':
-            game_time += 2
-        elif zone == 'PDT':
-            game_time += 3
+        game_time += ZONE_OFFSETS.get(zone, 0)
 
-        tmp['team'] = team
-        tmp['today'] = dt.strftime(dt.now(), '%Y-%m-%d')
-        tmp['game_time'] = game_time
+        row['team'] = team
+        row['game_time'] = game_time
+        row['adi'] = np.nan
 
         if not is_dome:
             _, w_speed = self.split(w_speed, ' ')
             w_speed, _ = self.split(w_speed, ' mph')
 
-            w_dir_dict = {'s':'Out to CF', 'se':'Out to LF', 'sw':'Out to RF',
-                          'n':'In from CF', 'ne':'In from RF', 'nw':'In from LF',
-                          'w':'L to R', 'e':'R to L'}
-
             if len(w_dir) == 3:
                 w_dir = w_dir[1:]
-            w_dir = w_dir_dict[w_dir]
 
-            tmp['adi'] = np.nan
-            tmp['w_speed'] = int(w_speed)
-            tmp['w_dir'] = w_dir
+            row['w_speed'] = int(w_speed)
+            row['w_dir'] = W_DIR[w_dir]
         else:
-            tmp['adi'] = np.nan
-            tmp['w_speed'] = 0
-            tmp['w_dir'] = 'N/A'
+            row['w_speed'] = 0
+            row['w_dir'] = 'N/A'
 
-        tmp = tmp[col_names]
         if team == 'San Francisco Giants':
             has_roof = True
         if has_roof:
-            tmp = self.parse_dome(tmp)
+            row = self.parse_dome(row)
 
-        df = df.append(tmp)
-        return self.parse_weather(text, df)
+        return row
@@ -0,0 +1,21 @@
+"""
+    Smoke test of the offline benchmark suite entry point
+"""
+import unittest
+
+from bench.suite import run_suite, compare
+
+
+class RunSuiteTest(unittest.TestCase):
+
+    def test_weather_stage(self):
+        results = run_suite(['weather_today'], repeat=1)
+        result = results['weather_today']
+        self.assertGreater(result['rows'], 0)
+        self.assertGreater(result['seconds'], 0)
+        self.assertIn(result['fixture'], ('recorded', 'synthetic'))
+        self.assertEqual(compare(results, {'weather_today': dict(result)}), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
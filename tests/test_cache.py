@@ -0,0 +1,51 @@
+"""
+    Eviction of the HTTP response cache by age and by size
+"""
+import os
+import time
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+
+from util.cache import ResponseCache
+
+
+class EvictTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def store(self, cache, url, size, days_ago):
+        """ Store a response last used days_ago days ago """
+        cache.store(url, SimpleNamespace(headers={'ETag': '"%s"' % url}, body=b'x' * size))
+        used = time.time() - days_ago * 86400
+        for ext in ('.json', '.body'):
+            os.utime(cache._path(url, ext), (used, used))
+
+    def test_max_age(self):
+        cache = ResponseCache(self.directory, max_age_days=14)
+        self.store(cache, 'http://x/old', 10, 20)
+        self.store(cache, 'http://x/new', 10, 1)
+        cache.evict()
+
+        self.assertIsNone(cache.lookup('http://x/old'))
+        self.assertIsNotNone(cache.lookup('http://x/new'))
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+
+    def test_max_bytes_least_recently_used(self):
+        cache = ResponseCache(self.directory, max_bytes=1500)
+        for i, days_ago in enumerate([3, 1, 2]):
+            self.store(cache, 'http://x/%d' % i, 1000, days_ago)
+        cache.evict()
+
+        self.assertIsNone(cache.lookup('http://x/0'))
+        self.assertIsNone(cache.lookup('http://x/2'))
+        self.assertIsNotNone(cache.lookup('http://x/1'))
+
+
+if __name__ == '__main__':
+    unittest.main()
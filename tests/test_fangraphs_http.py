@@ -0,0 +1,153 @@
+"""
+    FanGraphs CSV export over plain HTTP, against a local stand-in for
+    the leaderboard that serves the fixtures in tests/fixtures/fangraphs
+    and records every postback it receives
+"""
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+from scrapers.fangraphs import FanGraphsScraper
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'fixtures', 'fangraphs')
+JS_CMD = "__doPostBack('LeaderBoard1$cmdCSV','')"
+COLUMNS = ['name', 'team', 'age', 'fg_id']
+SESSION = 'ASP.NET_SessionId=x2bq4yk1'
+
+
+def fixture(name):
+    with open(os.path.join(FIXTURE_DIR, name), 'rb') as f:
+        return f.read()
+
+
+class LeaderboardHandler(BaseHTTPRequestHandler):
+    """ GET serves the leaderboard page with a session cookie, POST
+        records the form and replies with the CSV export, or with the
+        page again when the server is set to reply HTML
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self, body, content_type, headers=()):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for header in headers:
+            self.send_header(*header)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self.reply(fixture('leaderboard.html'), 'text/html; charset=utf-8',
+                   [('Set-Cookie', SESSION + '; path=/; HttpOnly')])
+
+    def do_POST(self):
+        length = int(self.headers['Content-Length'])
+        self.server.posts.append({
+            'path': self.path,
+            'cookie': self.headers.get('Cookie'),
+            'fields': parse_qs(self.rfile.read(length).decode(), keep_blank_values=True)
+        })
+        if self.server.reply_html:
+            self.reply(fixture('leaderboard.html'), 'text/html; charset=utf-8')
+        else:
+            self.reply(fixture('export.csv'), 'text/csv')
+
+
+class FetchHttpTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), LeaderboardHandler)
+        cls.server.posts = list()
+        cls.server.reply_html = False
+        cls.thread = threading.Thread(target=cls.server.serve_forever, daemon=True)
+        cls.thread.start()
+        cls.url = 'http://127.0.0.1:%d/leaders.aspx?pos=all&stats=bat&season=2018' % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.posts[:] = []
+        self.server.reply_html = False
+        self.tmp_dir = tempfile.mkdtemp()
+        self.scraper = FanGraphsScraper({
+            'tmp_dir': self.tmp_dir,
+            'fangraphs': {'mode': 'http', 'drivers': 1},
+            'http': {'timeout': 5, 'retries': 0},
+            'http_cache': {'enabled': False}
+        })
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir)
+
+    def test_postback_fields(self):
+        body = self.scraper.fetch_http(self.url, JS_CMD, 'fg_batters')
+        self.assertEqual(body, fixture('export.csv'))
+
+        post, = self.server.posts
+        fields = post['fields']
+        self.assertTrue(post['path'].startswith('/leaders.aspx?pos=all&stats=bat&lg=all'))
+        self.assertIn(SESSION, post['cookie'])
+        self.assertTrue(fields['__VIEWSTATE'][0].startswith('/wEPDwUKLTM2NzQ5NjU0OA9k'))
+        self.assertTrue(fields['__EVENTVALIDATION'][0].startswith('/wEdAAjV0wD2bB1i'))
+        self.assertEqual(fields['__VIEWSTATEGENERATOR'], ['C5A6F3A7'])
+        self.assertEqual(fields['__EVENTTARGET'], ['LeaderBoard1$cmdCSV'])
+        self.assertEqual(fields['__EVENTARGUMENT'], [''])
+
+        # Selected option, else the first, checked boxes and no buttons
+        self.assertEqual(fields['LeaderBoard1$ddlSeason'], ['2018'])
+        self.assertEqual(fields['LeaderBoard1$ddlPageSize'], ['30'])
+        self.assertEqual(fields['LeaderBoard1$chkAll'], ['on'])
+        self.assertNotIn('LeaderBoard1$chkRookie', fields)
+        self.assertNotIn('LeaderBoard1$btnUpdate', fields)
+        self.assertEqual(fields['LeaderBoard1$txtMinPA'], ['0'])
+
+        # Nothing from the search form in the page header
+        self.assertNotIn('lastname', fields)
+
+    def test_one_throttle_slot_per_export(self):
+        with mock.patch.object(self.scraper, 'wait_for_host') as wait, \
+                mock.patch.object(self.scraper.metrics, 'record') as record:
+            self.scraper.fetch_http(self.url, JS_CMD, 'fg_batters')
+
+        wait.assert_called_once_with(self.url)
+        tables = [call[0][1] for call in record.call_args_list if call[0][0] == 'fetch']
+        self.assertEqual(tables, ['fg_batters', 'fg_batters'])
+
+    def test_parse_export(self):
+        df = FanGraphsScraper.parse_csv(self.scraper.fetch_http(self.url, JS_CMD, 'fg_batters'), COLUMNS)
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(list(df['name']), ['Mike Trout', 'Mookie Betts', 'J.D. Martinez'])
+        self.assertEqual(list(df['fg_id']), [10155, 13611, 6184])
+
+    def test_html_reply_raises(self):
+        self.server.reply_html = True
+        with self.assertRaises(Exception) as raised:
+            self.scraper.fetch_http(self.url, JS_CMD, 'fg_batters')
+        self.assertIn('HTML instead of CSV', str(raised.exception))
+
+    def test_html_reply_falls_back_to_selenium(self):
+        self.server.reply_html = True
+        with mock.patch.object(self.scraper, 'fetch_selenium', return_value=fixture('export.csv')) as selenium, \
+                mock.patch.object(self.scraper, 'load_to_s3') as load:
+            self.scraper.fetch(self.url, JS_CMD, 'FanGraphs Leaderboard.csv', COLUMNS, 'fg_batters')
+
+        self.assertEqual(len(self.server.posts), 1)
+        selenium.assert_called_once_with(self.url, JS_CMD, 'FanGraphs Leaderboard.csv', 'fg_batters')
+        df, table_name = load.call_args[0]
+        self.assertEqual(table_name, 'fg_batters')
+        self.assertEqual(len(df), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
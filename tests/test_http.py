@@ -0,0 +1,67 @@
+"""
+    Retries of the shared HTTP client against a local server that
+    always answers 503
+"""
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from util.http import HttpClient
+
+
+class UnavailableHandler(BaseHTTPRequestHandler):
+    """ Count requests by method and answer 503 """
+
+    def log_message(self, *args):
+        pass
+
+    def reply(self):
+        self.server.methods.append(self.command)
+        self.send_response(503)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def do_GET(self):
+        self.reply()
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        self.reply()
+
+
+class RetryTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = HTTPServer(('127.0.0.1', 0), UnavailableHandler)
+        cls.server.methods = list()
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.url = 'http://127.0.0.1:%d/' % cls.server.server_port
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.methods[:] = []
+        self.client = HttpClient(timeout=5, retries=2, backoff=0.)
+
+    def test_get_is_retried(self):
+        with self.assertRaises(Exception):
+            self.client.request('GET', self.url)
+        self.assertEqual(self.server.methods, ['GET'] * 3)
+
+    def test_post_is_not_retried(self):
+        with self.assertRaises(Exception):
+            self.client.request('POST', self.url, data=b'a=1')
+        self.assertEqual(self.server.methods, ['POST'])
+
+    def test_post_retry_opt_in(self):
+        with self.assertRaises(Exception):
+            self.client.request('POST', self.url, data=b'a=1', retry=True)
+        self.assertEqual(self.server.methods, ['POST'] * 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
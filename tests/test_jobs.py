@@ -0,0 +1,39 @@
+"""
+    Job runner limits and jobs that can never be run
+"""
+import unittest
+from unittest import mock
+
+from util.jobs import Job, run_jobs
+
+
+class RunJobsTest(unittest.TestCase):
+
+    def jobs(self):
+        return [Job(source, table, lambda: None)
+                for source, table in [('fangraphs', 'a'), ('fangraphs', 'b'), ('weather', 'c')]]
+
+    def test_missing_source_defaults_to_one(self):
+        jobs = run_jobs(self.jobs(), max_workers=2, source_limits={'fangraphs': 2})
+        self.assertEqual([job.error for job in jobs], [None, None, None])
+        self.assertTrue(all(job.end is not None for job in jobs))
+
+    def test_limit_below_one_rejected(self):
+        for limit in (0, -1, '2'):
+            with self.assertRaises(Exception) as raised:
+                run_jobs(self.jobs(), source_limits={'fangraphs': 2, 'weather': limit})
+            self.assertIn('weather', str(raised.exception))
+
+    def test_jobs_never_run_fail(self):
+        class NoSlots(dict):
+            """ Limits that never free a slot for weather """
+            def get(self, source, default=None):
+                return 0 if source == 'weather' else 2
+
+        jobs = run_jobs(self.jobs(), source_limits=NoSlots(fangraphs=2))
+        self.assertEqual([job.error is None for job in jobs], [True, True, False])
+        self.assertIn('weather/c was never run', str(jobs[2].error))
+
+
+if __name__ == '__main__':
+    unittest.main()
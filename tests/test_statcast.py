@@ -0,0 +1,32 @@
+"""
+    Statcast leaderboard records to a dataframe, by JSON key
+"""
+import unittest
+
+from scrapers.statcast import StatcastScraper
+
+COLUMNS = ['name', 'mlb_id', 'brl_percent']
+KEYS = ['name', 'player_id', 'brl_percent']
+
+
+class ToFrameTest(unittest.TestCase):
+
+    def test_selects_by_key(self):
+        records = [{'player_id': 1, 'brl_percent': '5.5%', 'name': 'Trout, Mike', 'extra': 0}]
+        df = StatcastScraper.to_frame(records, COLUMNS, KEYS)
+        self.assertEqual(list(df.columns), COLUMNS)
+        self.assertEqual(df.iloc[0].tolist(), ['Trout, Mike', 1, 5.5])
+
+    def test_missing_key_raises(self):
+        with self.assertRaises(Exception):
+            StatcastScraper.to_frame([{'name': 'Trout, Mike', 'brl_percent': '5.5%'}], COLUMNS, KEYS)
+
+    def test_empty_leaderboard(self):
+        for keys in [KEYS, None]:
+            df = StatcastScraper.to_frame([], COLUMNS, keys)
+            self.assertEqual(list(df.columns), COLUMNS)
+            self.assertEqual(len(df), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
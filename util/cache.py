@@ -0,0 +1,166 @@
+"""
+    This module contains a local on-disk cache of raw HTTP responses
+    keyed by URL. It keeps each response's ETag/Last-Modified so the
+    next request can be conditional, and remembers the content hash
+    of every table uploaded so unchanged tables are not re-uploaded.
+    Entries not used for max_age_days, then the least recently used
+    ones over max_bytes, are evicted at the end of a run
+"""
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+
+
+def digest(data):
+    """ Content hash used for responses and uploads """
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    return hashlib.sha256(data).hexdigest()
+
+
+def remove_quietly(path):
+    """ Remove a file another thread may have removed already """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class ResponseCache(object):
+    """ Directory of <key>.json validators and <key>.body payloads,
+        the key is a hash of the URL so credentials in query strings
+        never end up on disk
+    """
+
+    def __init__(self, directory, max_bytes=None, max_age_days=None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self._lock = threading.Lock()
+        self.counts = dict(hits=0, misses=0, unchanged=0, uploads=0, skipped_uploads=0)
+
+    def _path(self, name, ext):
+        key = hashlib.sha1(name.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, key + ext)
+
+    def _write(self, path, data, mode='wb'):
+        """ Atomic write so a crashed run never leaves half a file """
+        tmp = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmp, mode) as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    def _count(self, name):
+        with self._lock:
+            self.counts[name] += 1
+
+    def lookup(self, url):
+        """ Return the stored validators for url, or None """
+        path = self._path(url, '.json')
+        if not (os.path.exists(path) and os.path.exists(self._path(url, '.body'))):
+            return None
+        with open(path, 'r') as f:
+            return json.load(f)
+
+    def conditional_headers(self, entry):
+        """ Request headers to revalidate a cached entry """
+        headers = dict()
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def hit(self, url):
+        """ Server said not modified, return the stored body """
+        self._count('hits')
+        path = self._path(url, '.body')
+        with open(path, 'rb') as f:
+            body = f.read()
+
+        # Touch for LRU ordering
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        return body
+
+    def store(self, url, resp):
+        """ Keep a fresh response and its validators """
+        self._count('misses')
+        entry = {
+            'etag': resp.headers.get('ETag'),
+            'last_modified': resp.headers.get('Last-Modified'),
+            'sha256': digest(resp.body)
+        }
+        old = self.lookup(url)
+        if old is not None and old['sha256'] == entry['sha256']:
+            self._count('unchanged')
+        self._write(self._path(url, '.body'), resp.body)
+        self._write(self._path(url, '.json'), json.dumps(entry), 'w')
+
+    def should_upload(self, target, content_hash):
+        """ True unless content_hash matches the last upload of target """
+        path = self._path('upload:' + target, '.json')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                if json.load(f)['sha256'] == content_hash:
+                    self._count('skipped_uploads')
+                    return False
+        return True
+
+    def uploaded(self, target, content_hash):
+        """ Record the content hash of a completed upload """
+        self._count('uploads')
+        self._write(self._path('upload:' + target, '.json'),
+                    json.dumps({'sha256': content_hash}), 'w')
+
+    def evict(self):
+        """ Remove entries, validators and body together, unused for
+            more than max_age_days, then the least recently used until
+            the cache is under max_bytes
+        """
+        with self._lock:
+            # key -> [last used, size, paths]
+            entries = dict()
+            for name in os.listdir(self.directory):
+                key, ext = os.path.splitext(name)
+                if ext not in ('.json', '.body'):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entry = entries.setdefault(key, [0., 0, list()])
+                entry[0] = max(entry[0], stat.st_mtime)
+                entry[1] += stat.st_size
+                entry[2].append(path)
+
+            entries = sorted(entries.values(), key=lambda entry: entry[0])
+            total = sum(size for _, size, _ in entries)
+            oldest = time.time() - self.max_age_days * 86400 if self.max_age_days else None
+            removed = 0
+            for used, size, paths in entries:
+                expired = oldest is not None and used < oldest
+                if not expired and (self.max_bytes is None or total <= self.max_bytes):
+                    break
+                for path in paths:
+                    remove_quietly(path)
+                total -= size
+                removed += 1
+
+        if removed:
+            logging.info("Response cache: evicted %d entries, %d bytes left", removed, total)
+
+    def summary(self):
+        """ Log hit/miss and upload counts for the run """
+        logging.info("Response cache: %d hits, %d misses (%d unchanged), "
+                     "%d uploads, %d skipped as unchanged",
+                     self.counts['hits'], self.counts['misses'], self.counts['unchanged'],
+                     self.counts['uploads'], self.counts['skipped_uploads'])
@@ -11,4 +11,17 @@ def get_config(path='config.yml'):
         raise Exception("Missing config file %s" % path)
 
     with open(path, 'r') as f:
-        return yaml.load(f)
+        return yaml.safe_load(f)
+
+def season_table(info, season):
+    """ Copy of a tables.yml entry with {season} filled in to its
+        url and partition date range
+    """
+    info = dict(info)
+    info['url'] = info['url'].replace('{season}', str(season))
+    if info.get('partition'):
+        info['partition'] = dict(
+            (k, v.replace('{season}', str(season)) if isinstance(v, str) else v)
+            for k, v in info['partition'].items()
+        )
+    return info
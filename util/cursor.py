@@ -0,0 +1,61 @@
+"""
+    This module contains a forward-only text cursor for the scrapers
+    that pick values out of raw HTML/javascript by searching for
+    marker substrings, without copying the rest of the page each step
+"""
+
+
+class TextCursor(object):
+    """ Position in a string that only moves forward. split behaves
+        exactly like the old split(txt, sub) helpers applied to the
+        remaining text, including when sub is missing
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+
+    def index(self, sub):
+        """ Absolute index of the next sub at or after the cursor,
+            or -1 if there is none
+        """
+        return self.text.find(sub, self.pos)
+
+    def find(self, sub):
+        """ Index of the next sub relative to the cursor, like
+            calling find on the remaining text
+        """
+        a = self.text.find(sub, self.pos)
+        return a if a == -1 else a - self.pos
+
+    def find_within(self, sub, limit):
+        """ Relative index of sub if it starts within limit characters
+            of the cursor, else -1. Avoids scanning the whole page for
+            a marker that only matters nearby
+        """
+        a = self.text.find(sub, self.pos, self.pos + limit + len(sub) - 1)
+        return a if a == -1 else a - self.pos
+
+    def split(self, sub):
+        """ Return the stripped text up to the next sub and move the
+            cursor past it
+        """
+        a = self.text.find(sub, self.pos)
+        if a == -1:
+            # Same as slicing the remaining text with index -1
+            value = self.text[self.pos:len(self.text) - 1]
+            self.pos = min(self.pos + len(sub) - 1, len(self.text))
+        else:
+            value = self.text[self.pos:a]
+            self.pos = a + len(sub)
+        return value.strip()
+
+    def skip(self, sub):
+        """ Move the cursor past the next sub, same as split
+            without building the skipped value
+        """
+        a = self.text.find(sub, self.pos)
+        if a == -1:
+            self.pos = min(self.pos + len(sub) - 1, len(self.text))
+        else:
+            self.pos = a + len(sub)
@@ -0,0 +1,109 @@
+"""
+    This module contains a download completion watcher used to find
+    out when a browser has finished writing a file. On linux it wakes
+    up on inotify events for the download directory, elsewhere it
+    falls back to a short stat based poll
+"""
+import os
+import sys
+import time
+import errno
+import select
+import logging
+import ctypes
+import ctypes.util
+
+# inotify event masks, see inotify(7)
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+
+# Suffix chrome uses while a download is in progress
+PARTIAL_SUFFIX = '.crdownload'
+
+
+class _Inotify(object):
+    """ Minimal ctypes wrapper around a single inotify watch """
+
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        if libc.inotify_add_watch(self.fd, directory.encode(), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(err, "inotify_add_watch failed")
+
+    def wait(self, timeout):
+        """ Block until an event arrives or timeout seconds pass,
+            the events themselves are drained and discarded
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if ready:
+            try:
+                while os.read(self.fd, 4096):
+                    pass
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+
+    def close(self):
+        os.close(self.fd)
+
+
+class _Poll(object):
+    """ Fallback watcher that just sleeps between stat calls """
+
+    def __init__(self, interval):
+        self.interval = interval
+
+    def wait(self, timeout):
+        time.sleep(min(self.interval, timeout))
+
+    def close(self):
+        pass
+
+
+def _watcher(directory, poll):
+    """ Use inotify where available, else the stat poll """
+    if sys.platform.startswith('linux'):
+        try:
+            return _Inotify(directory)
+        except (OSError, AttributeError):
+            logging.warning("inotify unavailable, polling %s", directory)
+    return _Poll(poll)
+
+
+def wait_for_download(path, timeout=600, settle=0.25, poll=0.1):
+    """ Block until path exists, chrome's partial file is gone and
+        the file size has not changed for settle seconds. Returns
+        the number of seconds waited, raises on timeout
+    """
+    tick = time.time()
+    watcher = _watcher(os.path.dirname(os.path.realpath(path)), poll)
+    try:
+        last_size, stable_since = None, None
+        while True:
+            now = time.time()
+            remaining = timeout - (now - tick)
+            if remaining <= 0:
+                raise Exception("Download timed out")
+
+            if os.path.exists(path) and not os.path.exists(path + PARTIAL_SUFFIX):
+                size = os.path.getsize(path)
+                if size != last_size:
+                    last_size, stable_since = size, now
+                elif size > 0 and now - stable_since >= settle:
+                    return now - tick
+
+                # Any write to the file wakes us up and resets the clock
+                watcher.wait(min(settle, remaining))
+            else:
+                last_size = None
+                watcher.wait(min(settle * 4, remaining))
+    finally:
+        watcher.close()
@@ -1,84 +1,268 @@
 """
     This module contains functions for fetching compiled
-    data from an S3 bucket
+    data from the configured storage, an S3 bucket or a local
+    directory with the same layout
 """
 from __future__ import division
 import os
+import json
+import time
 import logging
-from io import StringIO
 from datetime import datetime
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 
 from util.config import get_config
+from util.formats import format_of, deserialize, encoded, decode_content, EXTENSIONS
+from util.table_cache import table_cache
+from util.partitions import partition_date
+from util.manifest import MANIFEST_NAME
+from util.schema import table_plans, apply_plan, memory_report
+from util.storage import get_storage
+from util.metrics import shared_metrics
 
-def fetch_all_csv():
-    """ Fetches all .csv files from config'd s3 bucket 
+def fetch_all_csv(tables=None):
+    """ Fetches all .csv files from config'd storage 
         and returns in a dictionary of dataframes
     """
+    return fetch_all(tables=tables, formats=('csv',))
+
+def list_tables(storage, prefix, tables=None, formats=('parquet', 'csv')):
+    """ List table objects under prefix as table -> (format, objects)
+        where objects is a list of (key, etag) in key order, picked in
+        order of format preference. A partitioned table lists all of
+        its date partitions, and any unpartitioned copy left from
+        before it was partitioned is ignored. Only the tables' own
+        prefixes are listed when table names are given
+    """
+    prefixes = [prefix + '/']
+    if tables is not None:
+        prefixes = ['%s/%s/' % (prefix, table) for table in tables]
+
+    # table -> format -> partitioned -> [(key, etag)]
+    found = dict()
+    for table_prefix in prefixes:
+        for key, etag in storage.list(table_prefix):
+            fmt = format_of(key)
+            if fmt not in formats:
+                continue
+            table = os.path.basename(key)[:-len(EXTENSIONS[fmt])]
+            if tables is not None and table not in tables:
+                continue
+            partitioned = partition_date(key) is not None
+            found.setdefault(table, dict()).setdefault(fmt, dict()) \
+                 .setdefault(partitioned, list()).append((key, etag))
+
+    objects = dict()
+    for table, by_format in found.items():
+        fmt = min(by_format, key=formats.index)
+        keys = by_format[fmt].get(True) or by_format[fmt][False]
+        objects[table] = (fmt, sorted(keys))
+    return objects
+
+def list_versions(tables=None, formats=('parquet', 'csv'), data_dir=None):
+    """ Keys and ETags of the tables' objects as list_tables gives
+        them, without downloading anything
+    """
+    cfg = get_config()
+    return list_tables(get_storage(cfg), data_dir or cfg['s3']['data_dir'], tables, formats)
+
+def select_dates(objects, dates):
+    """ Keep the partitions of the given dates in a list_tables result,
+        and any unpartitioned object. A table with no partition left
+        keeps its first one and is returned in the set of tables to
+        load with no rows, so it still has its columns
+    """
+    selected, empty = dict(), set()
+    for table, (fmt, keys) in objects.items():
+        kept = [(key, etag) for key, etag in keys
+                if partition_date(key) is None or partition_date(key) in dates]
+        if not kept:
+            kept = keys[:1]
+            empty.add(table)
+        selected[table] = (fmt, kept)
+    return selected, empty
+
+def fetch_all(tables=None, columns=None, formats=('parquet', 'csv'), data_dir=None, dates=None):
+    """ Fetches tables from the data directory of config'd storage
+        and returns them in a dictionary of dataframes. tables limits
+        the load to those names, a table stored in several formats is
+        read in the first of formats, and columns can map table
+        name -> list of columns to read. Objects are downloaded and
+        parsed on a thread pool, unless the local table cache already
+        holds the listed ETag. Date partitioned tables come back as
+        one dataframe of all their partitions. data_dir defaults to
+        the configured one, backfilled seasons live under their own.
+        dates limits partitioned tables to the partitions of those days.
+        With dtypes enabled in the config each table is converted by
+        its dtype plan and the memory saved is logged
+    """
     cfg = get_config()
+    columns = columns or dict()
+    data_dir = data_dir or cfg['s3']['data_dir']
+    cache = table_cache(cfg)
+    storage = get_storage(cfg)
+
+    logging.info("Fetching %s files from %s", '/'.join(formats), storage.url(data_dir))
+    objects = list_tables(storage, data_dir, tables, formats)
+    empty = set()
+    if dates is not None:
+        objects, empty = select_dates(objects, dates)
 
-    # Target s3 bucket
-    s3 = boto3.resource('s3')
-    bucket = s3.Bucket(cfg['s3']['bucket'])
+    # One task per object, so partitions load in parallel too
+    tasks = [(table, key, etag) for table, (_, keys) in objects.items() for key, etag in keys]
 
-    logging.info("Fetching csv files from %s", cfg['s3']['bucket'])
+    def load(task):
+        """ GET and parse one object, logging size and timings """
+        table, key, etag = task
+        label = table if len(objects[table][1]) == 1 else key
+        return read_through(storage, cache, key, etag, objects[table][0],
+                            columns.get(table), label, table)
 
-    # Loop through and append all csv files as dataframe in dict
+    with ThreadPoolExecutor(max_workers=cfg['s3'].get('fetch_workers', 8)) as pool:
+        frames = list(pool.map(load, tasks))
+
+    parts = dict()
+    for (table, _, _), df in zip(tasks, frames):
+        parts.setdefault(table, list()).append(df)
     data = dict()
-    for obj in bucket.objects.all():
-        if 'output' in obj.key:
-            continue
-        if '.csv' in obj.key:
-            table = os.path.basename(obj.key)[:-4]
-            logging.info('  ' + table)
+    for table, dfs in parts.items():
+        data[table] = dfs[0] if len(dfs) == 1 else pd.concat(dfs, ignore_index=True)
+        if table in empty:
+            data[table] = data[table].iloc[:0]
 
-            # Load string-typed data into memory buffer
-            mem_buffer = StringIO(obj.get()['Body'].read().decode('latin1'))
+    # Categoricals and downcast numbers, after partitions are joined
+    # so they share one set of categories
+    settings = cfg.get('dtypes') or dict()
+    if settings.get('enabled'):
+        plans = table_plans(get_config('tables.yml'), cfg)
+        logging.info("Applying dtype plans")
+        for table in sorted(data):
+            df = apply_plan(data[table], plans.get(table), settings.get('float', 'float64'))
+            memory_report(table, data[table], df)
+            data[table] = df
 
-            # Parse to dataframe
-            data[table] = pd.read_csv(mem_buffer)
+    missing = set(tables or []) - set(data)
+    if missing:
+        logging.warning("Tables not found: %s", ', '.join(sorted(missing)))
+    if cache is not None:
+        cache.summary()
 
     return data
 
-def write_output(df, name):
-    """ Write a table to output folder in S3 bucket, indexed by date """
-    cfg = get_config()
+def read_through(storage, cache, key, etag, fmt, columns=None, label=None, table=None):
+    """ Load an object as a dataframe from the local cache when its
+        ETag is cached, else GET and parse it and fill the cache. The
+        load is recorded in the run metrics under table
+    """
+    label = label or key
+    metrics = shared_metrics()
+    tick = time.time()
+    if cache is not None:
+        df = cache.get(storage.name, key, etag, columns)
+        if df is not None:
+            logging.info("  %s (cached): load %.2fs, %d rows", label, time.time() - tick, df.shape[0])
+            metrics.record('load', table or label, format=fmt, cached=1,
+                           rows=df.shape[0], seconds=time.time() - tick)
+            return df
+
+    found = storage.get(key)
+    if found is None:
+        raise Exception("Missing object %s" % storage.url(key))
+    body = decode_content(*found)
+    tock = time.time()
 
-    # Target S3 bucket
-    bucket = cfg['s3']['bucket']
+    # The cache keeps the whole table so any projection can be served
+    if cache is not None:
+        df = deserialize(body, fmt)
+        cache.put(storage.name, key, etag, df)
+        if columns is not None:
+            wanted = set(columns)
+            df = df[[col for col in df.columns if col in wanted]]
+    else:
+        df = deserialize(body, fmt, columns)
+
+    tack = time.time()
+    logging.info("  %s (%s): %d bytes, get %.2fs, parse %.2fs, %d rows",
+                 label, fmt, len(body), tock - tick, tack - tock, df.shape[0])
+    metrics.record('load', table or label, format=fmt, cached=0, bytes=len(body), rows=df.shape[0],
+                   get_seconds=tock - tick, parse_seconds=tack - tock, seconds=tack - tick)
+    return df
+
+def write_output(df, name, partition=None):
+    """ Write a table to output folder in storage, indexed by date,
+        or as the given partition of the table
+    """
+    cfg = get_config()
     dirname = cfg['s3']['output_dir']
 
     # Create target filepath
-    today = datetime.now().strftime("%Y%m%d")
-    target_file = os.path.join(dirname, name, name + today + '.csv')
+    if partition is None:
+        today = datetime.now().strftime("%Y%m%d")
+        target_file = os.path.join(dirname, name, name + today + '.csv')
+    else:
+        target_file = os.path.join(dirname, name, partition, name + '.csv')
 
-    logging.info("Loading to S3 bucket %s/%s", bucket, target_file)
+    storage = get_storage(cfg)
+    logging.info("Loading to %s", storage.url(target_file))
 
-    # Write file to memory buffer
-    mem_buffer = StringIO()
-    df.to_csv(mem_buffer, index=False)
-
-    s3 = boto3.resource('s3')
-    s3.Object(bucket, target_file).put(Body=mem_buffer.getvalue())
+    # Stream compressed csv to a spooled file, then upload
+    with shared_metrics().timed('write', name, rows=len(df)) as stage:
+        with encoded(df, 'csv', cfg['s3'].get('compression')) as (body, _, extra_args):
+            stage['bytes'] = body.seek(0, os.SEEK_END)
+            body.seek(0)
+            storage.upload(body, target_file, extra_args)
 
 def get_todays_output(name):
-    """ Get output file matching name for today """
+    """ Get output file matching name for today. A table written by
+        incremental flatten has no dated file, one partition per game
+        date instead, and comes back as the union of its partitions
+    """
     cfg = get_config()
-
-    # Target s3 bucket
-    bucket = cfg['s3']['bucket']
     dirname = cfg['s3']['output_dir']
 
     # Target filepath
     today = datetime.now().strftime("%Y%m%d")
     target_file = os.path.join(dirname, name, name + today + '.csv')
 
-    logging.info("Fetching from S3 %s/%s", bucket, target_file)
+    storage = get_storage(cfg)
+    logging.info("Fetching from %s", storage.url(target_file))
+
+    # HEAD for the ETag, then load from the local cache if unchanged
+    etag = storage.etag(target_file)
+    if etag is not None:
+        return read_through(storage, table_cache(cfg), target_file, etag, 'csv', table=name)
+
+    _, keys = list_tables(storage, dirname, [name], ('csv',)).get(name, ('csv', []))
+    if not any(partition_date(key) is not None for key, _ in keys):
+        raise Exception("Missing output %s" % storage.url(target_file))
+    return fetch_all(tables=[name], formats=('csv',), data_dir=dirname)[name]
+
+def delete_output(keys):
+    """ Delete objects from storage by key """
+    keys = list(keys)
+    if not keys:
+        return
+    storage = get_storage(get_config())
+    logging.info("Deleting %d objects from %s", len(keys), storage.url(''))
+    storage.delete(keys)
 
-    # Load into memory buffer
-    s3 = boto3.resource('s3')
-    mem_buffer = StringIO(s3.Object(bucket, target_file).get()['Body'].read().decode('latin1'))
+def get_manifest(name):
+    """ Manifest stored with an output table, None if it has none """
+    cfg = get_config()
+    target_file = os.path.join(cfg['s3']['output_dir'], name, MANIFEST_NAME)
+
+    found = get_storage(cfg).get(target_file)
+    if found is None:
+        return None
+    return json.loads(found[0].decode('utf-8'))
+
+def put_manifest(name, manifest):
+    """ Store the manifest of an output table """
+    cfg = get_config()
+    target_file = os.path.join(cfg['s3']['output_dir'], name, MANIFEST_NAME)
 
-    # Return as dataframe
-    return pd.read_csv(mem_buffer)
+    storage = get_storage(cfg)
+    logging.info("Loading manifest to %s", storage.url(target_file))
+    storage.put(target_file, json.dumps(manifest, indent=1, sort_keys=True).encode('utf-8'),
+                'application/json')
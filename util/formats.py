@@ -0,0 +1,138 @@
+"""
+    This module contains the table storage formats: CSV, the original
+    text format, and Parquet, a typed columnar format that can be read
+    back with column projection. The format is set by s3.format in the
+    config, and both writes each table in both formats. CSV bodies are
+    streamed through gzip or zstd into a spooled file for upload, so
+    the full text is never held in memory
+"""
+import gzip
+import hashlib
+import tempfile
+from io import StringIO, BytesIO, TextIOWrapper, RawIOBase
+from contextlib import contextmanager
+
+import pandas as pd
+
+from util.schema import apply_schema
+
+EXTENSIONS = {'csv': '.csv', 'parquet': '.parquet'}
+
+# Encoded bodies stay in memory up to this size, then spill to disk
+SPOOL_BYTES = 16 * 1024 * 1024
+
+
+def storage_formats(cfg):
+    """ Formats to write tables in, from the config """
+    fmt = cfg['s3'].get('format', 'csv')
+    if fmt == 'both':
+        return ['csv', 'parquet']
+    if fmt not in EXTENSIONS:
+        raise Exception("Unknown storage format %s" % fmt)
+    return [fmt]
+
+
+def format_of(key):
+    """ Storage format of an object key from its extension """
+    for fmt, ext in EXTENSIONS.items():
+        if key.endswith(ext):
+            return fmt
+    return None
+
+
+class HashingWriter(RawIOBase):
+    """ Binary writer that hashes what passes through it on the
+        way to the wrapped file object
+    """
+
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.sha256 = hashlib.sha256()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.fileobj.write(data)
+        return len(data)
+
+
+def compressor(fileobj, compression):
+    """ Wrap fileobj in a streaming compressor, None for no compression """
+    if compression == 'gzip':
+        # Fixed mtime keeps the output identical for identical input
+        return gzip.GzipFile(fileobj=fileobj, mode='wb', mtime=0)
+    if compression == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().stream_writer(fileobj, closefd=False)
+    return None
+
+
+@contextmanager
+def encoded(df, fmt, compression=None):
+    """ Encode a dataframe in the given format into a spooled temp
+        file. Yields the file positioned at the start, the sha256 of
+        the uncompressed body, and S3 upload ExtraArgs. Only CSV is
+        compressed, Parquet already compresses its column chunks
+    """
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+        if fmt == 'csv':
+            stream = compressor(spool, compression)
+            writer = HashingWriter(stream or spool)
+            text = TextIOWrapper(writer, encoding='utf-8', newline='')
+            df.to_csv(text, index=False)
+            text.flush()
+            text.detach()
+            if stream is not None:
+                stream.close()
+            extra_args = {'ContentType': 'text/csv'}
+            if stream is not None:
+                extra_args['ContentEncoding'] = compression
+            content_hash = writer.sha256.hexdigest()
+        else:
+            apply_schema(df).to_parquet(spool, index=False)
+            extra_args = {'ContentType': 'application/octet-stream'}
+
+            # Parquet needs a seekable target, so hash it afterwards
+            spool.seek(0)
+            sha256 = hashlib.sha256()
+            for chunk in iter(lambda: spool.read(1024 * 1024), b''):
+                sha256.update(chunk)
+            content_hash = sha256.hexdigest()
+
+        spool.seek(0)
+        yield spool, content_hash, extra_args
+
+
+def decode_content(body, encoding):
+    """ Undo the Content-Encoding an object was uploaded with """
+    if encoding == 'gzip':
+        return gzip.decompress(body)
+    if encoding == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompressobj().decompress(body)
+    return body
+
+
+def deserialize(body, fmt, columns=None):
+    """ Decode an object body into a dataframe, reading only the
+        given columns if a list is passed. Missing columns are
+        ignored so one list can cover several table versions
+    """
+    if fmt == 'csv':
+        usecols = None
+        if columns is not None:
+            wanted = set(columns)
+            usecols = lambda col: col in wanted
+        return pd.read_csv(StringIO(body.decode('latin1')), usecols=usecols)
+
+    import pyarrow.parquet as pq
+
+    mem_buffer = BytesIO(body)
+    if columns is not None:
+        wanted = set(columns)
+        names = pq.read_schema(mem_buffer).names
+        columns = [col for col in names if col in wanted]
+        mem_buffer.seek(0)
+    return pq.read_table(mem_buffer, columns=columns).to_pandas()
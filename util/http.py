@@ -0,0 +1,253 @@
+"""
+    This module contains the HTTP client shared by the scrapers. It
+    keeps idle keep-alive connections per host, asks for gzip/deflate
+    and decodes it, applies a socket timeout, retries failed requests
+    with exponential backoff and records transfer stats per request.
+    With a response cache attached, GETs are made conditional
+"""
+import os
+import time
+import zlib
+import socket
+import logging
+import threading
+import http.client
+from http.cookies import SimpleCookie
+from urllib.parse import urlsplit, urljoin
+
+from util.cache import ResponseCache
+
+# Redirect codes and the most we follow for one request
+REDIRECTS = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+
+# Status codes worth another try, and the methods retried by default.
+# Others, like a form POST, may have been processed before failing
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_METHODS = ('GET', 'HEAD')
+
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) mlb-dfs-scrapers'
+
+
+class Response(object):
+    """ Fully read HTTP response plus its transfer stats """
+
+    def __init__(self, url, status, headers, body, wire_bytes, ttfb, elapsed):
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.wire_bytes = wire_bytes
+        self.ttfb = ttfb
+        self.elapsed = elapsed
+        self.from_cache = False
+
+    @property
+    def cookies(self):
+        """ Cookies set by the response as a dict """
+        jar = SimpleCookie()
+        for header in self.headers.get_all('Set-Cookie') or []:
+            jar.load(header)
+        return dict((k, v.value) for k, v in jar.items())
+
+
+def decode_body(body, encoding):
+    """ Undo a gzip or deflate Content-Encoding """
+    encoding = (encoding or '').lower()
+    if encoding == 'gzip':
+        return zlib.decompress(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        try:
+            return zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate without the zlib header
+            return zlib.decompress(body, -zlib.MAX_WBITS)
+    return body
+
+
+class HttpClient(object):
+    """ Thread safe HTTP client with a keep-alive connection pool
+        per (scheme, host, port)
+    """
+
+    def __init__(self, timeout=60, retries=3, backoff=1., pool_size=4, cache=None):
+        self.cache = cache
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.pool_size = pool_size
+        self.stats = list()
+        self._idle = dict()
+        self._lock = threading.Lock()
+
+    def _connect(self, scheme, netloc, fresh=False):
+        """ Take an idle connection for the host or open a new one,
+            always a new one if fresh
+        """
+        with self._lock:
+            idle = self._idle.get((scheme, netloc))
+            if idle and not fresh:
+                return idle.pop()
+        if scheme == 'https':
+            return http.client.HTTPSConnection(netloc, timeout=self.timeout)
+        return http.client.HTTPConnection(netloc, timeout=self.timeout)
+
+    def _release(self, scheme, netloc, conn):
+        """ Hand a connection back to the pool, or close it if full """
+        with self._lock:
+            idle = self._idle.setdefault((scheme, netloc), list())
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(self, method, url, body, headers, fresh=False):
+        """ Send one request on a pooled connection, or a new one if
+            fresh, and read the whole response
+        """
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        conn = self._connect(parts.scheme, parts.netloc, fresh)
+        tick = time.time()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            resp = conn.getresponse()
+            ttfb = time.time() - tick
+            raw = resp.read()
+        except Exception:
+            conn.close()
+            raise
+
+        if resp.will_close:
+            conn.close()
+        else:
+            self._release(parts.scheme, parts.netloc, conn)
+
+        return Response(
+            url=url,
+            status=resp.status,
+            headers=resp.msg,
+            body=decode_body(raw, resp.getheader('Content-Encoding')),
+            wire_bytes=len(raw),
+            ttfb=ttfb,
+            elapsed=time.time() - tick
+        )
+
+    def request(self, method, url, data=None, headers=None, cookies=None, label=None, retry=None):
+        """ Make a request following redirects, retrying connection
+            errors and retryable status codes with exponential backoff.
+            Only GET and HEAD are retried unless retry is set, as a
+            replayed POST could run twice. Raises on a final non-2xx
+            status
+        """
+        cookies = dict(cookies or {})
+        for redirect in range(MAX_REDIRECTS + 1):
+            req_headers = {
+                'User-Agent': USER_AGENT,
+                'Accept-Encoding': 'gzip, deflate',
+                'Connection': 'keep-alive'
+            }
+            if data is not None:
+                req_headers['Content-Type'] = 'application/x-www-form-urlencoded'
+            if cookies:
+                req_headers['Cookie'] = '; '.join('%s=%s' % kv for kv in cookies.items())
+            req_headers.update(headers or {})
+
+            # Revalidate a cached GET instead of downloading it again
+            entry = None
+            if self.cache is not None and method == 'GET':
+                entry = self.cache.lookup(url)
+                if entry is not None:
+                    req_headers.update(self.cache.conditional_headers(entry))
+
+            if retry if retry is not None else method in RETRY_METHODS:
+                resp = self._retry(method, url, data, req_headers)
+            else:
+                # A new connection, so a stale keep-alive one can't fail it
+                resp = self._send(method, url, data, req_headers, fresh=True)
+            cookies.update(resp.cookies)
+
+            if resp.status == 304 and entry is not None:
+                resp.status, resp.body, resp.from_cache = 200, self.cache.hit(url), True
+            elif self.cache is not None and method == 'GET' and resp.status == 200:
+                self.cache.store(url, resp)
+
+            if resp.status not in REDIRECTS:
+                break
+            url = urljoin(url, resp.headers['Location'])
+            if resp.status == 303 or (resp.status in (301, 302) and method == 'POST'):
+                method, data = 'GET', None
+        else:
+            raise Exception("Too many redirects for %s" % url)
+
+        if not 200 <= resp.status < 300:
+            raise Exception("HTTP %d for %s" % (resp.status, url))
+
+        # Cookies across the redirect chain, for callers keeping a session
+        resp.session_cookies = cookies
+
+        self.record(label or url, resp)
+        return resp
+
+    def _retry(self, method, url, data, headers):
+        """ Send with retries and exponential backoff """
+        for attempt in range(self.retries + 1):
+            last = attempt == self.retries
+            try:
+                resp = self._send(method, url, data, headers)
+            except (socket.timeout, OSError, http.client.HTTPException) as e:
+                if last:
+                    raise
+                logging.warning("Request to %s failed (%s), retrying", url, e)
+            else:
+                if resp.status not in RETRY_STATUS or last:
+                    return resp
+                logging.warning("HTTP %d from %s, retrying", resp.status, url)
+            time.sleep(self.backoff * 2 ** attempt)
+
+    def get(self, url, **kwargs):
+        """ GET a url and return the decoded body bytes """
+        return self.request('GET', url, **kwargs).body
+
+    def record(self, label, resp):
+        """ Keep and log the transfer stats of a request """
+        with self._lock:
+            self.stats.append({
+                'label': label,
+                'status': resp.status,
+                'bytes': len(resp.body),
+                'wire_bytes': resp.wire_bytes,
+                'ttfb': resp.ttfb,
+                'elapsed': resp.elapsed,
+                'cached': resp.from_cache
+            })
+        logging.info("Fetched %s: %d bytes (%d on the wire), first byte %.2fs, total %.2fs%s",
+                     label, len(resp.body), resp.wire_bytes, resp.ttfb, resp.elapsed,
+                     ' (not modified)' if resp.from_cache else '')
+
+
+# Client shared by every scraper in the process
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+def shared_client(cfg):
+    """ Return the process wide client, built from the http section
+        of the config on first use, with a response cache under
+        tmp_dir if http_cache is enabled
+    """
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            cache = None
+            settings = cfg.get('http_cache') or dict()
+            if settings.get('enabled'):
+                cache = ResponseCache(
+                    os.path.join(cfg['tmp_dir'], 'http_cache'),
+                    int(settings['max_mb']) * 1024 * 1024 if settings.get('max_mb') else None,
+                    settings.get('max_age_days')
+                )
+            _SHARED = HttpClient(cache=cache, **(cfg.get('http') or {}))
+        return _SHARED
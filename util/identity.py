@@ -0,0 +1,184 @@
+"""
+    This module matches player records between sources that don't
+    share an id, like dfs and statcast rows keyed by mlb_id against
+    fangraphs rows keyed by fg_id. Names are normalized, candidate
+    pairs come from a blocking index so only players with similar
+    names are compared, and pairs are scored with vectorized bigram
+    similarity, so the work grows with the number of players and not
+    with the product of the tables
+"""
+import numpy as np
+import pandas as pd
+
+# Name suffixes dropped before matching
+SUFFIXES = r'\s+(?:jr|sr|ii|iii|iv|v)$'
+
+# Characters of the last name shared by a block
+BLOCK_PREFIX = 4
+
+# Weights of the full, last and first name similarities, and of team
+# agreement against the name score
+NAME_WEIGHTS = (0.5, 0.3, 0.2)
+TEAM_WEIGHT = 0.15
+
+# Proposals below this confidence are dropped, and a proposal is
+# ambiguous when the runner up is within AMBIGUITY of it
+MIN_CONFIDENCE = 0.8
+AMBIGUITY = 0.05
+
+
+def flip_names(names):
+    """ Convert "Last, First" -> "First Last", other names unchanged """
+    return names.str.replace(r'^\s*([^,]+?)\s*,\s*(.+?)\s*$', r'\2 \1', regex=True)
+
+
+def normalize_names(names):
+    """ Dataframe of full, first and last name for a series of names:
+        "Last, First" flipped, accents, punctuation and suffixes
+        dropped, runs of initials joined, all lower case ascii
+    """
+    names = (
+        flip_names(names.astype(object).fillna('').astype(str))
+        .str.normalize('NFKD')
+        .str.encode('ascii', errors='ignore')
+        .str.decode('ascii')
+        .str.lower()
+        .str.replace(r"[.']", ' ', regex=True)
+        .str.replace(r'[^a-z ]+', ' ', regex=True)
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.strip()
+    )
+
+    # "j d martinez" -> "jd martinez", then drop a trailing suffix
+    names = names.str.replace(r'\b([a-z]) (?=[a-z]\b)', r'\1', regex=True)
+    names = names.str.replace(SUFFIXES, '', regex=True)
+
+    return pd.DataFrame({
+        'full': names,
+        'first': names.str.split(' ').str[0].fillna(''),
+        'last': names.str.split(' ').str[-1].fillna('')
+    }, index=names.index)
+
+
+def block_keys(names, prefix=BLOCK_PREFIX):
+    """ Blocking keys of normalized names, one series per pass: the
+        last name prefix, then the first name prefix plus the end of
+        the last name to catch misspelt starts of last names
+    """
+    return [
+        names['last'].str[:prefix],
+        names['first'].str[:prefix - 1] + '|' + names['last'].str[-(prefix - 1):]
+    ]
+
+
+def candidate_pairs(left, right, prefix=BLOCK_PREFIX):
+    """ (left, right) row positions of every pair sharing a blocking
+        key in some pass, each pair once
+    """
+    pairs = list()
+    for left_key, right_key in zip(block_keys(left, prefix), block_keys(right, prefix)):
+        pairs.append(
+            pd.DataFrame({'key': left_key.to_numpy(), 'left': np.arange(len(left))})
+            .loc[lambda x: x['key'].str.strip('|') != '']
+            .merge(pd.DataFrame({'key': right_key.to_numpy(), 'right': np.arange(len(right))}),
+                   on='key')
+        )
+    pairs = pd.concat(pairs, ignore_index=True)[['left', 'right']]
+    return pairs.drop_duplicates().reset_index(drop=True)
+
+
+def bigram_table(strings):
+    """ Sorted keys string * 65536 + bigram of the distinct bigrams of
+        each string, padded with a space at both ends, and the count
+        of distinct bigrams per string
+    """
+    padded = ' ' + strings + ' '
+    lengths = padded.str.len().to_numpy()
+    chars = np.frombuffer(''.join(padded).encode('ascii'), dtype=np.uint8).astype(np.int64)
+
+    # Every position but the last of each string starts a bigram
+    ends = np.cumsum(lengths)
+    starts = np.ones(len(chars), dtype=bool)
+    starts[ends - 1] = False
+    owner = np.repeat(np.arange(len(strings)), lengths)[starts]
+    grams = chars[:-1][starts[:-1]] * 256 + chars[1:][starts[:-1]]
+
+    keys = np.unique(owner * 65536 + grams)
+    counts = np.bincount(keys // 65536, minlength=len(strings))
+    return keys, counts
+
+
+def bigram_similarity(a, b):
+    """ Dice coefficient of the bigram sets of aligned series of
+        ascii strings, 1 for identical strings and 0 for nothing shared
+    """
+    codes, uniques = pd.factorize(pd.concat([a, b], ignore_index=True))
+    a_codes, b_codes = codes[:len(a)], codes[len(a):]
+    keys, counts = bigram_table(pd.Series(uniques, dtype=object))
+
+    # Bigrams of each pair's a string, looked up in the b string's set
+    offsets = np.searchsorted(keys, a_codes * 65536)
+    pair = np.repeat(np.arange(len(a)), counts[a_codes])
+    within = np.arange(len(pair)) - np.repeat(np.cumsum(counts[a_codes]) - counts[a_codes], counts[a_codes])
+    grams = keys[offsets[pair] + within] % 65536
+    wanted = b_codes[pair] * 65536 + grams
+    found = keys[np.minimum(np.searchsorted(keys, wanted), len(keys) - 1)] == wanted
+
+    shared = np.bincount(pair[found], minlength=len(a))
+    total = counts[a_codes] + counts[b_codes]
+    return 2. * shared / np.maximum(total, 1)
+
+
+def score_pairs(left, right, pairs, left_teams=None, right_teams=None):
+    """ Confidence of each candidate pair from the full, last and
+        first name similarities, raised when both teams are known and
+        agree and lowered when they differ
+    """
+    l_rows, r_rows = pairs['left'].to_numpy(), pairs['right'].to_numpy()
+    name = 0.
+    for weight, part in zip(NAME_WEIGHTS, ['full', 'last', 'first']):
+        name = name + weight * bigram_similarity(
+            left[part].iloc[l_rows].reset_index(drop=True),
+            right[part].iloc[r_rows].reset_index(drop=True)
+        )
+
+    team = np.full(len(pairs), 0.5)
+    if left_teams is not None and right_teams is not None:
+        l_team = left_teams.iloc[l_rows].to_numpy(dtype=object)
+        r_team = right_teams.iloc[r_rows].to_numpy(dtype=object)
+        known = pd.notnull(l_team) & pd.notnull(r_team)
+        team[known] = (l_team[known] == r_team[known]).astype(float)
+
+    return (1. - TEAM_WEIGHT) * name + TEAM_WEIGHT * team
+
+
+def resolve(left, right, left_team=None, right_team=None, min_confidence=MIN_CONFIDENCE):
+    """ Match the records of left to right by their name columns,
+        optionally helped by team columns holding the same team codes
+        on both sides, missing where unknown. A left record gets its
+        best scoring match unless that record is the better match of
+        another one. Returns (left, right) row positions with their
+        confidence and whether a runner up scored close
+    """
+    left_names = normalize_names(left['name'])
+    right_names = normalize_names(right['name'])
+    pairs = candidate_pairs(left_names, right_names)
+    pairs['confidence'] = score_pairs(
+        left_names, right_names, pairs,
+        left[left_team] if left_team else None,
+        right[right_team] if right_team else None
+    )
+
+    # Second best score of each record on either side
+    pairs = pairs.sort_values('confidence', ascending=False, kind='mergesort')
+    runner_up = 0.
+    for side in ['left', 'right']:
+        second = pairs[pairs.groupby(side).cumcount() == 1].set_index(side)['confidence']
+        runner_up = np.maximum(runner_up, pairs[side].map(second).fillna(0.).to_numpy())
+    pairs['ambiguous'] = pairs['confidence'].to_numpy() - runner_up < AMBIGUITY
+
+    # Best pair of each left record, kept if its right record has
+    # no better claim
+    pairs = pairs[pairs['confidence'] >= min_confidence]
+    pairs = pairs.drop_duplicates('left').drop_duplicates('right')
+    return pairs.sort_values('left').reset_index(drop=True)
@@ -0,0 +1,145 @@
+"""
+    This module contains a small job runner used to execute
+    independent (source, table) scrape jobs concurrently on a
+    bounded worker pool with per-source concurrency limits
+"""
+import time
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+
+class Job(object):
+    """ A single unit of scrape work, one table from one source.
+        The job calls func(**kwargs) when it is run
+    """
+
+    def __init__(self, source, table, func, **kwargs):
+        self.source = source
+        self.table = table
+        self.func = func
+        self.kwargs = kwargs
+
+        # Filled in by run_jobs
+        self.start = None
+        self.end = None
+        self.error = None
+        self.after = None
+
+    @property
+    def name(self):
+        """ Readable job name """
+        return '%s/%s' % (self.source, self.table)
+
+    @property
+    def elapsed(self):
+        """ Wall time of the job in seconds """
+        if self.start is None or self.end is None:
+            return 0.
+        return self.end - self.start
+
+    def run(self):
+        """ Execute the job, recording wall time and any error """
+        self.start = time.time()
+        try:
+            self.func(**self.kwargs)
+        except Exception as e:
+            logging.exception("Job %s failed", self.name)
+            self.error = e
+        finally:
+            self.end = time.time()
+        return self
+
+
+def run_jobs(jobs, max_workers=4, source_limits=None):
+    """ Run jobs on a pool of max_workers threads, never running
+        more than source_limits[source] jobs of one source at
+        once (default 1). Jobs of a source run in the given order.
+        Returns the list of jobs once all have finished, a job that
+        could not be run is returned with an error
+    """
+    source_limits = source_limits or dict()
+    for source, limit in source_limits.items():
+        if not isinstance(limit, int) or limit < 1:
+            raise Exception("Concurrency limit of source %s must be at least 1, got %r" % (source, limit))
+
+    # Queue up jobs per source, preserving order
+    pending = OrderedDict()
+    for job in jobs:
+        pending.setdefault(job.source, deque()).append(job)
+    running = dict((source, 0) for source in pending)
+
+    def ready():
+        """ Pop jobs whose source has a free slot, sources with
+            the most queued work first so the slowest source
+            starts as early as possible
+        """
+        sources = sorted(pending, key=lambda s: len(pending[s]), reverse=True)
+        for source in sources:
+            while pending[source] and running[source] < source_limits.get(source, 1):
+                running[source] += 1
+                yield pending[source].popleft()
+
+    tick = time.time()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = dict()
+        last = None
+        last_by_source = dict()
+        while True:
+            for job in ready():
+                if len(futures) >= max_workers:
+                    # No free worker, put it back for the next round
+                    running[job.source] -= 1
+                    pending[job.source].appendleft(job)
+                    break
+                # A job waits on its own source first, else on a free worker
+                job.after = last_by_source.get(job.source, last)
+                futures[pool.submit(job.run)] = job
+
+            if not futures:
+                break
+
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                job = futures.pop(future)
+                running[job.source] -= 1
+                last = last_by_source[job.source] = job
+
+    # Nothing left to wait on, any job still queued was never run
+    for source in pending:
+        for job in pending[source]:
+            logging.error("Job %s was never run", job.name)
+            job.error = Exception("Job %s was never run" % job.name)
+
+    report(jobs, time.time() - tick)
+    return jobs
+
+
+def critical_path(jobs):
+    """ Walk back from the last job to finish through the jobs
+        whose completion allowed each one to start
+    """
+    finished = [job for job in jobs if job.end is not None]
+    if not finished:
+        return []
+
+    path = [max(finished, key=lambda job: job.end)]
+    while path[-1].after is not None:
+        path.append(path[-1].after)
+    return path[::-1]
+
+
+def report(jobs, total):
+    """ Log per-job wall time and the critical path of the run """
+    logging.info("Run finished in %.1fs", total)
+
+    tick = min([job.start for job in jobs if job.start is not None] or [0])
+    for job in sorted(jobs, key=lambda job: job.start or 0):
+        logging.info("  %-40s start %7.1fs  wall %7.1fs%s",
+                     job.name, (job.start or tick) - tick, job.elapsed,
+                     '  FAILED' if job.error else '')
+
+    path = critical_path(jobs)
+    logging.info("Critical path (%.1fs): %s",
+                 sum(job.elapsed for job in path),
+                 ' -> '.join(job.name for job in path))
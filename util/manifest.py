@@ -0,0 +1,56 @@
+"""
+    This module tracks what an incremental output was built from. A
+    manifest stored next to the output's date partitions records a
+    fingerprint of the season-level inputs and the ETags of each
+    date's input partitions, so a run can tell which dates are new or
+    changed and when every stored date has to be rebuilt
+"""
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from util.partitions import partition_date, DATE_FORMAT
+
+MANIFEST_NAME = '_manifest.json'
+
+
+def fingerprint(df):
+    """ Digest of a dataframe's columns and values. Row hashes are
+        summed, so the digest does not depend on row order
+    """
+    columns = sorted(df.columns)
+    rows = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    digest = hashlib.sha1(','.join(columns).encode('utf-8'))
+    digest.update(np.array([len(rows), rows.sum(dtype=np.uint64)], dtype=np.uint64).tobytes())
+    return digest.hexdigest()
+
+
+def date_versions(objects, before=None):
+    """ Date -> table -> ETag of the partitions in a list_tables
+        result, for dates before the given YYYY-MM-DD date. None if a
+        table is not stored by date, so its dates can't be told apart
+    """
+    dates = dict()
+    for table, (_, keys) in objects.items():
+        for key, etag in keys:
+            day = partition_date(key)
+            if day is None:
+                return None
+            day = day.strftime(DATE_FORMAT)
+            if before is None or day < before:
+                dates.setdefault(day, dict())[table] = etag
+    return dates
+
+
+def plan_dates(manifest, inputs, dates):
+    """ (rebuild, build, stale) for a run: rebuild when there is no
+        manifest or its season-level inputs differ, the dates to build,
+        which are all of them on a rebuild and otherwise the new and
+        changed ones, and the built dates whose partitions are gone
+    """
+    built = manifest['dates'] if manifest else dict()
+    stale = sorted(set(built) - set(dates))
+    if manifest is None or manifest['inputs'] != inputs:
+        return True, sorted(dates), stale
+    return False, sorted(day for day in dates if built.get(day) != dates[day]), stale
@@ -0,0 +1,172 @@
+"""
+    This module collects structured per-stage metrics of a run: fetch,
+    parse and upload for the scrapers, and load, merge, clean and write
+    for flatten. A sample is a stage, a table and values: numbers like
+    seconds, bytes and rows, and text like the format, which becomes a
+    label. At the end of a run the samples are written as a JSON run
+    report and as a Prometheus textfile for node_exporter's textfile
+    collector, so a nightly job drifting slower or a merge suddenly
+    multiplying rows can be alerted on
+"""
+import os
+import re
+import json
+import time
+import logging
+import threading
+from contextlib import contextmanager
+
+# Prefix of every exported metric name
+PREFIX = 'mlb'
+
+
+def label_value(value):
+    """ Escape a Prometheus label value """
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def metric_name(*parts):
+    """ Prometheus metric name from parts, invalid characters as _ """
+    return re.sub(r'[^a-zA-Z0-9_]', '_', '_'.join(p for p in parts if p))
+
+
+class Metrics(object):
+    """ Thread safe list of per-stage samples for one run """
+
+    def __init__(self):
+        self.start = time.time()
+        self.samples = list()
+        self._lock = threading.Lock()
+
+    def record(self, stage, table=None, **values):
+        """ Add a sample of stage for table """
+        sample = dict(values, stage=stage, table=table)
+        with self._lock:
+            self.samples.append(sample)
+
+    @contextmanager
+    def timed(self, stage, table=None, **values):
+        """ Record the wall time of the block as a sample of stage.
+            The block can add values, like rows, to the yielded dict
+        """
+        values = dict(values)
+        tick = time.time()
+        try:
+            yield values
+        finally:
+            values['seconds'] = time.time() - tick
+            self.record(stage, table, **values)
+
+    def summary(self):
+        """ Samples summed per stage, table and text labels, with the
+            sample count, the slowest sample's seconds and the row
+            expansion of stages that record rows_in
+        """
+        with self._lock:
+            samples = list(self.samples)
+
+        groups = dict()
+        for sample in samples:
+            labels = dict((k, v) for k, v in sample.items()
+                          if isinstance(v, str) and k not in ('stage', 'table'))
+            key = (sample['stage'], sample['table'] or '', tuple(sorted(labels.items())))
+            group = groups.setdefault(key, {'count': 0})
+            group['count'] += 1
+            for k, v in sample.items():
+                if isinstance(v, (bool, int, float)) and not isinstance(v, str):
+                    group[k] = group.get(k, 0) + float(v)
+                    if k == 'seconds':
+                        group['seconds_max'] = max(group.get('seconds_max', 0.), float(v))
+
+        # Rows out per row in, how much a join multiplied or dropped rows
+        for group in groups.values():
+            if group.get('rows_in'):
+                group['expansion'] = group.get('rows', 0.) / group['rows_in']
+
+        return [
+            dict(values, stage=stage, table=table, labels=dict(labels))
+            for (stage, table, labels), values in sorted(groups.items())
+        ]
+
+    def report(self, run, **values):
+        """ JSON-able report of the run with the per-stage summary and
+            every sample
+        """
+        end = time.time()
+        with self._lock:
+            samples = list(self.samples)
+        return dict(values, run=run, start=self.start, end=end, seconds=end - self.start,
+                    stages=self.summary(), samples=samples)
+
+    def textfile(self, run, **values):
+        """ Prometheus text exposition of the summary, plus the run's
+            duration, end time and the given run level values
+        """
+        metrics = dict()
+        for group in self.summary():
+            labels = dict(group['labels'], run=run, table=group['table'])
+            for key, value in group.items():
+                if key in ('stage', 'table', 'labels'):
+                    continue
+                metrics.setdefault(metric_name(PREFIX, group['stage'], key), list()).append((labels, value))
+
+        end = time.time()
+        run_values = dict(values, run_seconds=end - self.start, run_end_timestamp_seconds=end)
+        for key, value in run_values.items():
+            metrics.setdefault(metric_name(PREFIX, key), list()).append(({'run': run}, float(value)))
+
+        lines = list()
+        for name in sorted(metrics):
+            lines.append('# TYPE %s gauge' % name)
+            for labels, value in metrics[name]:
+                lines.append('%s{%s} %r' % (name, ','.join(
+                    '%s="%s"' % (k, label_value(v)) for k, v in sorted(labels.items())), value))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, directory, run, **values):
+        """ Write <run>.json and <run>.prom to directory, each replaced
+            atomically so a collector never reads half a file
+        """
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        outputs = [
+            ('%s.json' % run, json.dumps(self.report(run, **values), indent=1, sort_keys=True)),
+            ('%s.prom' % run, self.textfile(run, **values))
+        ]
+        for name, text in outputs:
+            path = os.path.join(directory, name)
+            with open(path + '.tmp', 'w') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+        logging.info("Wrote %s metrics to %s", run, directory)
+
+
+# Collector shared by everything in the process
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+def shared_metrics():
+    """ Return the process wide metrics collector """
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            _SHARED = Metrics()
+        return _SHARED
+
+
+def record_jobs(metrics, jobs):
+    """ Record the wall time and outcome of finished scrape jobs """
+    for job in jobs:
+        metrics.record('job', job.table, source=job.source, seconds=job.elapsed,
+                       failed=int(job.error is not None))
+
+
+def write_metrics(cfg, run, **values):
+    """ Write the shared collector's run report and textfile to the
+        directory in the metrics section of the config, if enabled
+    """
+    settings = cfg.get('metrics') or dict()
+    if not settings.get('enabled'):
+        return
+    directory = settings.get('directory') or os.path.join(cfg['tmp_dir'], 'metrics')
+    shared_metrics().write(directory, run, **values)
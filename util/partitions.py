@@ -0,0 +1,74 @@
+"""
+    This module contains the date partition layout of the game log
+    tables. A partitioned table is stored as one object per game date
+    under data/<table>/<column>=YYYY-MM-DD/, so a run only has to
+    fetch and upload the dates after the newest stored partition
+"""
+import re
+from datetime import date, datetime, timedelta
+
+PARTITION = re.compile(r'/(\w+)=(\d{4}-\d{2}-\d{2})/')
+DATE_FORMAT = '%Y-%m-%d'
+
+
+def partition_name(column, day):
+    """ Directory name of one date partition """
+    return '%s=%s' % (column, day.strftime(DATE_FORMAT))
+
+
+def partition_date(key):
+    """ Date of the partition an object key is stored under,
+        None for keys outside a partition
+    """
+    match = PARTITION.search(key)
+    if match is None:
+        return None
+    return datetime.strptime(match.group(2), DATE_FORMAT).date()
+
+
+def to_date(value):
+    """ Date from a tables.yml value, yaml already parses ISO dates """
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(str(value), DATE_FORMAT).date()
+
+
+def fetch_window(spec, last=None, today=None):
+    """ (start, end) dates to fetch for a partition spec. Starts
+        from the newest stored partition if there is one, which is
+        fetched again as it may hold a partial day, else from the
+        spec's start. Never asks for dates after today
+    """
+    today = today or date.today()
+    start = to_date(spec['start']) if spec.get('start') else None
+    if last is not None:
+        start = last
+    end = min(to_date(spec['end']), today) if spec.get('end') else today
+    return start, end
+
+
+
+def template_dates(url, start, end, table_name=None):
+    """ Fill the {start_date} and {end_date} placeholders of a url.
+        A url with {start_date} needs a start, a table with no stored
+        partition gets it from the start of its partition spec
+    """
+    if start is None:
+        if '{start_date}' in url:
+            raise Exception("%s has no stored partitions and no partition start in tables.yml "
+                            "to fill {start_date} with" % (table_name or url))
+    else:
+        url = url.replace('{start_date}', start.strftime(DATE_FORMAT))
+    return url.replace('{end_date}', end.strftime(DATE_FORMAT))
+
+
+def split_dates(start, end, days):
+    """ Split start..end into consecutive (start, end) ranges of at
+        most days days each
+    """
+    chunks = list()
+    while start <= end:
+        stop = min(start + timedelta(days=days - 1), end)
+        chunks.append((start, stop))
+        start = stop + timedelta(days=1)
+    return chunks
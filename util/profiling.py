@@ -0,0 +1,197 @@
+"""
+    Profiling mode of main.py and flatten.py. With --profile every
+    section of a run, a scrape job or a phase of flatten_batters, gets
+    its own cProfile stats and a tracemalloc snapshot, written under
+    tmp_dir/profile/<run>-<time>/ as <section>.prof, loadable with
+    pstats.Stats, and <section>.tracemalloc, loadable with
+    tracemalloc.Snapshot.load. summary.json lists each section's time,
+    peak traced memory and hottest functions. Without --profile the
+    sections do nothing
+"""
+import os
+import re
+import json
+import time
+import pstats
+import cProfile
+import logging
+import tracemalloc
+from contextlib import contextmanager
+
+# Frames kept per traced allocation, and hot spots listed per section
+FRAMES = 5
+TOP = 10
+
+
+class Profiler(object):
+    """ CPU and allocation profiles of named sections of a run. A
+        section begun inside another pauses the outer one, so each
+        profile covers only its own code. Sections are begun and ended
+        on the thread they profile, one at a time
+    """
+
+    def __init__(self, directory, top=TOP):
+        self.directory = directory
+        self.top = top
+        self.sections = list()
+        self._names = set()
+        self._stack = list()
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        tracemalloc.start(FRAMES)
+
+    def _filename(self, name):
+        """ File safe name of a section, numbered if already used """
+        base = re.sub(r'[^a-zA-Z0-9_.-]', '.', name)
+        filename, i = base, 1
+        while filename in self._names:
+            i += 1
+            filename = '%s.%d' % (base, i)
+        self._names.add(filename)
+        return filename
+
+    def begin(self, name):
+        """ Start profiling a section, pausing the one it is inside """
+        if self._stack:
+            outer = self._stack[-1]
+            outer['profile'].disable()
+            outer['peak'] = max(outer['peak'], tracemalloc.get_traced_memory()[1])
+
+        section = {'name': name, 'profile': cProfile.Profile(), 'peak': 0,
+                   'nested': 0., 'start': time.perf_counter()}
+        self._stack.append(section)
+        tracemalloc.reset_peak()
+        section['profile'].enable()
+
+    def end(self):
+        """ Stop the innermost section, write its artifacts and resume
+            the section it was inside
+        """
+        section = self._stack.pop()
+        section['profile'].disable()
+        total = time.perf_counter() - section['start']
+        peak = max(section['peak'], tracemalloc.get_traced_memory()[1])
+        snapshot = tracemalloc.take_snapshot()
+
+        filename = self._filename(section['name'])
+        prof_path = os.path.join(self.directory, filename + '.prof')
+        section['profile'].dump_stats(prof_path)
+        snapshot.dump(os.path.join(self.directory, filename + '.tracemalloc'))
+
+        summary = {
+            'section': section['name'],
+            'file': filename,
+            'seconds': total - section['nested'],
+            'peak_mb': peak / 1024. / 1024.,
+            'hot_spots': self.hot_spots(prof_path)
+        }
+        self.sections.append(summary)
+        logging.info("Profiled %s: %.2fs, peak %.1f MB", section['name'],
+                     summary['seconds'], summary['peak_mb'])
+
+        if self._stack:
+            outer = self._stack[-1]
+            outer['nested'] += total
+            tracemalloc.reset_peak()
+            outer['profile'].enable()
+
+    @contextmanager
+    def section(self, name):
+        """ Profile the block as a section """
+        self.begin(name)
+        try:
+            yield
+        finally:
+            self.end()
+
+    def hot_spots(self, path):
+        """ Functions with the most time spent in their own code """
+        stats = pstats.Stats(path)
+        rows = sorted(stats.stats.items(), key=lambda item: item[1][2], reverse=True)
+        return [
+            {'function': '%s:%d(%s)' % func, 'calls': calls, 'tottime': tottime, 'cumtime': cumtime}
+            for func, (_, calls, tottime, cumtime, _) in rows[:self.top]
+        ]
+
+    def close(self):
+        """ End any open sections, write summary.json and log each
+            section's hottest function
+        """
+        while self._stack:
+            self.end()
+        tracemalloc.stop()
+
+        with open(os.path.join(self.directory, 'summary.json'), 'w') as f:
+            json.dump(self.sections, f, indent=1)
+
+        for summary in sorted(self.sections, key=lambda x: x['seconds'], reverse=True):
+            hottest = summary['hot_spots'][0] if summary['hot_spots'] else None
+            logging.info("  %s: %.2fs, peak %.1f MB%s", summary['section'], summary['seconds'],
+                         summary['peak_mb'], ', hottest %s %.2fs' % (
+                             hottest['function'], hottest['tottime']) if hottest else '')
+        logging.info("Profiles written to %s", self.directory)
+
+
+# Profiler of the run, None unless profiling
+_ACTIVE = None
+
+def start_profiling(cfg, run):
+    """ Profile the sections of this run under tmp_dir/profile """
+    global _ACTIVE
+    directory = os.path.join(cfg['tmp_dir'], 'profile', '%s-%s' % (run, time.strftime('%Y%m%d-%H%M%S')))
+    _ACTIVE = Profiler(directory)
+    return _ACTIVE
+
+
+def stop_profiling():
+    """ Finish the run's profiles, if profiling """
+    global _ACTIVE
+    if _ACTIVE is not None:
+        _ACTIVE.close()
+        _ACTIVE = None
+
+
+@contextmanager
+def profiled(name):
+    """ Profile the block as a section, if profiling """
+    if _ACTIVE is None:
+        yield
+        return
+    with _ACTIVE.section(name):
+        yield
+
+
+class Phases(object):
+    """ Consecutive profiled phases of a function, named
+        <prefix>.<phase>. Starting a phase ends the one before
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.profiler = None
+
+    def start(self, name):
+        """ End the current phase and begin the next, if profiling """
+        self.stop()
+        if _ACTIVE is not None:
+            self.profiler = _ACTIVE
+            self.profiler.begin('%s.%s' % (self.prefix, name))
+
+    def stop(self):
+        """ End the current phase """
+        if self.profiler is not None:
+            self.profiler.end()
+            self.profiler = None
+
+
+def profile_jobs(jobs):
+    """ Wrap each job's function in a section named after the job """
+    def wrap(func, name):
+        def run(**kwargs):
+            with profiled(name):
+                return func(**kwargs)
+        return run
+
+    for job in jobs:
+        job.func = wrap(job.func, job.name)
+    return jobs
@@ -0,0 +1,163 @@
+"""
+    This module derives column types for the scraped tables from the
+    column names in tables.yml, so they can be stored in a typed
+    columnar format instead of re-inferred from CSV text on every load.
+    It also derives the dtype plan tables are loaded with: few-valued
+    text as categoricals and numbers downcast
+"""
+import logging
+
+import pandas as pd
+
+# Columns that are always text, even when every value looks numeric
+TEXT_COLUMNS = {
+    'name', 'name_first_last', 'name_last_first', 'team', 'oppt', 'h_a', 'hand',
+    'bats', 'throws', 'p_h', 'pos', 'dk_pos', 'fd_pos', 'dd_pos', 'yh_pos',
+    'home_ump', 'w_condition', 'w_dir', 'w_l_s', 'oppt_hand', 'oppt_pitch_hand',
+    'oppt_pitch_name', 'player_type', 'game_title', 'fg_id'
+}
+
+# Text columns with few distinct values, loaded as categoricals
+CATEGORY_COLUMNS = {
+    'team', 'oppt', 'h_a', 'hand', 'bats', 'throws', 'p_h', 'pos', 'dk_pos', 'fd_pos',
+    'dd_pos', 'yh_pos', 'home_ump', 'w_condition', 'w_dir', 'w_l_s', 'oppt_hand',
+    'oppt_pitch_hand', 'player_type', 'side', 'team_guru', 'team_park', 'team_weather'
+}
+
+# Other text columns become categoricals when at most this share of
+# their values are distinct
+CATEGORY_RATIO = 0.5
+
+# Suffixes of columns holding percentages, stored as "12.5 %" by fangraphs
+PERCENT_SUFFIXES = ('_perc', '_percent', 'percent')
+
+
+def column_type(name):
+    """ Storage type for a column name: text, float or auto, where
+        auto is numeric if every value parses and text otherwise
+    """
+    if name in TEXT_COLUMNS:
+        return 'text'
+    if name.endswith(PERCENT_SUFFIXES):
+        return 'float'
+    return 'auto'
+
+
+def table_schema(column_list):
+    """ Column name -> storage type for a tables.yml columns list """
+    return dict((col, column_type(col)) for col in column_list)
+
+
+def to_text(arr):
+    """ Cast values to str, keeping missing values missing """
+    return arr.where(arr.isnull(), arr.astype(str)).astype(object)
+
+
+def to_number(arr):
+    """ Parse numbers, dropping % signs and padding """
+    if pd.api.types.is_numeric_dtype(arr):
+        return arr
+    return pd.to_numeric(
+        arr.astype(str).str.replace('%', '', regex=False).str.strip(),
+        errors='coerce'
+    )
+
+
+def apply_schema(df, schema=None):
+    """ Return a copy of df with every column cast to its storage type """
+    schema = schema or table_schema(df.columns)
+    df = df.copy()
+    for col in df.columns:
+        kind = schema.get(col, 'auto')
+        if kind == 'text':
+            df[col] = to_text(df[col])
+        elif kind == 'float':
+            df[col] = to_number(df[col]).astype(float)
+        else:
+            numbers = to_number(df[col])
+            if numbers.notnull().sum() == df[col].notnull().sum():
+                df[col] = numbers
+            else:
+                df[col] = to_text(df[col])
+    return df
+
+
+def dtype_plan(column_list):
+    """ Column name -> load dtype for a tables.yml columns list:
+        category, text, float or auto for downcast numbers
+    """
+    plan = dict()
+    for col in column_list:
+        if col in CATEGORY_COLUMNS:
+            plan[col] = 'category'
+        else:
+            plan[col] = column_type(col)
+    return plan
+
+
+def table_plans(table_cfg, cfg):
+    """ Table name -> dtype plan for every table with columns in
+        tables.yml, with the per-table overrides of the config's
+        dtypes section applied on top
+    """
+    plans = dict()
+    for tables in table_cfg.values():
+        for table, info in tables.items():
+            if info.get('columns'):
+                plans[table] = dtype_plan(info['columns'])
+    overrides = (cfg.get('dtypes') or dict()).get('tables') or dict()
+    for table, columns in overrides.items():
+        plans.setdefault(table, dict()).update(columns)
+    return plans
+
+
+def downcast(arr, float_dtype='float64'):
+    """ Smallest integer type that holds an integer column, floats
+        as float_dtype
+    """
+    if pd.api.types.is_bool_dtype(arr):
+        return arr
+    if pd.api.types.is_integer_dtype(arr):
+        return pd.to_numeric(arr, downcast='integer')
+    if pd.api.types.is_float_dtype(arr):
+        return arr.astype(float_dtype)
+    return arr
+
+
+def apply_plan(df, plan=None, float_dtype='float64'):
+    """ Return df with the plan's dtypes. Columns without an entry
+        are auto: numbers are downcast and text with few distinct
+        values becomes categorical
+    """
+    plan = plan or dict()
+    columns = dict()
+    for col in df.columns:
+        arr = df[col]
+        kind = plan.get(col, 'auto')
+        if kind in ('text', 'float'):
+            # Stored type is kept, floats still honour float_dtype
+            columns[col] = downcast(arr, float_dtype) if kind == 'float' else arr
+        elif kind == 'category' or (
+                kind == 'auto' and not pd.api.types.is_numeric_dtype(arr)
+                and arr.nunique() <= CATEGORY_RATIO * len(arr)):
+            columns[col] = arr.astype('category')
+        elif kind == 'auto':
+            columns[col] = downcast(arr, float_dtype)
+        else:
+            columns[col] = arr.astype(kind)
+    return pd.DataFrame(columns, index=df.index)
+
+
+def memory_mb(df):
+    """ Deep memory use of a dataframe in MB """
+    return df.memory_usage(deep=True).sum() / 1024. / 1024.
+
+
+def memory_report(label, before, after=None):
+    """ Log the memory a table takes, and what the plan saved """
+    if after is None:
+        logging.info("  %s: %.1f MB, %d rows", label, memory_mb(before), before.shape[0])
+        return
+    old, new = memory_mb(before), memory_mb(after)
+    logging.info("  %s: %.1f MB -> %.1f MB (%.0f%%), %d rows",
+                 label, old, new, 100. * new / old if old else 100., after.shape[0])
@@ -0,0 +1,211 @@
+"""
+    This module contains the storage backends tables are written to
+    and read from. Both use the same keys, like data/<table>/<table>.csv,
+    so the scrapers, fetch and flatten don't know which one they run
+    against: S3, or a local directory for dev runs and benchmarks that
+    shouldn't need the network or AWS credentials. The backend is set
+    by storage.backend in the config
+"""
+import os
+import abc
+import shutil
+import threading
+from io import BytesIO
+
+# Leading bytes of the CSV compressions, local files have no
+# Content-Encoding to say how they were written
+MAGIC = [(b'\x1f\x8b', 'gzip'), (b'\x28\xb5\x2f\xfd', 'zstd')]
+
+
+class Storage(object):
+    """ Abstract class for a bucket of objects addressed by key,
+        name identifies the bucket in caches
+    """
+    __metaclass__ = abc.ABCMeta
+    name = None
+
+    @abc.abstractmethod
+    def url(self, key):
+        """ Full name of a key, for logs and cache keys """
+        pass
+
+    @abc.abstractmethod
+    def list(self, prefix):
+        """ (key, etag) of every object under prefix """
+        pass
+
+    @abc.abstractmethod
+    def list_dirs(self, prefix):
+        """ Prefixes of the directories directly under prefix, each
+            ending in /
+        """
+        pass
+
+    @abc.abstractmethod
+    def etag(self, key):
+        """ ETag of an object, None if there is no such object """
+        pass
+
+    @abc.abstractmethod
+    def get(self, key):
+        """ (body, content encoding) of an object, None if there is no
+            such object
+        """
+        pass
+
+    @abc.abstractmethod
+    def upload(self, fileobj, key, extra_args=None):
+        """ Store the contents of a binary file object under key, with
+            S3 style ExtraArgs like ContentType and ContentEncoding
+        """
+        pass
+
+    def put(self, key, body, content_type=None):
+        """ Store bytes under key """
+        extra_args = {'ContentType': content_type} if content_type else None
+        self.upload(BytesIO(body), key, extra_args)
+
+    @abc.abstractmethod
+    def delete(self, keys):
+        """ Delete objects by key """
+        pass
+
+
+class S3Storage(Storage):
+    """ Objects in an S3 bucket. Clients are thread safe, unlike
+        resources, so one is shared by the worker threads
+    """
+
+    def __init__(self, bucket):
+        import boto3
+        self.bucket = self.name = bucket
+        self.client = boto3.session.Session().client('s3')
+
+    def url(self, key):
+        return 's3://%s/%s' % (self.bucket, key)
+
+    def list(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                yield obj['Key'], obj['ETag']
+
+    def list_dirs(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        dirs = list()
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix, Delimiter='/'):
+            dirs.extend(common['Prefix'] for common in page.get('CommonPrefixes', []))
+        return dirs
+
+    def etag(self, key):
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)['ETag']
+        except self.client.exceptions.ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey'):
+                return None
+            raise
+
+    def get(self, key):
+        try:
+            obj = self.client.get_object(Bucket=self.bucket, Key=key)
+        except self.client.exceptions.NoSuchKey:
+            return None
+        return obj['Body'].read(), obj.get('ContentEncoding')
+
+    def upload(self, fileobj, key, extra_args=None):
+        # Multipart for large bodies
+        self.client.upload_fileobj(fileobj, self.bucket, key, ExtraArgs=extra_args or {})
+
+    def delete(self, keys):
+        # At most 1000 keys per request
+        keys = list(keys)
+        for i in range(0, len(keys), 1000):
+            self.client.delete_objects(Bucket=self.bucket, Delete={
+                'Objects': [{'Key': key} for key in keys[i:i + 1000]]
+            })
+
+
+class LocalStorage(Storage):
+    """ Objects as files under a directory, one per key. The ETag is
+        the file's size and modification time, which changes whenever
+        the object is written, and writes are atomic renames
+    """
+
+    def __init__(self, directory):
+        self.directory = self.name = directory
+
+    def _path(self, key):
+        return os.path.join(self.directory, *key.split('/'))
+
+    def url(self, key):
+        return self._path(key)
+
+    def list(self, prefix):
+        # Walk the deepest directory the prefix names, then filter
+        base = prefix.rsplit('/', 1)[0] if '/' in prefix else ''
+        found = list()
+        for root, dirs, files in os.walk(self._path(base) if base else self.directory):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                key = os.path.relpath(os.path.join(root, name), self.directory).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    found.append(key)
+        for key in sorted(found):
+            etag = self.etag(key)
+            if etag is not None:
+                yield key, etag
+
+    def list_dirs(self, prefix):
+        path = self._path(prefix)
+        if not os.path.isdir(path):
+            return []
+        return sorted(prefix + name + '/' for name in os.listdir(path)
+                      if os.path.isdir(os.path.join(path, name)))
+
+    def etag(self, key):
+        try:
+            stat = os.stat(self._path(key))
+        except OSError:
+            return None
+        return '"%x-%x"' % (stat.st_size, stat.st_mtime_ns)
+
+    def get(self, key):
+        try:
+            with open(self._path(key), 'rb') as f:
+                body = f.read()
+        except (IOError, OSError):
+            return None
+        for magic, encoding in MAGIC:
+            if body.startswith(magic):
+                return body, encoding
+        return body, None
+
+    def upload(self, fileobj, key, extra_args=None):
+        path = self._path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '%s.%d.tmp' % (path, threading.get_ident())
+        with open(tmp, 'wb') as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(tmp, path)
+
+    def delete(self, keys):
+        for key in keys:
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+
+def get_storage(cfg):
+    """ Storage backend from the config: the s3 bucket, or with
+        backend local the same bucket name under storage.directory
+    """
+    settings = cfg.get('storage') or dict()
+    backend = settings.get('backend', 's3')
+    if backend == 's3':
+        return S3Storage(cfg['s3']['bucket'])
+    if backend == 'local':
+        return LocalStorage(os.path.join(settings['directory'], cfg['s3']['bucket']))
+    raise Exception("Unknown storage backend %s" % backend)
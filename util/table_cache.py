@@ -0,0 +1,147 @@
+"""
+    This module contains a local read-through cache for tables stored
+    in S3. Parsed tables are kept under tmp_dir keyed by bucket, key
+    and ETag in Arrow's Feather format, which loads with memory mapping
+    and column projection. The cache is capped by size, evicting the
+    least recently used tables first
+"""
+import os
+import pickle
+import hashlib
+import logging
+import threading
+
+try:
+    import pyarrow.feather as feather
+except ImportError:
+    feather = None
+
+
+def remove_quietly(path):
+    """ Remove a file another thread may have removed already """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class TableCache(object):
+    """ Directory of parsed tables, one file per (bucket, key, etag) """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.ext = '.feather' if feather is not None else '.pkl'
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, bucket, key, etag):
+        name = hashlib.sha1(('%s/%s/%s' % (bucket, key, etag)).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, name + self.ext)
+
+    def get(self, bucket, key, etag, columns=None):
+        """ Return the cached table, projected to columns if given,
+            or None on a miss
+        """
+        path = self._path(bucket, key, etag)
+        if not os.path.exists(path):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        try:
+            df = self._read(path, columns)
+        except FileNotFoundError:
+            # Evicted since the check above
+            with self._lock:
+                self.misses += 1
+            return None
+        except Exception:
+            logging.warning("Dropping unreadable cached table %s", path)
+            remove_quietly(path)
+            with self._lock:
+                self.misses += 1
+            return None
+
+        # Touch for LRU ordering, unless it was just evicted
+        try:
+            os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        with self._lock:
+            self.hits += 1
+        return df
+
+    def _read(self, path, columns):
+        if feather is None:
+            with open(path, 'rb') as f:
+                df = pickle.load(f)
+            if columns is not None:
+                wanted = set(columns)
+                df = df[[col for col in df.columns if col in wanted]]
+            return df
+
+        if columns is not None:
+            wanted = set(columns)
+            names = feather.read_table(path, memory_map=True).column_names
+            columns = [col for col in names if col in wanted]
+        return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+    def put(self, bucket, key, etag, df):
+        """ Store a parsed table, then evict down to the size cap """
+        path = self._path(bucket, key, etag)
+        tmp = '%s.%d.tmp' % (path, threading.get_ident())
+        try:
+            if feather is None:
+                with open(tmp, 'wb') as f:
+                    pickle.dump(df, f, pickle.HIGHEST_PROTOCOL)
+            else:
+                feather.write_feather(df.reset_index(drop=True), tmp, compression='uncompressed')
+            os.replace(tmp, path)
+        except Exception:
+            logging.warning("Could not cache %s/%s", bucket, key, exc_info=True)
+            remove_quietly(tmp)
+            return
+        self.evict()
+
+    def evict(self):
+        """ Remove least recently used tables until under max_bytes.
+            get runs on other threads and drops unreadable files, so a
+            listed file can be gone by the time it is looked at
+        """
+        with self._lock:
+            files = list()
+            for name in os.listdir(self.directory):
+                if not name.endswith(self.ext):
+                    continue
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append((stat.st_mtime, stat.st_size, path))
+            files.sort()
+            total = sum(size for _, size, _ in files)
+            for _, size, path in files:
+                if total <= self.max_bytes:
+                    break
+                remove_quietly(path)
+                total -= size
+
+    def summary(self):
+        """ Log hit/miss counts """
+        logging.info("Table cache: %d hits, %d misses", self.hits, self.misses)
+
+
+def table_cache(cfg):
+    """ Build the table cache from the config, None if disabled """
+    settings = cfg.get('table_cache') or dict()
+    if not settings.get('enabled'):
+        return None
+    return TableCache(
+        os.path.join(cfg['tmp_dir'], 'table_cache'),
+        int(settings.get('max_mb', 1024)) * 1024 * 1024
+    )
@@ -0,0 +1,61 @@
+"""
+    This module contains a per-host politeness scheduler so that
+    requests to the same website are spaced out by a configured
+    minimum interval, while requests to other hosts never wait
+"""
+import time
+import logging
+import threading
+from urllib.parse import urlparse
+
+
+class HostThrottle(object):
+    """ Minimum interval rate limiter keyed by host name. Each call
+        to wait reserves the next free slot for the host, so threads
+        sharing a host queue up behind each other in order
+    """
+
+    def __init__(self, intervals=None, default=0.):
+        self.intervals = intervals or dict()
+        self.default = default
+        self._lock = threading.Lock()
+        self._next_slot = dict()
+
+    def interval(self, host):
+        """ Configured minimum seconds between requests to host """
+        return float(self.intervals.get(host, self.default))
+
+    def wait(self, url):
+        """ Block until a request to url's host is allowed, returns
+            the number of seconds slept
+        """
+        host = urlparse(url).hostname
+        with self._lock:
+            now = time.time()
+            slot = max(now, self._next_slot.get(host, 0.))
+            self._next_slot[host] = slot + self.interval(host)
+
+        delay = slot - now
+        if delay > 0:
+            logging.info("Waiting %.1fs for %s", delay, host)
+            time.sleep(delay)
+        return delay
+
+
+# Throttle shared by every scraper in the process
+_SHARED = None
+_SHARED_LOCK = threading.Lock()
+
+def shared_throttle(cfg):
+    """ Return the process wide throttle, built from the politeness
+        section of the config on first use
+    """
+    global _SHARED
+    with _SHARED_LOCK:
+        if _SHARED is None:
+            politeness = cfg.get('politeness') or dict()
+            _SHARED = HostThrottle(
+                intervals=politeness.get('hosts'),
+                default=politeness.get('default', 0.)
+            )
+        return _SHARED